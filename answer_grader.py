@@ -0,0 +1,497 @@
+"""
+Correction locale instantanée des réponses saisies au clavier
+Compare le tableau d'effectifs, les fréquences ou la moyenne de l'élève à la
+solution recalculée depuis les données de l'exercice, avec des types d'erreurs
+structurés; Gemini ne sert, au plus, qu'à rédiger un court commentaire
+"""
+
+import re
+import time
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from exercise_verifier import (
+    DECIMAL_TOLERANCE,
+    MEAN_TOLERANCE,
+    PERCENT_TOLERANCE,
+    count_effectifs,
+    frequency_matches,
+    median,
+    normalize_keys,
+    normalize_table,
+    numeric_series,
+    parse_number,
+    series_key,
+    value_range,
+    weighted_mean,
+)
+from prompt_templates import ANSWER_FEEDBACK_PROMPT
+
+# Types d'erreurs: (message pour l'élève, conseil)
+ERROR_TYPES: Dict[str, Tuple[str, str]] = {
+    "reponse_manquante": (
+        "Une partie de la réponse est manquante",
+        "Réponds à toutes les questions, même si tu n'es pas sûr(e)",
+    ),
+    "reponse_illisible": (
+        "Réponse dans un format non reconnu",
+        "Écris un nombre par case, et une ligne « valeur: effectif » par valeur",
+    ),
+    "valeur_oubliee": (
+        "Une valeur de la série manque dans le tableau",
+        "Parcours la liste et coche chaque valeur au fur et à mesure",
+    ),
+    "valeur_en_trop": (
+        "Le tableau contient une valeur absente de la série",
+        "Vérifie que chaque valeur du tableau apparaît bien dans les données",
+    ),
+    "effectif_faux": (
+        "Erreur de comptage d'un effectif",
+        "Compte chaque valeur une par une et vérifie que la somme des effectifs fait le total",
+    ),
+    "total_faux": (
+        "Effectif total incorrect",
+        "L'effectif total est le nombre de données (la somme des effectifs)",
+    ),
+    "frequence_fausse": (
+        "Fréquence incorrecte",
+        "Fréquence = effectif de la valeur / effectif total",
+    ),
+    "frequence_inversee": (
+        "Fréquence calculée à l'envers (total / effectif)",
+        "On divise l'effectif de la valeur par l'effectif total, pas l'inverse",
+    ),
+    "format_frequence": (
+        "Fréquence juste mais dans le mauvais format",
+        "Relis le format demandé: décimal, fraction ou pourcentage (× 100)",
+    ),
+    "moyenne_division_nombre_valeurs": (
+        "Division par le nombre de valeurs au lieu de l'effectif total",
+        "Dans une moyenne pondérée, on divise par la somme des effectifs",
+    ),
+    "moyenne_non_ponderee": (
+        "Moyenne calculée sans tenir compte des effectifs",
+        "Multiplie chaque valeur par son effectif avant d'additionner",
+    ),
+    "division_oubliee": (
+        "Somme des produits non divisée par l'effectif total",
+        "Termine le calcul: divise la somme des produits par l'effectif total",
+    ),
+    "arrondi": (
+        "Résultat mal arrondi",
+        "Arrondis au centième: regarde le chiffre des millièmes",
+    ),
+    "moyenne_fausse": (
+        "Moyenne incorrecte",
+        "Moyenne = (Σ valeur × effectif) / effectif total",
+    ),
+    "mediane_non_triee": (
+        "Médiane prise sans ranger les valeurs dans l'ordre",
+        "Range d'abord les valeurs dans l'ordre croissant",
+    ),
+    "mediane_fausse": (
+        "Médiane incorrecte",
+        "La médiane partage la série rangée en deux groupes de même effectif",
+    ),
+    "etendue_fausse": (
+        "Étendue incorrecte",
+        "Étendue = plus grande valeur − plus petite valeur",
+    ),
+    "reponse_fausse": (
+        "Réponse incorrecte",
+        "Reprends le calcul étape par étape",
+    ),
+}
+
+# Champs de réponse: intitulé affiché à l'élève
+FIELD_LABELS: Dict[str, str] = {
+    "effectifs": "Tableau d'effectifs (une ligne « valeur: effectif » par valeur)",
+    "total": "Effectif total",
+    "frequences": "Fréquences (une ligne « valeur: fréquence » par valeur)",
+    "moyenne": "Moyenne",
+    "mediane": "Médiane",
+    "etendue": "Étendue",
+    "valeur_frequente": "Valeur la plus fréquente",
+    "moins_que_seuil": "Effectif du groupe « moins que le seuil »",
+    "seuil_et_plus": "Effectif du groupe « seuil ou plus »",
+    "pct_moins_que_seuil": "Pourcentage du groupe « moins que le seuil »",
+    "pct_seuil_et_plus": "Pourcentage du groupe « seuil ou plus »",
+}
+
+# Champs saisis sous forme de tableau
+TABLE_FIELDS = ("effectifs", "frequences")
+
+_TABLE_SEPARATOR_RE = re.compile(r"\s*(?::|=|->|→|\t)\s*")
+_ENTRY_SEPARATOR_RE = re.compile(r"[\n;]+")
+
+
+def parse_table(answer: Any) -> Optional[Dict[Any, Any]]:
+    """
+    Tableau saisi par l'élève: dict, ou texte « valeur: nombre » (une entrée par
+    ligne ou séparées par « ; »), clés canoniques (None si illisible)
+    """
+    if isinstance(answer, dict):
+        return normalize_keys(answer)
+    if not isinstance(answer, str):
+        return None
+
+    table = {}
+    for entry in _ENTRY_SEPARATOR_RE.split(answer):
+        if not entry.strip():
+            continue
+        parts = _TABLE_SEPARATOR_RE.split(entry.strip(), maxsplit=1)
+        if len(parts) != 2 or not parts[0] or not parts[1]:
+            return None
+        table[series_key(parts[0])] = parts[1]
+    return table or None
+
+
+def solution_for(exercise: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Solution recalculée depuis les données de l'exercice (moteur local ou Gemini)
+
+    Returns:
+        Dictionnaire avec les champs demandés ("asked") et leurs valeurs exactes
+
+    Raises:
+        ValueError: Si l'exercice n'a pas de données exploitables
+    """
+    exercise_type = exercise.get("type")
+    data = exercise.get("exercise_data") or {}
+    expected = data.get("expected_answer") if isinstance(data.get("expected_answer"), dict) else {}
+    solution: Dict[str, Any] = {"type": exercise_type}
+
+    if exercise_type == "effectif":
+        values = data.get("values") or data.get("data")
+        if not isinstance(values, list) or not values:
+            raise ValueError("Exercice sans liste de valeurs")
+        solution["effectifs"] = count_effectifs(values)
+        solution["total"] = len(values)
+        solution["asked"] = ["effectifs", "total"]
+        return solution
+
+    if exercise_type == "frequence":
+        table = normalize_table(data.get("effectifs") or data.get("data"))
+        if not table or sum(table.values()) <= 0:
+            raise ValueError("Exercice sans tableau d'effectifs")
+        total = int(sum(table.values()))
+        solution["frequences"] = {key: Fraction(int(n), total) for key, n in table.items()}
+        solution["effectifs"] = {key: int(n) for key, n in table.items()}
+        solution["total"] = total
+        solution["format"] = data.get("format") or expected.get("format") or "decimal"
+        solution["asked"] = ["frequences"]
+        return solution
+
+    if exercise_type == "moyenne":
+        series = numeric_series(normalize_table(data.get("data")) or {})
+        if series is None:
+            raise ValueError("Exercice sans série numérique")
+        _add_series(solution, *series)
+        solution["asked"] = ["moyenne"]
+        return solution
+
+    if exercise_type == "probleme":
+        raw = data.get("data")
+        table = normalize_table(raw)
+        if table is None and isinstance(raw, list):
+            table = count_effectifs(raw)
+            solution["raw"] = [parse_number(value) for value in raw]
+        series = numeric_series(table or {})
+        if series is None:
+            raise ValueError("Problème sans données numériques")
+        _add_series(solution, *series)
+
+        engine_expected = data.get("expected")
+        if isinstance(engine_expected, dict):
+            # Exercice du moteur local: les questions posées dépendent de la variante
+            asked = []
+            for key, value in engine_expected.items():
+                if key == "frequences_pct":
+                    solution["frequences"] = {
+                        series_key(k): Fraction(int(n), solution["total"])
+                        for k, n in solution["effectifs"].items()
+                    }
+                    solution["format"] = "pourcentage"
+                    asked.append("frequences")
+                elif key in FIELD_LABELS:
+                    solution.setdefault(key, value)
+                    asked.append(key)
+            solution["asked"] = asked
+        else:
+            solution["asked"] = [
+                key for key in ("moyenne", "mediane", "etendue") if key in expected
+            ] or ["moyenne", "mediane", "etendue"]
+        return solution
+
+    raise ValueError(f"Type d'exercice inconnu: {exercise_type}")
+
+
+def _add_series(solution: Dict[str, Any], values: np.ndarray, counts: np.ndarray):
+    """Effectifs, moyenne, médiane et étendue d'une série numérique"""
+    solution["effectifs"] = {series_key(float(v)): int(c) for v, c in zip(values, counts)}
+    solution["total"] = int(counts.sum())
+    solution["moyenne"] = weighted_mean(values, counts)
+    solution["mediane"] = median(values, counts)
+    solution["etendue"] = value_range(values)
+    # Réponses issues des erreurs classiques, pour les reconnaître
+    products = float(np.dot(values, counts))
+    solution["mistakes"] = {
+        "moyenne_division_nombre_valeurs": products / len(values),
+        "moyenne_non_ponderee": float(values.mean()),
+        "division_oubliee": products,
+    }
+
+
+class AnswerGrader:
+    """Corrige localement les réponses saisies, avec commentaire rédigé en option"""
+
+    def __init__(self, client: Optional[Any] = None, word_feedback: bool = False):
+        """
+        Initialise le correcteur
+
+        Args:
+            client: Client Gemini, utilisé seulement pour rédiger le commentaire
+            word_feedback: Faire rédiger un court commentaire par Gemini (sinon
+                commentaire local, sans appel réseau)
+        """
+        self.client = client
+        self.word_feedback = word_feedback
+
+    def answer_fields(self, exercise: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """Champs à saisir pour cet exercice: [(clé, intitulé), ...]"""
+        return [(key, FIELD_LABELS[key]) for key in solution_for(exercise)["asked"]]
+
+    def grade(self, exercise: Dict[str, Any], answer: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Corrige une réponse saisie
+
+        Args:
+            exercise: Exercice (format du moteur local ou de GeminiClient)
+            answer: Réponse de l'élève par champ (voir answer_fields), en texte ou en nombres
+
+        Returns:
+            Feedback au format de analyze_handwritten_solution, avec en plus
+            error_types (codes de ERROR_TYPES) et graded_locally
+        """
+        start = time.perf_counter()
+        try:
+            solution = solution_for(exercise)
+        except ValueError as e:
+            return {"error": str(e), "feedback": "", "errors": [], "score": "Non évalué"}
+
+        feedback = self._grade(solution, answer)
+        if self.word_feedback and self.client is not None:
+            wording = self._word(exercise, feedback)
+            if wording:
+                feedback["feedback"] = wording
+        feedback["grading_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return feedback
+
+    def grade_batch(
+        self, exercise: Dict[str, Any], answers: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Corrige les réponses d'une classe au même exercice (solution calculée une
+        fois, commentaires locaux uniquement)
+        """
+        try:
+            solution = solution_for(exercise)
+        except ValueError as e:
+            return [
+                {"error": str(e), "feedback": "", "errors": [], "score": "Non évalué"}
+                for _ in answers
+            ]
+        return [self._grade(solution, answer) for answer in answers]
+
+    # --- Correction ---
+
+    def _grade(self, solution: Dict[str, Any], answer: Dict[str, Any]) -> Dict[str, Any]:
+        """Note sur 20, erreurs typées et correction détaillée"""
+        scores: List[float] = []
+        error_types: List[str] = []
+        good_points: List[str] = []
+        corrections: List[str] = []
+
+        for field in solution["asked"]:
+            given = answer.get(field) if isinstance(answer, dict) else None
+            if given is None or (isinstance(given, str) and not given.strip()):
+                score, codes = 0.0, ["reponse_manquante"]
+            elif field in TABLE_FIELDS:
+                score, codes = self._grade_table(field, solution, given)
+            else:
+                score, codes = self._grade_number(field, solution, given)
+
+            scores.append(score)
+            for code in codes:
+                if code not in error_types:
+                    error_types.append(code)
+            label = FIELD_LABELS[field].split(" (")[0]
+            if not codes:
+                good_points.append(f"{label} : juste")
+            corrections.append(f"{label} : {self._format_expected(field, solution)}")
+
+        points = round(sum(scores) / len(scores) * 40) / 2 if scores else 0.0
+        errors = [ERROR_TYPES[code][0] for code in error_types]
+        return {
+            "feedback": self._local_wording(points, errors),
+            "errors": errors,
+            "error_types": error_types,
+            "good_points": good_points,
+            "correction": "\n".join(f"- {line}" for line in corrections),
+            "score": f"{points:g}/20",
+            "next_steps": [ERROR_TYPES[code][1] for code in error_types],
+            "personalized_tips": [],
+            "graded_locally": True,
+        }
+
+    @staticmethod
+    def _grade_table(
+        field: str, solution: Dict[str, Any], given: Any
+    ) -> Tuple[float, List[str]]:
+        """Tableau d'effectifs ou de fréquences, entrée par entrée"""
+        table = parse_table(given)
+        if table is None:
+            return 0.0, ["reponse_illisible"]
+
+        expected = solution[field]
+        codes: List[str] = []
+        correct = 0
+        for key, value in expected.items():
+            if key not in table:
+                codes.append("valeur_oubliee")
+                continue
+            if field == "effectifs":
+                ok = parse_number(table[key]) == value
+                codes.extend([] if ok else ["effectif_faux"])
+            else:
+                ok = frequency_matches(
+                    table[key], solution["effectifs"][key], solution["total"], solution["format"]
+                )
+                if not ok:
+                    codes.append(_frequency_mistake(table[key], value, solution["format"]))
+            correct += ok
+
+        extra = [key for key in table if key not in expected]
+        if extra:
+            codes.append("valeur_en_trop")
+        return correct / (len(expected) + len(extra)), list(dict.fromkeys(codes))
+
+    @staticmethod
+    def _grade_number(
+        field: str, solution: Dict[str, Any], given: Any
+    ) -> Tuple[float, List[str]]:
+        """Réponse numérique (total, moyenne, médiane, étendue, question de problème)"""
+        number = parse_number(given)
+        if number is None:
+            return 0.0, ["reponse_illisible"]
+
+        expected = solution[field]
+        if isinstance(expected, list):
+            # Plusieurs valeurs les plus fréquentes: chacune est acceptée
+            return (1.0, []) if number in expected else (0.0, ["reponse_fausse"])
+
+        tolerance = {
+            "moyenne": MEAN_TOLERANCE,
+            "pct_moins_que_seuil": PERCENT_TOLERANCE,
+            "pct_seuil_et_plus": PERCENT_TOLERANCE,
+        }.get(field, 1e-9)
+        if abs(number - float(expected)) <= tolerance:
+            return 1.0, []
+
+        mistakes = solution.get("mistakes", {})
+        if field == "moyenne":
+            if abs(number - expected) <= 0.1:
+                return 0.75, ["arrondi"]
+            for code in (
+                "moyenne_division_nombre_valeurs",
+                "moyenne_non_ponderee",
+                "division_oubliee",
+            ):
+                if abs(number - mistakes[code]) <= 0.1:
+                    return 0.0, [code]
+            return 0.0, ["moyenne_fausse"]
+        if field == "mediane":
+            # Valeur du milieu de la série telle que donnée, sans la ranger
+            raw = [value for value in solution.get("raw", []) if value is not None]
+            middle = len(raw) // 2
+            if raw and number == (
+                raw[middle] if len(raw) % 2 else (raw[middle - 1] + raw[middle]) / 2
+            ):
+                return 0.0, ["mediane_non_triee"]
+            return 0.0, ["mediane_fausse"]
+        if field == "etendue":
+            return 0.0, ["etendue_fausse"]
+        if field == "total":
+            return 0.0, ["total_faux"]
+        return 0.0, ["reponse_fausse"]
+
+    @staticmethod
+    def _format_expected(field: str, solution: Dict[str, Any]) -> str:
+        """Réponse attendue lisible, pour la correction"""
+        expected = solution[field]
+        if field == "effectifs":
+            return ", ".join(f"{key} → {n}" for key, n in expected.items())
+        if field == "frequences":
+            return ", ".join(
+                f"{key} → {_format_frequency(value, solution['format'])}"
+                for key, value in expected.items()
+            )
+        if isinstance(expected, list):
+            return " ou ".join(map(str, expected))
+        number = float(expected)
+        return f"{int(number)}" if number.is_integer() else f"{round(number, 2)}"
+
+    @staticmethod
+    def _local_wording(points: float, errors: List[str]) -> str:
+        """Commentaire court rédigé localement"""
+        if not errors:
+            return "Bravo, tout est juste !"
+        if points >= 12:
+            return f"Bon travail, il reste une petite erreur à corriger : {errors[0].lower()}."
+        return f"Attention : {errors[0].lower()}. Relis la correction et réessaie."
+
+    def _word(self, exercise: Dict[str, Any], feedback: Dict[str, Any]) -> Optional[str]:
+        """Commentaire rédigé par Gemini à partir de la note et des erreurs (None si échec)"""
+        prompt = ANSWER_FEEDBACK_PROMPT.render(
+            type_name=exercise.get("type_name", exercise.get("type", "")),
+            score=feedback["score"],
+            errors="; ".join(feedback["errors"]) or "aucune",
+            good_points="; ".join(feedback["good_points"]) or "aucun",
+        )
+        try:
+            with self.client.telemetry.track("answer_feedback"):
+                return self.client._generate_text(
+                    "answer_feedback",
+                    prompt,
+                    generation_config=self.client._generation_config("answer_feedback"),
+                ).strip() or None
+        except Exception:
+            # Le commentaire local reste affiché
+            return None
+
+
+def _frequency_mistake(given: Any, expected: Fraction, format_type: str) -> str:
+    """Type d'erreur d'une fréquence fausse"""
+    number = parse_number(given)
+    if number is None:
+        return "reponse_illisible"
+    exact = float(expected)
+    # Valeur juste dans l'autre échelle (pourcentage au lieu de décimal, ou l'inverse)
+    if format_type == "pourcentage":
+        if abs(number - exact) <= DECIMAL_TOLERANCE:
+            return "format_frequence"
+    elif abs(number - exact * 100) <= PERCENT_TOLERANCE:
+        return "format_frequence"
+    if exact and abs(number - 1 / exact) <= 0.01 * (1 / exact):
+        return "frequence_inversee"
+    return "frequence_fausse"
+
+
+def _format_frequency(value: Fraction, format_type: str) -> str:
+    if format_type == "fraction":
+        return f"{value.numerator}/{value.denominator}"
+    if format_type == "pourcentage":
+        return f"{round(float(value) * 100, 1):g} %"
+    return f"{round(float(value), 3):g}"
@@ -5,15 +5,23 @@ Version améliorée avec navigation par onglets (inspirée de l'app React AI Stu
 """
 
 import streamlit as st
+import io
 import os
 import random
+import sqlite3
+import time
+import uuid
 import pandas as pd
 from PIL import Image
 from dotenv import load_dotenv
-from gemini_client import GeminiClient
-from exercise_generator import ExerciseGenerator
+from exercise_generator import get_shared_generator
+from answer_grader import TABLE_FIELDS, AnswerGrader
 from student_profile import StudentProfile
+from profile_store import ProfileStore
 from email_notifier import EmailNotifier
+from image_preprocessor import ImagePreprocessor
+from batch_grader import BatchGrader
+from tutor_session import TutorSession
 import json
 
 # Charger les variables d'environnement
@@ -91,6 +99,30 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+@st.cache_resource(show_spinner=False)
+def get_profile_store():
+    """Base des profils élèves, partagée par toutes les sessions du processus"""
+    return ProfileStore()
+
+
+def load_student_profile():
+    """
+    Profil persistant de l'élève identifié par le paramètre d'URL ?eleve=
+    (un identifiant est créé et ajouté à l'URL à la première visite); profil
+    en mémoire si la base est indisponible. L'identifiant n'authentifie pas
+    l'élève: toute personne qui a le lien accède au profil. Les sessions
+    ouvertes avec le même identifiant partagent le même objet StudentProfile
+    """
+    student_id = st.query_params.get("eleve")
+    if not student_id:
+        student_id = uuid.uuid4().hex[:12]
+        st.query_params["eleve"] = student_id
+    try:
+        return get_profile_store().get_profile(student_id)
+    except (sqlite3.Error, OSError):
+        return StudentProfile()
+
+
 # Initialisation de la session state
 if "current_exercise" not in st.session_state:
     st.session_state.current_exercise = None
@@ -101,7 +133,7 @@ if "gemini_client" not in st.session_state:
 if "feedback" not in st.session_state:
     st.session_state.feedback = None
 if "student_profile" not in st.session_state:
-    st.session_state.student_profile = StudentProfile()
+    st.session_state.student_profile = load_student_profile()
 if "use_personalization" not in st.session_state:
     st.session_state.use_personalization = True
 if "exercise_examples" not in st.session_state:
@@ -122,6 +154,22 @@ if "practice_dataset" not in st.session_state:
     st.session_state.practice_dataset = None
 if "practice_feedback" not in st.session_state:
     st.session_state.practice_feedback = {"mean": None, "median": None, "range": None}
+if "optimize_upload" not in st.session_state:
+    st.session_state.optimize_upload = True
+if "grading_mode" not in st.session_state:
+    st.session_state.grading_mode = "two_pass"
+if "answer_mode" not in st.session_state:
+    st.session_state.answer_mode = "photo"
+if "word_feedback" not in st.session_state:
+    st.session_state.word_feedback = False
+if "grading_metrics" not in st.session_state:
+    st.session_state.grading_metrics = []
+if "tutor_metrics" not in st.session_state:
+    st.session_state.tutor_metrics = []
+if "batch_results" not in st.session_state:
+    st.session_state.batch_results = None
+if "tutor_session" not in st.session_state:
+    st.session_state.tutor_session = None
 if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = [
         {
@@ -131,6 +179,17 @@ if "chat_messages" not in st.session_state:
     ]
 
 
+def get_gemini_resources(api_key: str):
+    """
+    Client Gemini et générateur partagés par toutes les sessions du processus
+    (une instance par clé API): configuration, connexions, caches et réserve
+    d'exercices ne sont plus recréés à chaque nouvelle session
+    """
+    # Un exercice doit arriver en moins de 4 s, quitte à servir le fallback local
+    generator = get_shared_generator(api_key, default_deadline=4.0)
+    return generator.gemini, generator
+
+
 def initialize_gemini():
     """Initialise le client Gemini"""
     if st.session_state.gemini_client is None:
@@ -146,10 +205,9 @@ def initialize_gemini():
 
         if api_key:
             try:
-                st.session_state.gemini_client = GeminiClient(api_key=api_key)
-                st.session_state.exercise_generator = ExerciseGenerator(
-                    st.session_state.gemini_client
-                )
+                client, generator = get_gemini_resources(api_key)
+                st.session_state.gemini_client = client
+                st.session_state.exercise_generator = generator
                 return True
             except Exception as e:
                 st.error(f"Erreur d'initialisation: {str(e)}")
@@ -274,6 +332,10 @@ def render_home():
         )
         student_name = st.text_input("Prénom de l'élève", value=st.session_state.student_name or "")
         if student_name:
+            if student_name != st.session_state.student_name:
+                profile = st.session_state.student_profile
+                if profile.store is not None:
+                    profile.store.set_name(profile.student_id, student_name)
             st.session_state.student_name = student_name
         parent_email = st.text_input("Email du parent", value=st.session_state.parent_email or "")
         if parent_email:
@@ -473,50 +535,36 @@ def render_ai_tutor():
         # Générer la réponse avec Gemini en réutilisant le client initialisé
         if st.session_state.gemini_client:
             with st.chat_message("assistant"):
-                with st.spinner("Réflexion en cours..."):
-                    try:
-                        history_text = "\n".join(
-                            [
-                                f"{'Élève' if m['role'] == 'user' else 'Professeur'}: {m['text']}"
-                                for m in st.session_state.chat_messages[-6:]
-                            ]
-                        )
+                session = st.session_state.tutor_session
+                if session is None or session.client is not st.session_state.gemini_client:
+                    # Nouvelle session (ou nouveau client): reprend la conversation affichée
+                    session = TutorSession(
+                        st.session_state.gemini_client,
+                        history=st.session_state.chat_messages[:-1],
+                    )
+                    st.session_state.tutor_session = session
 
-                        system_instruction = """
-                        Tu es un professeur de mathématiques pour des élèves de 3ème.
-                        Chapitre : Statistiques (moyenne, médiane, étendue, effectifs, fréquences).
-                        Réponds de façon claire, courte, pédagogique. Utilise le gras (**texte**) pour les notions clés.
-                        Ne donne pas la réponse directe d'un exercice, guide l'élève par étapes.
-                        """
-
-                        prompt_text = f"{system_instruction}\n\nHistorique:\n{history_text}\n\nÉlève: {prompt}\nProfesseur:"
-
-                        # Essayer plusieurs modèles via le client existant
-                        models = [
-                            "gemini-2.0-flash-exp",
-                            "gemini-1.5-flash",
-                            "gemini-pro",
-                        ]
-                        response_text = None
-                        for _ in models:
-                            try:
-                                response = st.session_state.gemini_client.model.generate_content(
-                                    prompt_text
-                                )
-                                response_text = response.text
-                                if response_text:
-                                    break
-                            except Exception:
-                                continue
-
-                        if not response_text:
-                            raise RuntimeError("Aucune réponse valide reçue.")
-
-                        st.write(response_text)
+                stream_state = {"text": "", "ttft_ms": None}
+                try:
+                    st.write_stream(
+                        stream_with_metrics(session.send_stream(prompt), stream_state)
+                    )
+                    if not stream_state["text"]:
+                        raise RuntimeError("Aucune réponse valide reçue.")
+                    st.session_state.chat_messages.append(
+                        {"role": "model", "text": stream_state["text"]}
+                    )
+                except Exception:
+                    if stream_state["text"]:
+                        # Garder la partie déjà affichée plutôt que de la perdre
+                        st.warning("La réponse a été interrompue. Tu peux reposer ta question.")
                         st.session_state.chat_messages.append(
-                            {"role": "model", "text": response_text}
+                            {
+                                "role": "model",
+                                "text": stream_state["text"] + " […]",
+                            }
                         )
-                    except Exception:
+                    else:
                         error_msg = (
                             "Le tuteur ne répond pas. Vérifie la clé API ou réessaie."
                         )
@@ -524,10 +572,34 @@ def render_ai_tutor():
                         st.session_state.chat_messages.append(
                             {"role": "model", "text": error_msg}
                         )
+
+                if stream_state["ttft_ms"] is not None:
+                    st.session_state.tutor_metrics.append(stream_state)
+                    st.caption(
+                        f"⏱️ Premier mot en {stream_state['ttft_ms'] / 1000:.2f} s, "
+                        f"réponse complète en {stream_state['total_ms'] / 1000:.2f} s, "
+                        f"~{session.get_stats()['last_input_tokens']} tokens envoyés"
+                    )
         else:
             st.warning("Configure la clé API Gemini dans la barre latérale.")
 
 
+def stream_with_metrics(chunks, state):
+    """
+    Relaie les fragments d'une réponse en streaming en accumulant le texte
+    et en mesurant le temps jusqu'au premier fragment (TTFT)
+    """
+    start = time.perf_counter()
+    try:
+        for chunk in chunks:
+            if state["ttft_ms"] is None:
+                state["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            state["text"] += chunk
+            yield chunk
+    finally:
+        state["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+
 def render_exercises_ia():
     """Section Exercices générés avec IA (code existant)"""
     # Code existant de la section exercices
@@ -553,39 +625,240 @@ def render_exercises_ia():
     st.divider()
 
     st.header("✍️ Ta réponse")
-    uploaded_file = st.file_uploader(
-        "📷 Télécharger la photo de ta copie",
-        type=["png", "jpg", "jpeg"],
+    answer_modes = {
+        "photo": "📷 Photo de ma copie",
+        "typed": "⌨️ Saisie directe (correction instantanée)",
+    }
+    st.session_state.answer_mode = st.radio(
+        "Mode de réponse",
+        list(answer_modes),
+        index=list(answer_modes).index(st.session_state.answer_mode),
+        format_func=answer_modes.get,
+        horizontal=True,
     )
 
+    uploaded_file = None
+    if st.session_state.answer_mode == "typed":
+        render_typed_answer(exercise)
+    else:
+        uploaded_file = st.file_uploader(
+            "📷 Télécharger la photo de ta copie",
+            type=["png", "jpg", "jpeg"],
+        )
+
     if uploaded_file is not None:
         image = Image.open(uploaded_file)
         st.image(image, caption="Ta copie", use_container_width=True)
+        st.session_state.optimize_upload = st.checkbox(
+            "⚡ Optimiser la photo avant l'envoi (recadrage, réduction, compression)",
+            value=st.session_state.optimize_upload,
+        )
+        grading_modes = {
+            "two_pass": "🧠 Détaillée (2 étapes)",
+            "single_pass": "⚡ Rapide (1 étape)",
+        }
+        st.session_state.grading_mode = st.radio(
+            "Mode de correction",
+            list(grading_modes),
+            index=list(grading_modes).index(st.session_state.grading_mode),
+            format_func=grading_modes.get,
+            horizontal=True,
+        )
 
         if st.button("🔍 Analyser ma copie", type="primary"):
             with st.spinner("Analyse en cours..."):
                 try:
+                    start = time.perf_counter()
+                    upload_bytes = uploaded_file.getvalue()
+                    metrics = {
+                        "optimized": st.session_state.optimize_upload,
+                        "grading_mode": st.session_state.grading_mode,
+                        "original_bytes": len(upload_bytes),
+                        "output_bytes": len(upload_bytes),
+                    }
+                    image_to_send = image
+                    if st.session_state.optimize_upload:
+                        # Image fraîche: le décodage réduit (draft) n'est possible qu'avant chargement
+                        image_to_send, prep_metrics = ImagePreprocessor().process(
+                            Image.open(io.BytesIO(upload_bytes)),
+                            original_bytes=len(upload_bytes),
+                        )
+                        metrics.update(prep_metrics)
+
                     profile = st.session_state.student_profile.get_profile()
                     student_profile_data = (
                         profile if st.session_state.use_personalization else None
                     )
                     feedback = (
                         st.session_state.gemini_client.analyze_handwritten_solution(
-                            image=image,
+                            image=image_to_send,
                             exercise_type=exercise["type"],
                             exercise_data=exercise,
                             question=exercise["question"],
                             student_history=student_profile_data,
+                            grading_mode=st.session_state.grading_mode,
                         )
                     )
+                    metrics["end_to_end_ms"] = round(
+                        (time.perf_counter() - start) * 1000, 1
+                    )
+                    st.session_state.grading_metrics.append(metrics)
                     st.session_state.feedback = feedback
                     st.rerun()
                 except Exception as e:
                     st.error(f"Erreur: {str(e)}")
 
+    if st.session_state.grading_metrics:
+        render_grading_metrics(st.session_state.grading_metrics)
+
     if st.session_state.feedback:
         display_feedback(st.session_state.feedback)
 
+    render_batch_grading(exercise)
+
+
+def render_typed_answer(exercise):
+    """Réponse saisie au clavier: correction locale, sans envoi de photo"""
+    grader = AnswerGrader(st.session_state.gemini_client)
+    try:
+        fields = grader.answer_fields(exercise)
+    except ValueError as e:
+        st.warning(f"Saisie directe indisponible pour cet exercice : {e}")
+        return
+
+    with st.form("typed_answer"):
+        answers = {}
+        for key, label in fields:
+            if key in TABLE_FIELDS:
+                answers[key] = st.text_area(label, placeholder="12: 3\n14: 5", key=f"answer_{key}")
+            else:
+                answers[key] = st.text_input(label, key=f"answer_{key}")
+        word_feedback = st.checkbox(
+            "💬 Commentaire rédigé par l'IA (sinon correction 100 % locale)",
+            value=st.session_state.word_feedback,
+            disabled=st.session_state.gemini_client is None,
+        )
+        submitted = st.form_submit_button("✅ Corriger ma réponse", type="primary")
+
+    if submitted:
+        st.session_state.word_feedback = word_feedback
+        grader.word_feedback = word_feedback
+        feedback = grader.grade(exercise, answers)
+        if feedback.get("error"):
+            st.error(f"Erreur: {feedback['error']}")
+            return
+        st.session_state.student_profile.add_result(
+            exercise["type"], st.session_state.get("difficulty", "moyen"), feedback, exercise
+        )
+        st.session_state.feedback = feedback
+        st.rerun()
+
+
+def render_batch_grading(exercise):
+    """Correction de toutes les copies d'une classe sur l'exercice courant"""
+    st.divider()
+    with st.expander("👩‍🏫 Corriger les copies d'une classe", expanded=False):
+        uploaded_files = st.file_uploader(
+            "📷 Photos des copies (une par élève)",
+            type=["png", "jpg", "jpeg"],
+            accept_multiple_files=True,
+            key="batch_uploads",
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            max_concurrency = st.slider("Copies corrigées en parallèle", 1, 8, 4)
+        with col2:
+            item_timeout = st.slider("Délai maximal par copie (s)", 30, 300, 120, step=30)
+
+        if uploaded_files and st.button(
+            f"🔍 Corriger {len(uploaded_files)} copie(s)", key="batch_grade"
+        ):
+            items = []
+            for uploaded in uploaded_files:
+                upload_bytes = uploaded.getvalue()
+                items.append(
+                    {
+                        "image": Image.open(io.BytesIO(upload_bytes)),
+                        "exercise": exercise,
+                        "label": uploaded.name,
+                        "original_bytes": len(upload_bytes),
+                    }
+                )
+
+            grader = BatchGrader(
+                st.session_state.gemini_client,
+                max_concurrency=max_concurrency,
+                item_timeout=item_timeout,
+                grading_mode=st.session_state.grading_mode,
+                preprocessor=(
+                    ImagePreprocessor() if st.session_state.optimize_upload else None
+                ),
+            )
+            progress = st.progress(0.0, text="Correction en cours...")
+            st.session_state.batch_results = grader.grade(
+                items,
+                on_progress=lambda done, total: progress.progress(
+                    done / total, text=f"{done}/{total} copies corrigées"
+                ),
+            )
+            progress.empty()
+
+        batch = st.session_state.batch_results
+        if batch:
+            summary = batch["summary"]
+            st.caption(
+                f"{summary['succeeded']}/{summary['total']} copies corrigées en "
+                f"{summary['elapsed_s']:.1f} s ({summary['copies_per_minute']:.0f} copies/min)"
+            )
+            if summary["failed"] or summary["timed_out"]:
+                st.warning(
+                    f"{summary['failed']} échec(s) et {summary['timed_out']} délai(s) dépassé(s)"
+                )
+            status_labels = {"ok": "✅", "error": "❌", "timeout": "⏱️"}
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {
+                            "Copie": result["label"],
+                            "Statut": status_labels[result["status"]],
+                            "Note": (result["feedback"] or {}).get("score", ""),
+                            "Erreur": result["error"] or "",
+                            "Durée (s)": result["elapsed_ms"] / 1000,
+                        }
+                        for result in batch["results"]
+                    ]
+                ),
+                hide_index=True,
+                use_container_width=True,
+            )
+            # Les expanders ne peuvent pas être imbriqués: un titre par copie
+            for result in batch["results"]:
+                if result["status"] == "ok":
+                    st.markdown(
+                        f"**📄 {result['label']} — {result['feedback'].get('score', '')}**"
+                    )
+                    st.markdown(result["feedback"].get("feedback", ""))
+
+
+def render_grading_metrics(grading_metrics):
+    """Affiche les octets économisés et la latence de correction avec/sans optimisation"""
+    last = grading_metrics[-1]
+    with st.expander("⏱️ Performances de l'envoi", expanded=False):
+        st.caption(
+            f"Dernière copie : {last['original_bytes'] / 1024:.0f} Ko → "
+            f"{last['output_bytes'] / 1024:.0f} Ko envoyés, "
+            f"{last['end_to_end_ms'] / 1000:.1f} s de bout en bout"
+        )
+        for optimized, label in ((True, "Avec optimisation"), (False, "Sans optimisation")):
+            runs = [m for m in grading_metrics if m["optimized"] == optimized]
+            if runs:
+                avg_ms = sum(m["end_to_end_ms"] for m in runs) / len(runs)
+                avg_kb = sum(m["output_bytes"] for m in runs) / len(runs) / 1024
+                st.caption(
+                    f"{label} : {len(runs)} copie(s), {avg_kb:.0f} Ko envoyés "
+                    f"et {avg_ms / 1000:.1f} s en moyenne"
+                )
+
 
 def display_feedback(feedback):
     """Affiche le feedback détaillé"""
@@ -627,6 +900,9 @@ def display_feedback(feedback):
         st.subheader("📈 Évaluation")
         st.metric("Score", feedback["score"])
 
+    if feedback.get("graded_locally"):
+        st.caption(f"⚡ Corrigé localement en {feedback['grading_ms']:.2f} ms")
+
 
 def render_sidebar():
     """Navigation minimale (non utilisée, navigation en top bar)"""
@@ -641,6 +917,9 @@ def main():
     if not render_sidebar():
         return
 
+    # Client Gemini partagé (créé une seule fois par processus et par clé)
+    initialize_gemini()
+
     # Navigation par onglets
     tab = st.session_state.current_tab
 
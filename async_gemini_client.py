@@ -0,0 +1,324 @@
+"""
+Client asynchrone pour Gemini (asyncio)
+Permet de lancer plusieurs appels en parallèle sur une boucle d'événements
+"""
+
+import asyncio
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from PIL import Image
+
+from gemini_client import GeminiClient, request_options_for
+from rate_limiter import LocalTimeout, estimate_tokens
+from telemetry import annotate, merge_annotations, run_annotated_async
+
+
+class AsyncGeminiClient:
+    """Versions asynchrones des méthodes de GeminiClient, basées sur generate_content_async"""
+
+    def __init__(
+        self,
+        client: Optional[GeminiClient] = None,
+        max_concurrency: int = 8,
+        max_vision_concurrency: int = 4,
+    ):
+        """
+        Initialise le client asynchrone
+
+        Args:
+            client: Client synchrone dont on réutilise modèle, prompts, parsers et cache
+            max_concurrency: Nombre maximal d'appels Gemini simultanés
+            max_vision_concurrency: Nombre maximal d'appels avec images simultanés
+        """
+        self.client = client or GeminiClient()
+        self.max_concurrency = max_concurrency
+        self.max_vision_concurrency = max_vision_concurrency
+        # Un asyncio.Semaphore est lié à une boucle: un jeu de sémaphores par boucle
+        self._semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def _get_semaphores(self) -> Dict[str, asyncio.Semaphore]:
+        """Retourne les sémaphores partagés de la boucle courante"""
+        loop = asyncio.get_running_loop()
+        semaphores = self._semaphores.get(loop)
+        if semaphores is None:
+            semaphores = {
+                "all": asyncio.Semaphore(self.max_concurrency),
+                "vision": asyncio.Semaphore(self.max_vision_concurrency),
+            }
+            self._semaphores[loop] = semaphores
+        return semaphores
+
+    async def _generate_text(
+        self,
+        operation: str,
+        contents: Any,
+        use_cache: bool = True,
+        cache_variants: int = 1,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        parse: Optional[Callable[[str], Dict[str, Any]]] = None,
+    ) -> Any:
+        """Équivalent asynchrone de GeminiClient._generate_text"""
+        cache = self.client.cache
+        key = None
+        if cache is not None and use_cache:
+            key = cache.make_key(self.client.model_name, contents, generation_config)
+            cached = cache.get(operation, key, cache_variants)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return parse(cached) if parse else cached
+
+        semaphores = self._get_semaphores()
+        has_image = isinstance(contents, list) and any(
+            not isinstance(part, str) for part in contents
+        )
+
+        # Modèle qui a répondu: une réponse de repli n'est pas mise en cache
+        annotations: Dict[str, Any] = {}
+        try:
+            async with semaphores["all"]:
+                if has_image:
+                    async with semaphores["vision"]:
+                        text = await run_annotated_async(
+                            annotations,
+                            self._call_with_failover(
+                                operation, contents, generation_config, timeout
+                            ),
+                        )
+                else:
+                    text = await run_annotated_async(
+                        annotations,
+                        self._call_with_failover(operation, contents, generation_config, timeout),
+                    )
+        finally:
+            merge_annotations(annotations)
+
+        result = parse(text) if parse else text
+        if (
+            key is not None
+            and annotations.get("model") == self.client.model_name
+            and not (parse and "error" in result)
+        ):
+            cache.put(operation, key, text, cache_variants)
+        return result
+
+    async def _call_with_failover(
+        self,
+        operation: str,
+        contents: Any,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Équivalent asynchrone de GeminiClient._call_with_failover"""
+        registry = self.client.registry
+        tokens = estimate_tokens(contents)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        async def attempt(name: str, model: Any) -> Any:
+            start = time.perf_counter()
+            report: Dict[str, Any] = {}
+            try:
+                response = await self.client.rate_limiter.call_async(
+                    lambda: model.generate_content_async(
+                        contents,
+                        generation_config=generation_config,
+                        request_options=request_options_for(deadline),
+                    ),
+                    tokens,
+                    deadline,
+                    report,
+                )
+                self.client._record_usage(response, tokens, contents)
+                response.text  # Lève une erreur si la réponse est bloquée ou vide
+            except LocalTimeout:
+                raise
+            except Exception:
+                registry.record(name, operation, time.perf_counter() - start, ok=False)
+                raise
+            finally:
+                annotate(model=name, **report)
+            registry.record(name, operation, time.perf_counter() - start, ok=True)
+            return response
+
+        hedger = self.client.hedger
+        if hedger is not None and hedger.applies(operation):
+            # Les perdants sont des tâches asyncio: ils sont réellement annulés
+            return (await hedger.run_async(registry, operation, attempt, tokens)).text
+
+        last_error: Optional[Exception] = None
+        for name, model in registry.candidates(operation):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                return (await attempt(name, model)).text
+            except LocalTimeout:
+                raise
+            except Exception as e:
+                last_error = e
+
+        if last_error is None and deadline is not None:
+            raise LocalTimeout("Délai épuisé avant l'appel à Gemini")
+        raise last_error or RuntimeError("Aucun modèle Gemini disponible")
+
+    async def analyze_handwritten_solution(
+        self,
+        image: Union[Image.Image, Dict[str, Any]],
+        exercise_type: str,
+        exercise_data: Dict[str, Any],
+        question: str,
+        student_history: Optional[Dict[str, Any]] = None,
+        grading_mode: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Version asynchrone de GeminiClient.analyze_handwritten_solution"""
+
+        try:
+            # Encodage (CPU) hors de la boucle d'événements, partagé par les étapes
+            image_part = await asyncio.to_thread(
+                self.client._prepare_image_part, image
+            )
+
+            if (grading_mode or self.client.grading_mode) == "single_pass":
+                prompt = self.client._build_single_pass_prompt(
+                    exercise_type, exercise_data, question, student_history
+                )
+                with self.client.telemetry.track("analyze_handwritten_solution.single_pass"):
+                    response_text = await self._generate_text(
+                        "analyze_handwritten_solution",
+                        [prompt, image_part],
+                        use_cache=False,
+                        generation_config=self.client._generation_config("single_pass"),
+                    )
+                    return self.client._parse_single_pass(response_text)
+
+            step1_prompt = self.client._build_step_analysis_prompt(
+                exercise_type, exercise_data, question, student_history
+            )
+            with self.client.telemetry.track("analyze_handwritten_solution.step_analysis"):
+                step1_text = await self._generate_text(
+                    "analyze_handwritten_solution",
+                    [step1_prompt, image_part],
+                    use_cache=False,
+                    generation_config=self.client._generation_config("step_analysis"),
+                )
+                step1_analysis = self.client._parse_step_analysis(step1_text)
+
+            step2_prompt = self.client._build_detailed_analysis_prompt(
+                exercise_type,
+                exercise_data,
+                question,
+                step1_analysis,
+                student_history,
+            )
+            with self.client.telemetry.track("analyze_handwritten_solution.detailed_analysis"):
+                step2_text = await self._generate_text(
+                    "analyze_handwritten_solution",
+                    [step2_prompt, image_part],
+                    use_cache=False,
+                    generation_config=self.client._generation_config("detailed_analysis"),
+                )
+                feedback = self.client._parse_feedback(step2_text)
+            feedback["step_analysis"] = step1_analysis
+            feedback["reasoning_steps"] = step1_analysis.get("steps", [])
+
+            return feedback
+
+        except Exception as e:
+            return {
+                "error": f"Erreur lors de l'analyse: {str(e)}",
+                "feedback": "",
+                "errors": [],
+                "good_points": [],
+                "correction": "",
+                "step_analysis": {},
+                "reasoning_steps": [],
+            }
+
+    async def generate_exercise(
+        self,
+        exercise_type: str,
+        difficulty: str = "moyen",
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Version asynchrone de GeminiClient.generate_exercise"""
+
+        prompt = self.client._build_exercise_prompt(exercise_type, difficulty)
+
+        try:
+            with self.client.telemetry.track("generate_exercise"):
+                return await self._generate_text(
+                    "generate_exercise",
+                    prompt,
+                    use_cache=use_cache,
+                    cache_variants=self.client.exercise_cache_variants,
+                    generation_config=self.client._generation_config("exercise"),
+                    timeout=timeout,
+                    parse=lambda text: self.client._parse_exercise(text, exercise_type),
+                )
+        except Exception as e:
+            return GeminiClient._generation_error(e)
+
+    async def analyze_exercise_examples(
+        self,
+        images: List[Image.Image],
+        chapter: str = "statistiques",
+        use_cache: bool = True,
+    ) -> Dict[str, Any]:
+        """Version asynchrone de GeminiClient.analyze_exercise_examples"""
+
+        if len(images) < 3 or len(images) > 10:
+            return {
+                "valid": False,
+                "error": f"Nombre d'images invalide: {len(images)}. Attendu: 3-10",
+                "examples": [],
+            }
+
+        prompt = self.client._build_examples_analysis_prompt(chapter, len(images))
+
+        try:
+            with self.client.telemetry.track("analyze_exercise_examples"):
+                response_text = await self._generate_text(
+                    "analyze_exercise_examples",
+                    [prompt] + images,
+                    use_cache=use_cache,
+                    generation_config=self.client._generation_config("examples_analysis"),
+                )
+                return self.client._parse_examples_analysis(response_text)
+        except Exception as e:
+            return {
+                "valid": False,
+                "error": f"Erreur lors de l'analyse: {str(e)}",
+                "examples": [],
+            }
+
+    async def generate_exercise_from_examples(
+        self,
+        exercise_type: str,
+        difficulty: str,
+        examples_analysis: Dict[str, Any],
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Version asynchrone de GeminiClient.generate_exercise_from_examples"""
+
+        prompt = self.client._build_exercise_from_examples_prompt(
+            exercise_type, difficulty, examples_analysis
+        )
+
+        try:
+            with self.client.telemetry.track("generate_exercise_from_examples"):
+                exercise = await self._generate_text(
+                    "generate_exercise_from_examples",
+                    prompt,
+                    use_cache=use_cache,
+                    cache_variants=self.client.exercise_cache_variants,
+                    generation_config=self.client._generation_config("exercise"),
+                    timeout=timeout,
+                    parse=lambda text: self.client._parse_exercise(text, exercise_type),
+                )
+            exercise["inspired_by_examples"] = True
+            return exercise
+        except Exception as e:
+            return GeminiClient._generation_error(e)
@@ -0,0 +1,206 @@
+"""
+Correction d'un lot de copies (classe entière) en parallèle
+Concurrence bornée, délai maximal par copie, résultats dans l'ordre des copies
+et rapport des échecs partiels
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from async_gemini_client import AsyncGeminiClient
+from gemini_client import GeminiClient
+from image_preprocessor import ImagePreprocessor
+
+# Statuts possibles d'une copie
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_TIMEOUT = "timeout"
+
+# Intervalle (secondes) de relève de la progression par grade()
+PROGRESS_POLL_INTERVAL = 0.05
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Boucle asyncio partagée par tous les lots, dans un thread dédié
+    Le SDK garde son client grpc.aio sur le GenerativeModel (partagé par les
+    sessions): il reste lié à la boucle de son premier appel. asyncio.run en
+    créerait une nouvelle à chaque lot
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="batch-grader-loop", daemon=True
+            ).start()
+        return _loop
+
+
+class BatchGrader:
+    """Corrige plusieurs copies à la fois avec GeminiClient (via AsyncGeminiClient)"""
+
+    def __init__(
+        self,
+        client: GeminiClient,
+        max_concurrency: int = 4,
+        item_timeout: float = 120.0,
+        grading_mode: Optional[str] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+    ):
+        """
+        Initialise le correcteur par lot
+
+        Args:
+            client: Client Gemini (modèles, prompts, parsers et registre partagés)
+            max_concurrency: Nombre maximal de copies corrigées simultanément
+            item_timeout: Délai maximal (secondes) de correction d'une copie,
+                attente dans la file non comprise
+            grading_mode: "two_pass" ou "single_pass" (None: mode du client)
+            preprocessor: Prétraitement appliqué à chaque photo avant l'envoi
+        """
+        self.client = client
+        self.max_concurrency = max(1, max_concurrency)
+        self.item_timeout = item_timeout
+        self.grading_mode = grading_mode
+        self.preprocessor = preprocessor
+        # La limite du lot est appliquée ici: celles du client async ne doivent pas brider
+        self.async_client = AsyncGeminiClient(
+            client,
+            max_concurrency=self.max_concurrency,
+            max_vision_concurrency=self.max_concurrency,
+        )
+
+    def grade(
+        self,
+        items: List[Dict[str, Any]],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Corrige un lot de copies (appel bloquant)
+
+        Args:
+            items: Copies à corriger, chacune un dictionnaire avec "image"
+                (PIL ou blob), "exercise" et optionnellement "label",
+                "student_history" et "original_bytes"
+            on_progress: Rappel (copies terminées, total) après chaque copie
+
+        Returns:
+            {"results": [...], "summary": {...}}, résultats dans l'ordre de items
+        """
+        progress: "queue.Queue[Tuple[int, int]]" = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self.grade_async(
+                items,
+                None if on_progress is None else lambda done, total: progress.put((done, total)),
+            ),
+            _background_loop(),
+        )
+        if on_progress is not None:
+            # Rappels exécutés dans le thread appelant (Streamlit n'accepte pas les autres)
+            while True:
+                try:
+                    on_progress(*progress.get(timeout=PROGRESS_POLL_INTERVAL))
+                except queue.Empty:
+                    if future.done():
+                        break
+        return future.result()
+
+    async def grade_async(
+        self,
+        items: List[Dict[str, Any]],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Version asynchrone de grade(), à utiliser depuis une boucle existante; le
+        client async du SDK restant lié à sa première boucle, toujours la même
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        total = len(items)
+        done = 0
+        start = time.perf_counter()
+
+        async def run(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            nonlocal done
+            async with semaphore:
+                result = await self._grade_item(index, item)
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total)
+            return result
+
+        results = await asyncio.gather(
+            *(run(index, item) for index, item in enumerate(items))
+        )
+        elapsed = time.perf_counter() - start
+
+        return {"results": list(results), "summary": self._summarize(results, elapsed)}
+
+    async def _grade_item(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Corrige une copie; une erreur ou un dépassement n'affecte pas les autres"""
+        result: Dict[str, Any] = {
+            "index": index,
+            "label": item.get("label", f"Copie {index + 1}"),
+            "status": STATUS_OK,
+            "feedback": None,
+            "error": None,
+        }
+        exercise = item["exercise"]
+        start = time.perf_counter()
+
+        try:
+            feedback = await asyncio.wait_for(
+                self._analyze(item, exercise), timeout=self.item_timeout
+            )
+            if feedback.get("error"):
+                result["status"] = STATUS_ERROR
+                result["error"] = feedback["error"]
+            result["feedback"] = feedback
+        except asyncio.TimeoutError:
+            result["status"] = STATUS_TIMEOUT
+            result["error"] = f"Délai dépassé ({self.item_timeout:.0f} s)"
+        except Exception as e:
+            result["status"] = STATUS_ERROR
+            result["error"] = f"Erreur lors de l'analyse: {str(e)}"
+
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def _analyze(self, item: Dict[str, Any], exercise: Dict[str, Any]) -> Dict[str, Any]:
+        image = item["image"]
+        if self.preprocessor is not None:
+            image, _ = await asyncio.to_thread(
+                self.preprocessor.process, image, item.get("original_bytes")
+            )
+
+        return await self.async_client.analyze_handwritten_solution(
+            image=image,
+            exercise_type=exercise["type"],
+            exercise_data=exercise,
+            question=exercise["question"],
+            student_history=item.get("student_history"),
+            grading_mode=self.grading_mode,
+        )
+
+    @staticmethod
+    def _summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        """Compteurs du lot et débit en copies par minute"""
+        counts = {STATUS_OK: 0, STATUS_ERROR: 0, STATUS_TIMEOUT: 0}
+        for result in results:
+            counts[result["status"]] += 1
+
+        return {
+            "total": len(results),
+            "succeeded": counts[STATUS_OK],
+            "failed": counts[STATUS_ERROR],
+            "timed_out": counts[STATUS_TIMEOUT],
+            "failed_indexes": [r["index"] for r in results if r["status"] != STATUS_OK],
+            "elapsed_s": round(elapsed, 2),
+            "copies_per_minute": round(len(results) / elapsed * 60, 1) if elapsed > 0 else 0.0,
+        }
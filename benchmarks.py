@@ -0,0 +1,1600 @@
+"""
+Benchmarks de performance de l'application
+Usage: python benchmarks.py <benchmark> [options]
+
+Par défaut les benchmarks utilisent un modèle factice (latence simulée à partir
+du nombre de tokens); --live utilise la vraie API Gemini (GEMINI_API_KEY).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+# Tokens facturés par Gemini pour une image (petite ou tuile 768x768)
+IMAGE_TOKENS = 258
+
+SAMPLE_GRADING_RESPONSE = {
+    "steps": [
+        {
+            "step_number": 1,
+            "description": "Calcul des produits valeur × effectif",
+            "status": "correct",
+            "student_work": "10×2=20 ; 11×3=33 ; 12×5=60",
+            "reasoning": "Les produits sont justes",
+        },
+        {
+            "step_number": 2,
+            "description": "Division par l'effectif total",
+            "status": "incorrect",
+            "student_work": "113 / 3 = 37,7",
+            "reasoning": "Division par le nombre de valeurs au lieu de l'effectif total",
+        },
+    ],
+    "method_used": "Moyenne pondérée",
+    "alternative_methods": [],
+    "reasoning_errors": ["Confusion entre nombre de valeurs et effectif total"],
+    "feedback": "Bon début, attention à l'effectif total.",
+    "errors": ["Division par 3 au lieu de 10"],
+    "good_points": ["Produits valeur × effectif corrects"],
+    "correction": "Moyenne = 113 / 10 = 11,3",
+    "score": "12/20",
+    "next_steps": ["Revoir la définition de l'effectif total"],
+    "personalized_tips": ["Additionne toujours les effectifs avant de diviser"],
+}
+
+
+def estimate_tokens(contents: Any) -> int:
+    """Estimation locale: ~4 caractères par token, IMAGE_TOKENS par image"""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, str):
+            tokens += max(1, len(part) // 4)
+        elif isinstance(part, dict) and "parts" in part:
+            tokens += estimate_tokens(part["parts"])
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+class StubUsage:
+    """Équivalent minimal de usage_metadata"""
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class StubResponse:
+    def __init__(self, text: str, usage: StubUsage):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class StubModel:
+    """Modèle factice: réponse fixe, latence = base + préremplissage + décodage"""
+
+    def __init__(
+        self,
+        respond: Callable[[Any], str],
+        base_latency: float = 0.4,
+        prefill_tokens_per_s: float = 20000.0,
+        decode_tokens_per_s: float = 250.0,
+        time_scale: float = 0.1,
+    ):
+        self.respond = respond
+        self.base_latency = base_latency
+        self.prefill_tokens_per_s = prefill_tokens_per_s
+        self.decode_tokens_per_s = decode_tokens_per_s
+        self.time_scale = time_scale
+
+    def _prepare(self, contents: Any):
+        text = self.respond(contents)
+        usage = StubUsage(estimate_tokens(contents), estimate_tokens(text))
+        latency = (
+            self.base_latency
+            + usage.prompt_token_count / self.prefill_tokens_per_s
+            + usage.candidates_token_count / self.decode_tokens_per_s
+        )
+        return StubResponse(text, usage), latency * self.time_scale
+
+    def generate_content(self, contents: Any, **kwargs) -> Any:
+        response, delay = self._prepare(contents)
+        timeout = self._timeout(kwargs)
+        time.sleep(min(delay, timeout))
+        response = self._finish(response, delay, timeout)
+        # Streaming: un seul fragment portant le texte et l'usage
+        return iter([response]) if kwargs.get("stream") else response
+
+    async def generate_content_async(self, contents: Any, **kwargs) -> StubResponse:
+        response, delay = self._prepare(contents)
+        timeout = self._timeout(kwargs)
+        await asyncio.sleep(min(delay, timeout))
+        return self._finish(response, delay, timeout)
+
+    @staticmethod
+    def _timeout(kwargs: Dict[str, Any]) -> float:
+        """Délai passé via request_options, comme le SDK"""
+        return (kwargs.get("request_options") or {}).get("timeout", float("inf"))
+
+    @staticmethod
+    def _finish(response: StubResponse, delay: float, timeout: float) -> StubResponse:
+        if timeout < delay:
+            from google.api_core import exceptions as api_exceptions
+
+            raise api_exceptions.DeadlineExceeded("Deadline Exceeded")
+        return response
+
+
+class TailLatencyModel(StubModel):
+    """Modèle factice dont une fraction des réponses est très lente (queue de latence)"""
+
+    def __init__(
+        self,
+        respond: Callable[[Any], str],
+        tail_rate: float = 0.1,
+        tail_factor: float = 10.0,
+        seed: int = 0,
+        **kwargs,
+    ):
+        super().__init__(respond, **kwargs)
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _prepare(self, contents: Any):
+        response, delay = super()._prepare(contents)
+        with self._random_lock:
+            slow = self._random.random() < self.tail_rate
+        return response, delay * self.tail_factor if slow else delay
+
+
+class RecordingModel:
+    """Enveloppe un modèle et enregistre latence et tokens de chaque appel"""
+
+    def __init__(self, model: Any):
+        self.model = model
+        self.calls: List[Dict[str, Any]] = []
+
+    def generate_content(self, contents: Any, **kwargs) -> Any:
+        start = time.perf_counter()
+        response = self.model.generate_content(contents, **kwargs)
+        if kwargs.get("stream"):
+            self.calls.append(
+                {
+                    "latency": time.perf_counter() - start,
+                    "prompt_tokens": estimate_tokens(contents),
+                    "output_tokens": 0,
+                    "stream": True,
+                }
+            )
+            return response
+        usage = getattr(response, "usage_metadata", None)
+        self.calls.append(
+            {
+                "latency": time.perf_counter() - start,
+                "prompt_tokens": getattr(usage, "prompt_token_count", 0)
+                or estimate_tokens(contents),
+                "output_tokens": getattr(usage, "candidates_token_count", 0)
+                or estimate_tokens(response.text),
+            }
+        )
+        return response
+
+    async def generate_content_async(self, contents: Any, **kwargs) -> Any:
+        start = time.perf_counter()
+        response = await self.model.generate_content_async(contents, **kwargs)
+        self.calls.append(
+            {
+                "latency": time.perf_counter() - start,
+                "prompt_tokens": estimate_tokens(contents),
+                "output_tokens": estimate_tokens(response.text),
+            }
+        )
+        return response
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+
+class QuotaStubModel:
+    """Modèle factice qui refuse (429) au-delà de limit requêtes par fenêtre glissante"""
+
+    def __init__(self, model: Any, limit: int, window: float, reject_latency: float):
+        self.model = model
+        self.limit = limit
+        self.window = window
+        self.reject_latency = reject_latency
+        self._lock = threading.Lock()
+        self._accepted: deque = deque()
+        self.rejected = 0
+
+    def generate_content(self, contents: Any, **kwargs) -> Any:
+        from google.api_core import exceptions as api_exceptions
+
+        with self._lock:
+            now = time.monotonic()
+            while self._accepted and now - self._accepted[0] >= self.window:
+                self._accepted.popleft()
+            rejected = len(self._accepted) >= self.limit
+            if rejected:
+                self.rejected += 1
+                retry_in = self.window - (now - self._accepted[0])
+            else:
+                self._accepted.append(now)
+        if rejected:
+            # Un refus coûte tout de même un aller-retour réseau
+            time.sleep(self.reject_latency)
+            raise api_exceptions.ResourceExhausted(
+                f"Quota exceeded. Please retry in {retry_in:.3f}s."
+            )
+        return self.model.generate_content(contents, **kwargs)
+
+
+# Formulations d'une même erreur, telles que le modèle les écrit d'une copie à l'autre
+ERROR_PARAPHRASES = {
+    "frequence": [
+        "Tu as oublié de diviser par l'effectif total.",
+        "Il faut diviser l'effectif par l'effectif total pour obtenir la fréquence.",
+        "La fréquence s'obtient en divisant l'effectif par l'effectif total ({n}).",
+        "Attention : tu n'as pas divisé par l'effectif total.",
+        "Tu n'as pas divisé par l'effectif total de {n}.",
+    ],
+    "moyenne": [
+        "La moyenne doit être pondérée par les effectifs.",
+        "Tu as calculé une moyenne simple au lieu d'une moyenne pondérée par les effectifs.",
+        "Il fallait pondérer chaque valeur par son effectif pour la moyenne.",
+        "Moyenne non pondérée : chaque valeur doit être multipliée par son effectif.",
+    ],
+    "total": [
+        "Le total des effectifs est faux : {n} au lieu de {m}.",
+        "Erreur dans le total des effectifs ({n} au lieu de {m}).",
+        "Le total des effectifs n'est pas correct, il vaut {m}.",
+        "Total des effectifs incorrect.",
+    ],
+    "mediane": [
+        "Les valeurs n'ont pas été rangées dans l'ordre croissant avant de chercher la médiane.",
+        "Pour la médiane, il faut d'abord ranger les valeurs dans l'ordre croissant.",
+        "Tu as oublié de ranger les valeurs dans l'ordre croissant pour trouver la médiane.",
+    ],
+    "etendue": [
+        "L'étendue est la différence entre la plus grande et la plus petite valeur.",
+        "Erreur d'étendue : il faut soustraire la plus petite valeur à la plus grande.",
+        "Étendue fausse : plus grande valeur moins plus petite valeur.",
+    ],
+    "arrondi": [
+        "Arrondi incorrect au centième.",
+        "Le résultat doit être arrondi au centième.",
+        "Pense à arrondir au centième près.",
+    ],
+    "unite": [
+        "Tu as oublié l'unité dans ta réponse.",
+        "Il manque l'unité (cm) dans le résultat.",
+        "Pense à indiquer l'unité.",
+    ],
+    "pourcentage": [
+        "La fréquence en pourcentage doit être multipliée par {n}.",
+        "Pour obtenir un pourcentage, multiplie la fréquence par 100.",
+        "Tu n'as pas converti la fréquence en pourcentage.",
+    ],
+}
+
+def make_client(live: bool, respond: Callable[[Any], str], time_scale: float):
+    """Crée un GeminiClient branché sur le vrai modèle (--live) ou sur un StubModel"""
+    from gemini_client import GeminiClient
+
+    client = GeminiClient(
+        api_key=None if live else "benchmark",
+        enable_cache=False,
+        probe_models=live,
+    )
+    if not live:
+        client.model = StubModel(respond, time_scale=time_scale)
+    client.model = RecordingModel(client.model)
+    return client
+
+
+def sample_copy_image() -> Image.Image:
+    """Image synthétique d'une copie (utilisée si aucune photo n'est fournie)"""
+    image = Image.new("RGB", (1200, 1600), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(["10×2=20", "11×3=33", "12×5=60", "113/3=37,7"]):
+        draw.text((100, 150 + 80 * i), line, fill="black")
+    return image
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "mean": round(statistics.mean(ordered), 4),
+        "p50": round(ordered[len(ordered) // 2], 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+# Réponses de modèle mal formées observées en pratique, avec le résultat attendu
+_SAMPLE_JSON = json.dumps(SAMPLE_GRADING_RESPONSE, ensure_ascii=False)
+_SAMPLE_PRETTY = json.dumps(SAMPLE_GRADING_RESPONSE, ensure_ascii=False, indent=2)
+PARSE_CORPUS = [
+    ("json_brut", _SAMPLE_JSON, "json"),
+    ("bloc_json", f"```json\n{_SAMPLE_PRETTY}\n```", "json"),
+    ("bloc_sans_langage", f"```\n{_SAMPLE_PRETTY}\n```", "json"),
+    ("texte_autour", f"Voici mon analyse :\n{_SAMPLE_PRETTY}\nBon courage !", "json"),
+    ("imbrication_profonde", '{"a": {"b": {"c": {"d": [1, 2, 3]}}}, "score": "15/20"}', "json"),
+    ("accolades_dans_chaine", '{"correction": "Ensemble {10; 11; 12}", "score": "18/20"}', "json"),
+    ("retour_ligne_brut", '{"feedback": "Ligne 1\nLigne 2", "score": "10/20"}', "json"),
+    ("virgule_finale", '{"errors": ["a", "b",], "score": "8/20",}', "repaired"),
+    ("quotes_simples", "{'feedback': 'Bien', 'errors': [], 'valid': True}", "repaired"),
+    ("tronque_chaine", _SAMPLE_JSON[: len(_SAMPLE_JSON) // 2], "repaired"),
+    ("tronque_liste", '{"score": "12/20", "errors": ["Division", "Arrondi"', "repaired"),
+    ("tronque_cle", '{"score": "12/20", "feedback": "Bien", "errors":', "repaired"),
+    ("tronque_bloc", f"```json\n{_SAMPLE_PRETTY[:-40]}", "repaired"),
+    ("texte_seul", "Erreur: division par 3 au lieu de 10\nBon: produits corrects", "failed"),
+    ("vide", "", "failed"),
+    ("liste_au_lieu_objet", '["a", "b"]', "failed"),
+]
+
+
+def legacy_parse(response_text: str) -> Optional[Dict[str, Any]]:
+    """Parseur historique des méthodes _parse_* (regex à deux niveaux d'accolades)"""
+    import re
+
+    json_match = re.search(r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", response_text, re.DOTALL)
+    if not json_match:
+        return None
+    try:
+        return json.loads(json_match.group())
+    except json.JSONDecodeError:
+        return None
+
+
+def distinct_errors(rng: random.Random, n: int) -> List[str]:
+    """Erreurs sans rapport entre elles (mots tirés au hasard): aucune n'est regroupée"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        " ".join(
+            "".join(rng.choice(letters) for _ in range(rng.randint(5, 9))) for _ in range(5)
+        ).capitalize()
+        for _ in range(n)
+    ]
+
+
+def legacy_profile_queries(profile: Any) -> Dict[str, Any]:
+    """Requêtes du profil recalculées comme avant, en parcourant tout l'historique"""
+    from collections import Counter, defaultdict
+
+    all_errors = [error for errors in profile.errors_by_type.values() for error in errors]
+    scores = profile.scores
+    type_scores = defaultdict(list)
+    for result in profile.history:
+        type_scores[result["exercise_type"]].append(result["score"])
+
+    def difficulty(avg: float) -> str:
+        return "difficile" if avg >= 16 else "moyen" if avg >= 12 else "facile"
+
+    recent = scores[-5:]
+    older = sum(scores[:-3]) / (len(scores) - 3) if len(scores) > 3 else sum(scores[-3:]) / 3
+    trend_delta = sum(scores[-3:]) / 3 - older
+    return {
+        "common_errors": [e for e, n in Counter(all_errors).most_common(5) if n >= 2],
+        "average_score": round(sum(scores) / len(scores), 1),
+        "recommended_difficulty": difficulty(sum(recent) / len(recent)),
+        "weak_areas": [
+            t for t, values in type_scores.items() if sum(values) / len(values) < 12 and len(values) >= 2
+        ],
+        "type_difficulty": {t: difficulty(sum(v) / len(v)) for t, v in type_scores.items()},
+        "trend": "amélioration" if trend_delta > 1 else "baisse" if trend_delta < -1 else "stable",
+        "best_score": max(scores),
+    }
+
+
+def bench_profile(args: argparse.Namespace):
+    """Latence des requêtes du profil élève selon la taille de l'historique (10 à 100 000)"""
+    from exercise_engine import EXERCISE_TYPES
+    from student_profile import StudentProfile
+
+    rng = random.Random(0)
+    error_pool = distinct_errors(rng, 200)
+    sizes = [10, 100, 1000, 10000, 100000]
+    iterations = max(1, args.runs) * 200
+    results: Dict[str, Any] = {}
+    mismatches = []
+
+    profile = StudentProfile()
+    for size in sizes:
+        add_start = time.perf_counter()
+        added = size - len(profile.history)
+        for _ in range(added):
+            profile.add_result(
+                rng.choice(EXERCISE_TYPES),
+                rng.choice(["facile", "moyen", "difficile"]),
+                {
+                    "score": f"{rng.randint(4, 20)}/20",
+                    # Quelques erreurs fréquentes, beaucoup d'erreurs rares
+                    "errors": [
+                        error_pool[int(rng.paretovariate(1.2)) % len(error_pool)]
+                        for _ in range(rng.randint(0, 2))
+                    ],
+                    "good_points": ["Tableau juste"] if rng.random() < 0.5 else [],
+                },
+                {},
+            )
+        add_us = (time.perf_counter() - add_start) / added * 1e6
+
+        def queries():
+            profile.get_profile()
+            profile.get_progress_summary()
+            profile.get_personalized_difficulty("moyenne")
+            profile.get_recommended_exercise_type()
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            queries()
+        query_us = (time.perf_counter() - start) / iterations * 1e6
+
+        # Ancienne représentation (listes de dicts) reconstruite hors chronométrage
+        snapshot = SimpleNamespace(
+            history=list(profile.history),
+            scores=list(profile.scores),
+            errors_by_type=profile.errors_by_type,
+        )
+        legacy_iterations = max(1, iterations * 10 // size)
+        start = time.perf_counter()
+        for _ in range(legacy_iterations):
+            legacy = legacy_profile_queries(snapshot)
+        legacy_us = (time.perf_counter() - start) / legacy_iterations * 1e6
+
+        current = profile.get_profile()
+        summary = profile.get_progress_summary()
+        observed = {
+            "common_errors": current["common_errors"],
+            "average_score": current["average_score"],
+            "recommended_difficulty": current["recommended_difficulty"],
+            "weak_areas": current["weak_areas"],
+            "type_difficulty": {
+                t: profile.get_personalized_difficulty(t) for t in legacy["type_difficulty"]
+            },
+            "trend": summary["trend"],
+            "best_score": summary["best_score"],
+        }
+        for key, value in legacy.items():
+            if observed[key] != value:
+                mismatches.append(f"{size} entrées, {key}: {observed[key]} au lieu de {value}")
+
+        results[str(size)] = {
+            "add_result_us": round(add_us, 2),
+            "queries_us": round(query_us, 2),
+            "full_scan_us": round(legacy_us, 2),
+        }
+
+    print(json.dumps(results, indent=2))
+
+    if mismatches:
+        print("\n".join(mismatches), file=sys.stderr)
+        sys.exit(1)
+
+
+def bench_store(args: argparse.Namespace):
+    """Profils persistants (SQLite): écritures unitaires vs groupées, relecture et cache"""
+    import tempfile
+
+    from exercise_engine import EXERCISE_TYPES
+    from profile_store import ProfileStore
+    from student_profile import StudentProfile
+
+    rng = random.Random(0)
+    error_pool = distinct_errors(rng, 200)
+    codes = ["total", "effectif", "frequence", "moyenne", "calcul"]
+    students = [f"eleve{i}" for i in range(20)]
+    per_student = max(1, args.runs) * 100
+    results: Dict[str, Any] = {}
+    mismatches = []
+
+    def feedback() -> Dict[str, Any]:
+        return {
+            "score": f"{rng.randint(4, 20)}/20",
+            "errors": [
+                error_pool[int(rng.paretovariate(1.2)) % len(error_pool)]
+                for _ in range(rng.randint(0, 2))
+            ],
+            "good_points": ["Tableau juste"] if rng.random() < 0.5 else [],
+            "error_types": rng.sample(codes, rng.randint(0, 2)),
+        }
+
+    # Résultats tirés à l'avance: seules les écritures sont chronométrées
+    results_in = [
+        (
+            student,
+            rng.choice(EXERCISE_TYPES),
+            rng.choice(["facile", "moyen", "difficile"]),
+            feedback(),
+        )
+        for _ in range(per_student)
+        for student in students
+    ]
+    reference = {student: StudentProfile() for student in students}
+    for student, exercise_type, difficulty, result in results_in:
+        reference[student].add_result(exercise_type, difficulty, result, {})
+
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, batch_size in (("per_row", 1), ("batched", 50)):
+            store = ProfileStore(
+                os.path.join(directory, f"{mode}.db"), batch_size=batch_size, flush_interval=0
+            )
+            profiles = {student: store.get_profile(student) for student in students}
+            start = time.perf_counter()
+            for student, exercise_type, difficulty, result in results_in:
+                profiles[student].add_result(exercise_type, difficulty, result, {})
+            store.flush()
+            elapsed = time.perf_counter() - start
+            results[f"writes_{mode}_per_s"] = round(len(results_in) / elapsed)
+            results[f"flushes_{mode}"] = store.get_stats()["flushes"]
+            store.close()
+
+        # Relecture à froid (agrégats en SQL) puis depuis le cache
+        path = os.path.join(directory, "batched.db")
+        store = ProfileStore(path, flush_interval=0, cache_size=len(students))
+        start = time.perf_counter()
+        reloaded = {student: store.get_profile(student) for student in students}
+        cold_ms = (time.perf_counter() - start) / len(students) * 1000
+        iterations = 1000
+        start = time.perf_counter()
+        for i in range(iterations):
+            store.get_profile(students[i % len(students)])
+        hit_us = (time.perf_counter() - start) / iterations * 1e6
+
+        for student, profile in reloaded.items():
+            expected = reference[student]
+            for name, observed, wanted in (
+                ("get_profile", profile.get_profile(), expected.get_profile()),
+                ("progress", profile.get_progress_summary(), expected.get_progress_summary()),
+                (
+                    "difficulty",
+                    profile.get_recommended_exercise_type(),
+                    expected.get_recommended_exercise_type(),
+                ),
+            ):
+                if observed != wanted:
+                    mismatches.append(f"{student}, {name}: {observed} au lieu de {wanted}")
+
+        # Historique détaillé: lu seulement au premier accès
+        start = time.perf_counter()
+        history = reloaded[students[0]].history
+        history_ms = (time.perf_counter() - start) * 1000
+        expected_history = reference[students[0]].history
+        if [(r["score"], r["errors"], r["error_types"]) for r in history] != [
+            (r["score"], r["errors"], r["error_types"]) for r in expected_history
+        ]:
+            mismatches.append(f"{students[0]}: historique relu différent")
+
+        results.update(
+            {
+                "entries_per_student": per_student,
+                "cold_load_ms": round(cold_ms, 3),
+                "cache_hit_us": round(hit_us, 2),
+                "history_load_ms": round(history_ms, 3),
+                "cache": {
+                    key: store.get_stats()[key] for key in ("cache_hits", "cache_misses")
+                },
+            }
+        )
+        store.close()
+
+    print(json.dumps(results, indent=2))
+
+    if mismatches:
+        print("\n".join(mismatches), file=sys.stderr)
+        sys.exit(1)
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Taille mémoire d'un objet et de ce qu'il contient (objets partagés comptés une fois)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def bench_history(args: argparse.Namespace):
+    """Mémoire de l'historique par entrée: listes de dicts vs colonnes compactes"""
+    from collections import defaultdict
+
+    from exercise_engine import EXERCISE_TYPES
+    from student_profile import StudentProfile
+
+    rng = random.Random(0)
+    error_pool = [f"Erreur type {i}: la fréquence n'est pas divisée par l'effectif total" for i in range(200)]
+    codes = ["total", "effectif", "frequence", "moyenne", "calcul"]
+    sizes = [1000, 10000, 100000]
+    results: Dict[str, Any] = {}
+    mismatches = []
+
+    profile = StudentProfile()
+    legacy: Dict[str, Any] = {
+        "history": [],
+        "scores": [],
+        "errors_by_type": defaultdict(list),
+        "difficulty_progression": defaultdict(list),
+    }
+    for size in sizes:
+        for _ in range(size - len(legacy["history"])):
+            exercise_type = rng.choice(EXERCISE_TYPES)
+            difficulty = rng.choice(["facile", "moyen", "difficile"])
+            # Chaque réponse du modèle est un nouveau JSON: chaînes non partagées
+            feedback = json.loads(
+                json.dumps(
+                    {
+                        "score": f"{rng.randint(4, 20)}/20",
+                        "errors": [
+                            error_pool[int(rng.paretovariate(1.2)) % len(error_pool)]
+                            for _ in range(rng.randint(0, 2))
+                        ],
+                        "good_points": ["Tableau juste"] if rng.random() < 0.5 else [],
+                        "error_types": rng.sample(codes, rng.randint(0, 2)),
+                    }
+                )
+            )
+            profile.add_result(exercise_type, difficulty, feedback, {})
+
+            # Ancienne représentation: un dict par résultat et trois copies partielles
+            score = float(feedback["score"].split("/")[0])
+            legacy["history"].append(
+                {
+                    "exercise_type": exercise_type,
+                    "difficulty": difficulty,
+                    "score": score,
+                    "errors": feedback["errors"],
+                    "good_points": feedback["good_points"],
+                    "error_types": feedback["error_types"],
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+            )
+            legacy["scores"].append(score)
+            legacy["errors_by_type"][exercise_type].extend(feedback["errors"])
+            legacy["difficulty_progression"][exercise_type].append(difficulty)
+
+        legacy_bytes = deep_sizeof(legacy) / size
+        compact_bytes = profile.history.nbytes() / size
+
+        # Adaptateur dict: mêmes résultats que l'ancienne liste
+        history = profile.history
+        for i in rng.sample(range(size), 200):
+            observed = {k: v for k, v in history[i].items() if k != "timestamp"}
+            expected = {k: v for k, v in legacy["history"][i].items() if k != "timestamp"}
+            if observed != expected:
+                mismatches.append(f"{size} entrées, entrée {i}: {observed} au lieu de {expected}")
+        if dict(profile.errors_by_type) != dict(legacy["errors_by_type"]):
+            mismatches.append(f"{size} entrées: errors_by_type différent")
+
+        start = time.perf_counter()
+        for i in range(1000):
+            history[i % size]
+        read_us = (time.perf_counter() - start) / 1000 * 1e6
+
+        results[str(size)] = {
+            "legacy_bytes_per_entry": round(legacy_bytes, 1),
+            "compact_bytes_per_entry": round(compact_bytes, 1),
+            "saved_bytes_per_entry": round(legacy_bytes - compact_bytes, 1),
+            "ratio": round(legacy_bytes / compact_bytes, 1),
+            "entry_read_us": round(read_us, 2),
+        }
+
+    print(json.dumps(results, indent=2))
+
+    if mismatches:
+        print("\n".join(mismatches), file=sys.stderr)
+        sys.exit(1)
+
+
+def bench_clusters(args: argparse.Namespace):
+    """Regroupement des erreurs reformulées: qualité des groupes et coût d'une affectation"""
+    from collections import Counter
+
+    import numpy as np
+
+    from text_clusters import TextClusterIndex, minhash_signature, normalize_text
+
+    rng = random.Random(0)
+    results: Dict[str, Any] = {}
+    mismatches = []
+
+    # Erreurs d'une classe: une famille tirée au hasard, formulée au hasard
+    families = list(ERROR_PARAPHRASES)
+    stream = []
+    for _ in range(max(1, args.runs) * 200):
+        family = families[min(int(rng.paretovariate(1.0)) - 1, len(families) - 1)]
+        text = rng.choice(ERROR_PARAPHRASES[family])
+        stream.append((family, text.format(n=rng.randint(12, 30), m=rng.randint(12, 30))))
+
+    index = TextClusterIndex()
+    members: Dict[int, set] = {}
+    for family, text in stream:
+        members.setdefault(index.add(text), set()).add(family)
+    impure = [sorted(families_) for families_ in members.values() if len(families_) > 1]
+    if impure:
+        mismatches.append(f"Groupes mélangeant plusieurs erreurs: {impure}")
+
+    family_counts = Counter(family for family, _ in stream)
+    top_family_share = family_counts.most_common(1)[0][1] / len(stream)
+    top_text_share = Counter(text for _, text in stream).most_common(1)[0][1] / len(stream)
+    results["quality"] = {
+        "errors": len(stream),
+        "families": len(family_counts),
+        "distinct_texts": len({text for _, text in stream}),
+        "clusters": len(index),
+        "impure_clusters": len(impure),
+        # Part des erreurs comptées dans le premier groupe: exact vs regroupé
+        "top_share_exact": round(top_text_share, 3),
+        "top_share_clustered": round(index.top(1)[0]["count"] / len(stream), 3),
+        "top_share_expected": round(top_family_share, 3),
+        "top_clusters": index.top(3),
+    }
+
+    # Coût d'affectation d'un texte nouveau selon le nombre de groupes existants
+    scaling = {}
+    for size in (100, 1000, 10000):
+        index = TextClusterIndex()
+        signatures = []
+        for text in distinct_errors(rng, size):
+            index.add(text)
+            signatures.append(minhash_signature(normalize_text(text)))
+        matrix = np.array(signatures)
+        probes = distinct_errors(rng, 200)
+
+        start = time.perf_counter()
+        for text in probes:
+            index.add(text)
+        lsh_us = (time.perf_counter() - start) / len(probes) * 1e6
+
+        # Référence: comparaison avec la signature de chaque groupe
+        start = time.perf_counter()
+        for text in probes:
+            signature = minhash_signature(normalize_text(text))
+            (matrix == signature).mean(axis=1).max()
+        scan_us = (time.perf_counter() - start) / len(probes) * 1e6
+        scaling[str(size)] = {"lsh_add_us": round(lsh_us, 1), "full_scan_us": round(scan_us, 1)}
+    results["assignment"] = scaling
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if mismatches:
+        print("\n".join(mismatches), file=sys.stderr)
+        sys.exit(1)
+
+
+def bench_breaker(args: argparse.Namespace):
+    """Latence de generate() quand Gemini est en panne: sans vs avec disjoncteur"""
+    from exercise_generator import ExerciseGenerator
+    from google.api_core import exceptions as api_exceptions
+
+    def failing(contents):
+        time.sleep(2.0 * args.time_scale)
+        raise api_exceptions.InternalServerError("Backend indisponible")
+
+    examples = {"valid": True, "examples": [], "common_characteristics": {}}
+    results = {}
+
+    for label, threshold in (("sans_disjoncteur", 10**9), ("avec_disjoncteur", 3)):
+        client = make_client(False, failing, args.time_scale)
+        client.rate_limiter.max_retries = 0
+        generator = ExerciseGenerator(
+            client, use_pool=False, breaker_failure_threshold=threshold
+        )
+        latencies = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            generator.generate("moyenne", examples_analysis=examples)
+            latencies.append((time.perf_counter() - start) * 1000)
+        stats = generator.get_breaker_stats()
+        results[label] = {
+            "latency_ms": summarize(latencies),
+            "short_circuited": sum(s["short_circuited"] for s in stats.values()),
+            "states": {operation: s["state"] for operation, s in stats.items()},
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+def bench_deadline(args: argparse.Namespace):
+    """Latence de generate() quand Gemini ne répond plus: sans vs avec budget de temps"""
+    from exercise_generator import ExerciseGenerator
+
+    hung_latency = 60.0  # secondes simulées (multipliées par --time-scale)
+    budget = args.deadline * args.time_scale
+    examples = {"valid": True, "examples": [], "common_characteristics": {}}
+    results = {}
+
+    for label, deadline in (("sans_budget", None), ("avec_budget", budget)):
+        client = make_client(False, lambda contents: "{}", args.time_scale)
+        client.model = StubModel(
+            lambda contents: "{}", base_latency=hung_latency, time_scale=args.time_scale
+        )
+        client.rate_limiter.max_retries = 0
+        generator = ExerciseGenerator(
+            client,
+            use_pool=False,
+            breaker_failure_threshold=10**9,
+            min_stage_budget=0.1 * args.time_scale,
+        )
+        latencies = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            generator.generate("moyenne", examples_analysis=examples, deadline=deadline)
+            latencies.append(time.perf_counter() - start)
+        results[label] = {
+            "budget_s": deadline,
+            "latency_s": summarize(latencies),
+            "deadline_stats": generator.get_deadline_stats(),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+def bench_engine(args: argparse.Namespace):
+    """Moteur local: exercices par seconde, variété des énoncés et reproductibilité"""
+    from exercise_engine import DIFFICULTIES, EXERCISE_TYPES, ExerciseEngine
+
+    count = max(1, args.runs) * 1000
+    engine = ExerciseEngine(seed=0)
+    results: Dict[str, Any] = {}
+    failures = []
+
+    for exercise_type in EXERCISE_TYPES:
+        entry: Dict[str, Any] = {}
+        for difficulty in DIFFICULTIES:
+            start = time.perf_counter()
+            exercises = [engine.generate(exercise_type, difficulty) for _ in range(count)]
+            elapsed = time.perf_counter() - start
+            entry[difficulty] = {
+                "exercises_per_s": round(count / elapsed),
+                "distinct_questions": len({exercise["question"] for exercise in exercises}),
+            }
+            # La graine conservée redonne exactement le même exercice
+            sample = exercises[-1]
+            if engine.generate(exercise_type, difficulty, sample["exercise_data"]["seed"]) != sample:
+                failures.append(f"{exercise_type}/{difficulty}: graine non reproductible")
+        results[exercise_type] = entry
+
+    results["exercises_per_type"] = count
+    print(json.dumps(results, indent=2))
+
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+def model_style_exercise(exercise: Dict[str, Any]) -> Dict[str, Any]:
+    """Exercice du moteur local réécrit au format JSON demandé à Gemini"""
+    import numpy as np
+
+    data = exercise["exercise_data"]
+    response: Dict[str, Any] = {"question": exercise["question"], "type_name": exercise["type_name"]}
+    if exercise["type"] == "effectif":
+        response["data"] = [str(value) for value in data["values"]]
+        response["expected_answer"] = {
+            "tableau": {str(k): n for k, n in data["expected_effectifs"].items()},
+            "total": data["expected_total"],
+        }
+    elif exercise["type"] == "frequence":
+        response["data"] = {str(k): n for k, n in data["effectifs"].items()}
+        response["total"] = data["total"]
+        response["expected_answer"] = {
+            "frequences": {str(k): f for k, f in data["expected_frequences"].items()},
+            "format": data["format"],
+        }
+    elif exercise["type"] == "moyenne":
+        response["data"] = {str(k): n for k, n in data["data"].items()}
+        response["expected_answer"] = {"moyenne": data["expected_mean"]}
+    else:
+        series = np.array(data["data"])
+        response["data"] = data["data"]
+        response["expected_answer"] = {
+            "reponse": "voir calculs",
+            "moyenne": round(float(series.mean()), 2),
+            "mediane": float(np.median(series)),
+            "etendue": int(series.max() - series.min()),
+        }
+    return response
+
+
+def corrupt_exercise(response: Dict[str, Any], exercise_type: str, rng: random.Random) -> str:
+    """Introduit une erreur typique d'un modèle; retourne le résultat attendu de la vérification"""
+    expected = response["expected_answer"]
+    roll = rng.random()
+    if roll < 0.1:
+        # Données laissées en texte libre: réponse gardée, non vérifiée
+        response["data"] = "voir l'énoncé"
+        return "unverified"
+    if roll < 0.2:
+        del response["data"]
+        return "rejected"
+    if exercise_type == "effectif":
+        key = rng.choice(list(expected["tableau"]))
+        expected["tableau"][key] += 1
+        expected["total"] += 1
+    elif exercise_type == "frequence":
+        response["total"] += 1
+        expected["frequences"] = {
+            k: round(n / response["total"] * 100, 1) for k, n in response["data"].items()
+        }
+        expected["format"] = "pourcentage"
+    elif exercise_type == "moyenne":
+        # Division par le nombre de valeurs au lieu de l'effectif total
+        values = [float(k) * n for k, n in response["data"].items()]
+        expected["moyenne"] = round(sum(values) / len(values), 2)
+    else:
+        # Médiane prise sur la série non triée
+        series = response["data"]
+        expected["mediane"] = series[len(series) // 2]
+        if expected["mediane"] == sorted(series)[len(series) // 2]:
+            expected["mediane"] += 1
+    return "repaired"
+
+
+def bench_verify(args: argparse.Namespace):
+    """Vérification locale des exercices générés: taux pass/repaired/rejected/unverified et coût"""
+    from exercise_engine import EXERCISE_TYPES, ExerciseEngine
+
+    client = make_client(False, lambda contents: "", args.time_scale)
+    engine = ExerciseEngine(seed=0)
+    rng = random.Random(0)
+    count = max(1, args.runs) * 200
+
+    corpus = []
+    for i in range(count):
+        exercise_type = EXERCISE_TYPES[i % len(EXERCISE_TYPES)]
+        response = model_style_exercise(engine.generate(exercise_type, "moyen"))
+        expected = "pass"
+        if rng.random() < 0.3:
+            expected = corrupt_exercise(response, exercise_type, rng)
+        corpus.append((exercise_type, json.dumps(response, ensure_ascii=False), expected))
+
+    mismatches = []
+    start = time.perf_counter()
+    for exercise_type, text, expected in corpus:
+        with client.telemetry.track("generate_exercise"):
+            exercise = client._parse_exercise(text, exercise_type)
+        status = "rejected" if exercise.get("error") else exercise["verification"]["status"]
+        if status != expected:
+            mismatches.append(f"{exercise_type}: attendu {expected}, obtenu {status}")
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "exercises": count,
+        "verification": client.get_verification_stats(),
+        "us_per_exercise": round(elapsed / count * 1e6, 1),
+        "telemetry": client.get_telemetry_summary()["generate_exercise"]["verification"],
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if mismatches:
+        print("\n".join(mismatches[:20]), file=sys.stderr)
+        sys.exit(1)
+
+
+def bench_grading_modes(args: argparse.Namespace):
+    """Compare les modes two_pass et single_pass: latence et tokens par copie"""
+    image = Image.open(args.image) if args.image else sample_copy_image()
+    exercise = {
+        "type": "moyenne",
+        "type_name": "Moyenne pondérée",
+        "question": "Calcule la moyenne pondérée de la série 10 (2), 11 (3), 12 (5).",
+        "expected_answer": "Moyenne = 11.3",
+    }
+    results = {}
+
+    for mode in ("two_pass", "single_pass"):
+        client = make_client(
+            args.live,
+            lambda contents: json.dumps(SAMPLE_GRADING_RESPONSE, ensure_ascii=False),
+            args.time_scale,
+        )
+        latencies = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            feedback = client.analyze_handwritten_solution(
+                image=image,
+                exercise_type=exercise["type"],
+                exercise_data=exercise,
+                question=exercise["question"],
+                grading_mode=mode,
+            )
+            latencies.append(time.perf_counter() - start)
+            if feedback.get("error"):
+                print(f"[{mode}] {feedback['error']}", file=sys.stderr)
+
+        calls = client.model.calls
+        results[mode] = {
+            "latency_s": summarize(latencies),
+            "calls_per_copy": len(calls) / args.runs,
+            "prompt_tokens_per_copy": sum(c["prompt_tokens"] for c in calls) / args.runs,
+            "output_tokens_per_copy": sum(c["output_tokens"] for c in calls) / args.runs,
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+def typed_answer(
+    solution: Dict[str, Any], rng: random.Random, mistake: bool
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Réponse saisie juste, ou avec une erreur typique; retourne aussi le type d'erreur attendu"""
+
+    def frequency(value: Any, format_type: str) -> str:
+        if format_type == "fraction":
+            return f"{value.numerator}/{value.denominator}"
+        scale = 100 if format_type == "pourcentage" else 1
+        return str(round(float(value) * scale, 3)).replace(".", ",")
+
+    answer: Dict[str, Any] = {}
+    for field in solution["asked"]:
+        expected = solution[field]
+        if field == "effectifs":
+            answer[field] = "\n".join(f"{key}: {n}" for key, n in expected.items())
+        elif field == "frequences":
+            answer[field] = "\n".join(
+                f"{key}: {frequency(value, solution['format'])}" for key, value in expected.items()
+            )
+        else:
+            answer[field] = str(expected[0] if isinstance(expected, list) else expected)
+    if not mistake:
+        return answer, None
+
+    field = rng.choice(solution["asked"])
+    if field == "effectifs":
+        key = rng.choice(list(solution["effectifs"]))
+        answer[field] = answer[field].replace(
+            f"{key}: {solution['effectifs'][key]}", f"{key}: {solution['effectifs'][key] + 1}"
+        )
+        return answer, "effectif_faux"
+    if field == "frequences":
+        # Pourcentage au lieu de décimal (ou l'inverse)
+        wrong = "decimal" if solution["format"] == "pourcentage" else "pourcentage"
+        answer[field] = "\n".join(
+            f"{key}: {frequency(value, wrong)}" for key, value in solution["frequences"].items()
+        )
+        return answer, "format_frequence"
+    if field == "moyenne":
+        code = rng.choice(["moyenne_division_nombre_valeurs", "moyenne_non_ponderee"])
+        answer[field] = str(round(solution["mistakes"][code], 2))
+        if abs(solution["mistakes"][code] - solution["moyenne"]) <= 0.1:
+            return answer, None
+        return answer, code
+    if field == "total":
+        answer[field] = str(solution["total"] + 1)
+        return answer, "total_faux"
+    answer[field] = ""
+    return answer, "reponse_manquante"
+
+
+def bench_answers(args: argparse.Namespace):
+    """Correction locale des réponses saisies: débit en lot, latence et erreurs reconnues"""
+    from answer_grader import AnswerGrader, solution_for
+    from exercise_engine import EXERCISE_TYPES, ExerciseEngine
+
+    engine = ExerciseEngine(seed=0)
+    grader = AnswerGrader()
+    rng = random.Random(0)
+    count = max(1, args.runs) * 1000
+    results: Dict[str, Any] = {}
+
+    for exercise_type in EXERCISE_TYPES:
+        exercise = engine.generate(exercise_type, "moyen")
+        solution = solution_for(exercise)
+        cases = [typed_answer(solution, rng, mistake=i % 2 == 1) for i in range(count)]
+        answers = [answer for answer, _ in cases]
+
+        start = time.perf_counter()
+        feedbacks = grader.grade_batch(exercise, answers)
+        batch_elapsed = time.perf_counter() - start
+
+        latencies = []
+        for answer in answers[:500]:
+            start = time.perf_counter()
+            grader.grade(exercise, answer)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        # Réponse juste notée 20/20, erreur typique reconnue par son type
+        recognized = sum(
+            feedback["score"] == "20/20" if code is None else code in feedback["error_types"]
+            for feedback, (_, code) in zip(feedbacks, cases)
+        )
+        results[exercise_type] = {
+            "batch_answers_per_s": round(count / batch_elapsed),
+            "single_ms": summarize(latencies),
+            "recognized_rate": round(recognized / count, 3),
+        }
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+def bench_batch(args: argparse.Namespace):
+    """Débit de correction d'une classe (copies/minute) selon la concurrence"""
+    from batch_grader import BatchGrader
+
+    image = Image.open(args.image) if args.image else sample_copy_image()
+    exercise = {
+        "type": "moyenne",
+        "type_name": "Moyenne pondérée",
+        "question": "Calcule la moyenne pondérée de la série 10 (2), 11 (3), 12 (5).",
+        "expected_answer": "Moyenne = 11.3",
+    }
+    items = [
+        {"image": image, "exercise": exercise, "label": f"Élève {i + 1}"}
+        for i in range(args.copies)
+    ]
+    results = {}
+
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        client = make_client(
+            args.live,
+            lambda contents: json.dumps(SAMPLE_GRADING_RESPONSE, ensure_ascii=False),
+            args.time_scale,
+        )
+        grader = BatchGrader(client, max_concurrency=concurrency, grading_mode="single_pass")
+        summary = grader.grade(items)["summary"]
+        latencies = [call["latency"] for call in client.model.calls]
+        results[f"concurrency_{concurrency}"] = {
+            "copies_per_minute": summary["copies_per_minute"],
+            "elapsed_s": summary["elapsed_s"],
+            "succeeded": summary["succeeded"],
+            "failed": summary["failed"],
+            "timed_out": summary["timed_out"],
+            "model_latency_s": summarize(latencies) if latencies else {},
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+def bench_rate_limit(args: argparse.Namespace):
+    """Débit utile sous quota: appels directs vs limiteur (seaux à jetons + backoff)"""
+    from rate_limiter import RateLimiter
+
+    limit, window, workers, duration = 10, 1.0, 8, args.duration
+    sample_exercise = json.dumps(
+        {"question": "Calcule la moyenne.", "data": {"valeurs": [1, 2]}, "expected_answer": "1.5"}
+    )
+    limiters = {
+        "sans_limiteur": lambda: RateLimiter(max_retries=0),
+        "avec_limiteur": lambda: RateLimiter(
+            requests_per_minute=limit * 60 / window,
+            burst_seconds=window,
+            base_delay=0.05,
+            max_delay=window,
+        ),
+    }
+    results = {}
+
+    for label, make_limiter in limiters.items():
+        client = make_client(False, lambda contents: sample_exercise, args.time_scale)
+        quota_model = QuotaStubModel(
+            client.model, limit, window, reject_latency=0.2 * args.time_scale
+        )
+        client.model = quota_model
+        client.rate_limiter = make_limiter()
+        outcomes = {"ok": 0, "error": 0}
+        outcomes_lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker():
+            while time.monotonic() < deadline:
+                exercise = client.generate_exercise("moyenne", use_cache=False)
+                with outcomes_lock:
+                    outcomes["error" if exercise.get("error") else "ok"] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        stats = client.get_rate_limit_stats()
+        total = outcomes["ok"] + outcomes["error"]
+        results[label] = {
+            "successes_per_s": round(outcomes["ok"] / elapsed, 2),
+            "quota_per_s": limit / window,
+            "fallback_rate": round(outcomes["error"] / total, 3) if total else 0.0,
+            "rejected_by_server": quota_model.rejected,
+            "retries": stats["retries"],
+            "retry_hints": stats["retry_hints"],
+            "mean_wait_ms": stats["mean_wait_ms"],
+            "p95_wait_ms": stats["p95_wait_ms"],
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+def bench_startup(args: argparse.Namespace):
+    """Coût de démarrage par session: générateur dédié vs générateur partagé du processus"""
+    from exercise_generator import ExerciseGenerator, get_shared_generator
+    from gemini_client import GeminiClient
+
+    api_key = os.getenv("GEMINI_API_KEY") if args.live else "benchmark"
+    client_options = {"enable_cache": True, "probe_models": False}
+    # Réserve créée mais pas remplie: on mesure le démarrage, pas des appels Gemini
+    generator_options = {"use_pool": True, "pool_warm_keys": ()}
+
+    per_session, shared = [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        generator = ExerciseGenerator(
+            GeminiClient(api_key=api_key, **client_options), **generator_options
+        )
+        per_session.append(time.perf_counter() - start)
+        generator.pool.shutdown()
+
+    # Même fabrique que l'app (get_gemini_resources): créé au premier appel
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        get_shared_generator(api_key, client_options, **generator_options)
+        shared.append(time.perf_counter() - start)
+
+    print(
+        json.dumps(
+            {
+                "per_session_ms": summarize([t * 1000 for t in per_session]),
+                "shared_ms": summarize([t * 1000 for t in shared]),
+            },
+            indent=2,
+        )
+    )
+
+
+def bench_hedging(args: argparse.Namespace):
+    """Latence de queue (p95/p99) de generate_exercise: sans vs avec requêtes couvertes"""
+    from hedging import Hedger
+    from model_registry import ModelRegistry
+
+    sample_exercise = json.dumps(
+        {"question": "Calcule la moyenne.", "data": {"valeurs": [1, 2]}, "expected_answer": "1.5"}
+    )
+    warmup = 20
+    results = {}
+
+    for label, hedging in (("sans_couverture", False), ("avec_couverture", True)):
+        client = make_client(False, lambda contents: sample_exercise, args.time_scale)
+        client.registry = ModelRegistry(
+            {
+                name: TailLatencyModel(
+                    lambda contents: sample_exercise, seed=seed, time_scale=args.time_scale
+                )
+                for seed, name in enumerate(("modele-a", "modele-b"))
+            }
+        )
+        client.hedger = Hedger(min_samples=warmup // 2) if hedging else None
+
+        latencies = []
+        for index in range(warmup + args.runs):
+            start = time.perf_counter()
+            client.generate_exercise("moyenne", use_cache=False)
+            if index >= warmup:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        ordered = sorted(latencies)
+        results[label] = {
+            "latency_ms": {
+                "p50": round(ordered[len(ordered) // 2], 1),
+                "p95": round(ordered[int(0.95 * len(ordered))], 1),
+                "p99": round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))], 1),
+                "max": round(ordered[-1], 1),
+            },
+            "hedge_stats": client.get_hedge_stats(),
+        }
+        if client.hedger:
+            client.hedger.shutdown()
+
+    print(json.dumps(results, indent=2))
+
+
+def bench_parse(args: argparse.Namespace):
+    """Parseur historique vs parseur tolérant: taux de succès et coût par réponse"""
+    from structured_output import PARSE_FAILED, parse_json_object
+
+    iterations = max(1, args.runs) * 200
+    results: Dict[str, Any] = {"cases": {}}
+    legacy_ok = legacy_inner = tolerant_ok = 0
+    mismatches = []
+
+    for name, text, expected in PARSE_CORPUS:
+        legacy_data = legacy_parse(text)
+        data, outcome = parse_json_object(text)
+        # La regex peut « réussir » en ne renvoyant qu'un sous-objet (ex: une étape)
+        legacy = "failed" if legacy_data is None else "ok"
+        if legacy_data is not None and data is not None and not set(legacy_data) <= set(data):
+            legacy = "inner_object"
+            legacy_inner += 1
+        legacy_ok += legacy == "ok"
+        tolerant_ok += outcome != PARSE_FAILED
+        results["cases"][name] = {"legacy": legacy, "tolerant": outcome}
+        if outcome != expected:
+            mismatches.append(f"{name}: attendu {expected}, obtenu {outcome}")
+
+    for label, parse in (("legacy", legacy_parse), ("tolerant", parse_json_object)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for _, text, _ in PARSE_CORPUS:
+                parse(text)
+        elapsed = time.perf_counter() - start
+        results[f"{label}_us_per_parse"] = round(
+            elapsed / (iterations * len(PARSE_CORPUS)) * 1e6, 2
+        )
+
+    results["legacy_success_rate"] = round(legacy_ok / len(PARSE_CORPUS), 3)
+    results["legacy_inner_object_rate"] = round(legacy_inner / len(PARSE_CORPUS), 3)
+    results["tolerant_success_rate"] = round(tolerant_ok / len(PARSE_CORPUS), 3)
+    print(json.dumps(results, indent=2))
+
+    if mismatches:
+        print("\n".join(mismatches), file=sys.stderr)
+        sys.exit(1)
+
+
+def bench_telemetry(args: argparse.Namespace):
+    """Mesures par appel: résumé par opération, export Prometheus et surcoût de track()"""
+    import tempfile
+
+    from telemetry import Telemetry, note_parse
+
+    # Réponses de qualité variable: le résultat du parsing est mesuré par appel
+    responses = [text for _, text, _ in PARSE_CORPUS]
+    counter = iter(range(10**9))
+
+    def respond(contents: Any) -> str:
+        return responses[next(counter) % len(responses)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl_path = os.path.join(tmp, "telemetry.jsonl")
+        client = make_client(args.live, respond, args.time_scale)
+        client.telemetry = Telemetry(jsonl_path=jsonl_path)
+
+        image = sample_copy_image()
+        for _ in range(args.runs):
+            client.generate_exercise("moyenne", use_cache=False)
+            client.analyze_handwritten_solution(
+                image, "moyenne", {"expected_answer": "11,3"}, "Calcule la moyenne."
+            )
+
+        with open(jsonl_path, encoding="utf-8") as f:
+            events = [json.loads(line) for line in f]
+
+    # Surcoût de la mesure seule, sans appel au modèle
+    overhead = Telemetry()
+    iterations = 20000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with overhead.track("noop"):
+            note_parse("json")
+    overhead_us = (time.perf_counter() - start) / iterations * 1e6
+
+    print(
+        json.dumps(
+            {
+                "summary": client.get_telemetry_summary(),
+                "jsonl_events": len(events),
+                "example_event": events[-1] if events else None,
+                "track_overhead_us": round(overhead_us, 2),
+            },
+            indent=2,
+            ensure_ascii=False,
+        )
+    )
+    print(client.telemetry.render_prometheus())
+
+
+def bench_token_budget(args: argparse.Namespace):
+    """Taille des prompts de correction selon l'historique de l'élève: sans vs avec budget"""
+    from token_budget import TokenBudget
+
+    exercise = {"type_name": "Moyenne pondérée", "expected_answer": "11,3"}
+    question = "Calcule la moyenne pondérée de la série."
+    error = "Division par le nombre de valeurs au lieu de l'effectif total dans la moyenne pondérée"
+    results: Dict[str, Any] = {}
+
+    for label, budget in (
+        ("sans_budget", TokenBudget(input_budgets={})),
+        ("avec_budget", TokenBudget()),
+    ):
+        client = make_client(False, lambda contents: "{}", args.time_scale)
+        client.token_budget = budget
+        rows = {}
+        for size in (0, 5, 20, 100, 500):
+            # Profil qui grandit: erreurs et points forts accumulés au fil des séances
+            history = {
+                "common_errors": [f"{error} ({i})" for i in range(size)],
+                "strengths": [f"Produits valeur × effectif corrects ({i})" for i in range(size)],
+                "average_score": 12.5,
+            }
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                prompt = client._build_single_pass_prompt(
+                    "moyenne", exercise, question, history if size else None
+                )
+            build_us = (time.perf_counter() - start) / args.runs * 1e6
+            rows[f"historique_{size}"] = {
+                "prompt_tokens": estimate_tokens(prompt),
+                "build_us": round(build_us, 1),
+            }
+        results[label] = {
+            "prompts": rows,
+            "max_output_tokens": client._generation_config("single_pass").get(
+                "max_output_tokens"
+            ),
+            "stats": budget.get_stats()["operations"],
+        }
+
+    # Prompt d'exercice: gabarit précompilé, rendu à chaque appel
+    client = make_client(False, lambda contents: "{}", args.time_scale)
+    iterations = 20000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        client._build_exercise_prompt("moyenne", "moyen")
+    results["exercise_prompt_us"] = round(
+        (time.perf_counter() - start) / iterations * 1e6, 2
+    )
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+def bench_tutor(args: argparse.Namespace):
+    """Tokens d'entrée par tour sur une conversation de --turns tours avec le tuteur"""
+    from prompt_templates import TUTOR_SYSTEM_INSTRUCTION
+    from tutor_session import TutorSession
+
+    reply = (
+        "Pour trouver la **médiane**, on range d'abord les valeurs dans l'ordre croissant. "
+        "Ensuite on cherche la valeur du milieu : avec un nombre impair de valeurs, c'est "
+        "celle qui a autant de valeurs avant qu'après. Essaie avec ta série, que trouves-tu ? "
+    ) * 2
+    summary = (
+        "L'élève révise médiane, moyenne et étendue. Notions expliquées : rangement des "
+        "valeurs, valeur du milieu, moyenne pondérée. Difficulté : oublie de ranger la série."
+    ) * 2
+
+    def respond(contents: Any) -> str:
+        text = contents if isinstance(contents, str) else ""
+        return summary if "RÉSUMÉ PRÉCÉDENT" in text else reply
+
+    def question(turn: int) -> str:
+        return (
+            f"Question {turn} : comment calculer la médiane de la série "
+            f"{', '.join(str((turn * k) % 17 + 3) for k in range(1, 8))} ?"
+        )
+
+    greeting = {"role": "model", "text": "Bonjour ! Je suis ton tuteur de maths."}
+    results: Dict[str, Any] = {}
+
+    # Approche historique: consignes + 6 derniers messages en une seule chaîne
+    client = make_client(False, respond, args.time_scale)
+    messages = [greeting]
+    flat_tokens = []
+    for turn in range(1, args.turns + 1):
+        messages.append({"role": "user", "text": question(turn)})
+        history_text = "\n".join(
+            f"{'Élève' if m['role'] == 'user' else 'Professeur'}: {m['text']}"
+            for m in messages[-6:]
+        )
+        prompt = (
+            f"{TUTOR_SYSTEM_INSTRUCTION}\n\nHistorique:\n{history_text}"
+            f"\n\nÉlève: {question(turn)}\nProfesseur:"
+        )
+        flat_tokens.append(estimate_tokens(prompt))
+        messages.append({"role": "model", "text": "".join(client.generate_text_stream(prompt))})
+    results["six_derniers_messages"] = {
+        "input_tokens": _per_turn(flat_tokens),
+        "messages_in_context": 6,
+        "older_context": "perdu",
+    }
+
+    for label, threshold in (("historique_complet", 10**9), ("resume_glissant", 800)):
+        client = make_client(False, respond, args.time_scale)
+        session = TutorSession(
+            client, history=[greeting], summary_threshold=threshold, background=False
+        )
+        for turn in range(1, args.turns + 1):
+            session.send(question(turn))
+        stats = session.get_stats()
+        summary_calls = [call for call in client.model.calls if not call.get("stream")]
+        results[label] = {
+            "input_tokens": _per_turn(list(session.input_tokens)),
+            "summaries": stats["summaries"],
+            "summary_input_tokens": sum(call["prompt_tokens"] for call in summary_calls),
+            "messages_in_context": stats["pending_messages"],
+            "older_context": "résumé" if stats["summaries"] else "complet",
+        }
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+def _per_turn(tokens: List[int]) -> Dict[str, Any]:
+    """Tokens d'entrée à quelques tours repères, moyenne, maximum et total"""
+    marks = sorted({1, 10, 25, len(tokens)})
+    return {
+        **{f"tour_{mark}": tokens[mark - 1] for mark in marks if mark <= len(tokens)},
+        "mean": round(statistics.mean(tokens), 1),
+        "max": max(tokens),
+        "total": sum(tokens),
+    }
+
+
+BENCHMARKS = {
+    "answers": bench_answers,
+    "batch": bench_batch,
+    "breaker": bench_breaker,
+    "clusters": bench_clusters,
+    "deadline": bench_deadline,
+    "engine": bench_engine,
+    "grading-modes": bench_grading_modes,
+    "hedging": bench_hedging,
+    "history": bench_history,
+    "parse": bench_parse,
+    "profile": bench_profile,
+    "rate-limit": bench_rate_limit,
+    "startup": bench_startup,
+    "store": bench_store,
+    "telemetry": bench_telemetry,
+    "token-budget": bench_token_budget,
+    "tutor": bench_tutor,
+    "verify": bench_verify,
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--live", action="store_true", help="Utiliser la vraie API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--image", help="Photo de copie pour grading-modes et batch")
+    parser.add_argument("--copies", type=int, default=32, help="Taille du lot pour batch")
+    parser.add_argument(
+        "--concurrency",
+        default="1,4,8",
+        help="Niveaux de concurrence testés par batch (séparés par des virgules)",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=4.0,
+        help="Budget (s simulées) d'un exercice pour deadline",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=5.0, help="Durée (s) de rate-limit"
+    )
+    parser.add_argument(
+        "--turns", type=int, default=50, help="Tours de conversation pour tutor"
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.1,
+        help="Facteur appliqué à la latence simulée du modèle factice",
+    )
+    args = parser.parse_args(argv)
+
+    if args.live and not os.getenv("GEMINI_API_KEY"):
+        parser.error("--live nécessite GEMINI_API_KEY")
+
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Disjoncteur (circuit breaker) pour les appels à un service en panne
+Après plusieurs échecs, les appels sont court-circuités pendant un délai,
+puis quelques appels d'essai décident de la réouverture ou non
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+# États du disjoncteur
+STATE_CLOSED = "closed"  # Appels normaux
+STATE_OPEN = "open"  # Appels court-circuités
+STATE_HALF_OPEN = "half_open"  # Appels d'essai après le délai de récupération
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert, avec compteurs et transitions"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        """
+        Initialise le disjoncteur
+
+        Args:
+            name: Nom de l'opération protégée (pour les métriques)
+            failure_threshold: Échecs consécutifs avant ouverture
+            recovery_timeout: Durée (secondes) d'ouverture avant les appels d'essai
+            half_open_max_calls: Appels d'essai simultanés autorisés en semi-ouvert
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        # (horodatage, ancien état, nouvel état)
+        self._transitions: Deque[Tuple[float, str, str]] = deque(maxlen=50)
+        self._stats = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "short_circuited": 0,
+            "released": 0,
+            "opened": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        """État courant (passe en semi-ouvert une fois le délai écoulé)"""
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Indique si un appel peut partir; sinon il doit être court-circuité"""
+        with self._lock:
+            self._refresh()
+            if self._state == STATE_CLOSED:
+                allowed = True
+            elif self._state == STATE_HALF_OPEN:
+                allowed = self._half_open_calls < self.half_open_max_calls
+                if allowed:
+                    self._half_open_calls += 1
+            else:
+                allowed = False
+
+            if allowed:
+                self._stats["calls"] += 1
+            else:
+                self._stats["short_circuited"] += 1
+            return allowed
+
+    def record_success(self):
+        """Enregistre un appel réussi (referme le disjoncteur après un essai)"""
+        with self._lock:
+            self._stats["successes"] += 1
+            self._consecutive_failures = 0
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+                self._transition(STATE_CLOSED)
+
+    def record_failure(self):
+        """Enregistre un appel en échec (ouvre le disjoncteur au-delà du seuil)"""
+        with self._lock:
+            self._stats["failures"] += 1
+            self._consecutive_failures += 1
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+                self._open()
+            elif (
+                self._state == STATE_CLOSED
+                and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._open()
+
+    def release(self):
+        """
+        Termine un appel sans verdict sur le service (échéance atteinte avant
+        l'envoi): ni succès ni échec, l'appel d'essai éventuel est libéré
+        """
+        with self._lock:
+            self._stats["released"] += 1
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """État, compteurs et dernières transitions du disjoncteur"""
+        with self._lock:
+            self._refresh()
+            stats = dict(self._stats)
+            stats["state"] = self._state
+            stats["consecutive_failures"] = self._consecutive_failures
+            stats["transitions"] = [
+                {"at": timestamp, "from": old, "to": new}
+                for timestamp, old, new in self._transitions
+            ]
+        return stats
+
+    def _open(self):
+        """Ouvre le disjoncteur (appelé sous verrou)"""
+        self._opened_at = time.monotonic()
+        self._stats["opened"] += 1
+        self._transition(STATE_OPEN)
+
+    def _refresh(self):
+        """Passe d'ouvert à semi-ouvert une fois le délai écoulé (appelé sous verrou)"""
+        if (
+            self._state == STATE_OPEN
+            and time.monotonic() - self._opened_at >= self.recovery_timeout
+        ):
+            self._half_open_calls = 0
+            self._transition(STATE_HALF_OPEN)
+
+    def _transition(self, new_state: str):
+        if new_state != self._state:
+            self._transitions.append((time.time(), self._state, new_state))
+            self._state = new_state
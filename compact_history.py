@@ -0,0 +1,206 @@
+"""
+Historique compact des résultats d'un élève, stocké par colonnes
+Scores en float32, type d'exercice et difficulté codés sur un octet, dates en
+secondes epoch, erreurs et points forts stockés une seule fois (table de
+chaînes) et référencés par indice; chaque entrée se relit comme un dict
+"""
+
+import sys
+from array import array
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Décimales rendues pour un score float32 (exact au dix-millième sur 0-20)
+SCORE_DECIMALS = 4
+# Listes de chaînes de chaque résultat
+TEXT_FIELDS = ("errors", "good_points", "error_types")
+
+
+def format_timestamp(epoch: int) -> str:
+    """Date lisible (heure locale) d'un timestamp epoch"""
+    return datetime.fromtimestamp(epoch).strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value: Any) -> int:
+    """Timestamp epoch d'une date lisible (ou d'un nombre déjà epoch)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+class _CodedColumn:
+    """Colonne de valeurs répétitives (type, difficulté) stockées en petits entiers"""
+
+    def __init__(self):
+        self.codes = array("B")
+        self.values: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def append(self, value: str):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+            if code > 255 and self.codes.typecode == "B":
+                self.codes = array("H", self.codes)
+        self.codes.append(code)
+
+    def __getitem__(self, i: int) -> str:
+        return self.values[self.codes[i]]
+
+    def nbytes(self) -> int:
+        return (
+            sys.getsizeof(self.codes)
+            + sys.getsizeof(self.values)
+            + sys.getsizeof(self._index)
+            + sum(sys.getsizeof(value) for value in self.values)
+        )
+
+
+class _StringListColumn:
+    """Colonne de listes de chaînes: indices à plat et bornes de chaque entrée"""
+
+    def __init__(self, strings: "_StringTable"):
+        self.strings = strings
+        self.ids = array("I")
+        # Entrée i: ids[offsets[i]:offsets[i + 1]]
+        self.offsets = array("I", [0])
+
+    def append(self, values: Iterable[str]):
+        self.ids.extend(self.strings.intern(value) for value in values)
+        self.offsets.append(len(self.ids))
+
+    def __getitem__(self, i: int) -> List[str]:
+        values = self.strings.values
+        return [values[j] for j in self.ids[self.offsets[i] : self.offsets[i + 1]]]
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.ids) + sys.getsizeof(self.offsets)
+
+
+class _StringTable:
+    """Chaînes distinctes (erreurs, points forts, types d'erreurs), chacune stockée une fois"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        i = self._index.get(value)
+        if i is None:
+            i = self._index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def nbytes(self) -> int:
+        return (
+            sys.getsizeof(self.values)
+            + sys.getsizeof(self._index)
+            + sum(sys.getsizeof(value) for value in self.values)
+        )
+
+
+class CompactHistory(Sequence):
+    """
+    Historique par colonnes; history[i] retourne le résultat au format dict
+    habituel (exercise_type, difficulty, score, errors, good_points,
+    error_types, timestamp lisible)
+    """
+
+    def __init__(self, results: Optional[Iterable[Dict[str, Any]]] = None):
+        self.scores = array("f")
+        self.timestamps = array("q")
+        self._types = _CodedColumn()
+        self._difficulties = _CodedColumn()
+        self._strings = _StringTable()
+        self._text = {field: _StringListColumn(self._strings) for field in TEXT_FIELDS}
+        for result in results or ():
+            self.append_result(result)
+
+    def append(
+        self,
+        exercise_type: str,
+        difficulty: str,
+        score: float,
+        errors: Iterable[str],
+        good_points: Iterable[str],
+        error_types: Iterable[str],
+        timestamp: int,
+    ):
+        """Ajoute un résultat (timestamp en secondes epoch)"""
+        self._types.append(exercise_type)
+        self._difficulties.append(difficulty)
+        self.scores.append(score)
+        self.timestamps.append(timestamp)
+        self._text["errors"].append(errors)
+        self._text["good_points"].append(good_points)
+        self._text["error_types"].append(error_types)
+
+    def append_result(self, result: Dict[str, Any]):
+        """Ajoute un résultat au format dict (timestamp lisible ou epoch)"""
+        self.append(
+            result["exercise_type"],
+            result["difficulty"],
+            result["score"],
+            result.get("errors", []),
+            result.get("good_points", []),
+            result.get("error_types", []),
+            parse_timestamp(result["timestamp"]),
+        )
+
+    def prepend(self, results: Iterable[Dict[str, Any]]):
+        """Place des résultats plus anciens avant l'historique actuel"""
+        merged = CompactHistory(results)
+        for i in range(len(self)):
+            merged.append(
+                self._types[i],
+                self._difficulties[i],
+                self.scores[i],
+                self._text["errors"][i],
+                self._text["good_points"][i],
+                self._text["error_types"][i],
+                self.timestamps[i],
+            )
+        self.__dict__.update(merged.__dict__)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("index hors de l'historique")
+        return {
+            "exercise_type": self._types[index],
+            "difficulty": self._difficulties[index],
+            "score": round(self.scores[index], SCORE_DECIMALS),
+            "errors": self._text["errors"][index],
+            "good_points": self._text["good_points"][index],
+            "error_types": self._text["error_types"][index],
+            "timestamp": format_timestamp(self.timestamps[index]),
+        }
+
+    def exercise_type(self, index: int) -> str:
+        return self._types[index]
+
+    def difficulty(self, index: int) -> str:
+        return self._difficulties[index]
+
+    def errors(self, index: int) -> List[str]:
+        return self._text["errors"][index]
+
+    def nbytes(self) -> int:
+        """Mémoire occupée par les colonnes et la table de chaînes (octets)"""
+        return (
+            sys.getsizeof(self.scores)
+            + sys.getsizeof(self.timestamps)
+            + self._types.nbytes()
+            + self._difficulties.nbytes()
+            + self._strings.nbytes()
+            + sum(column.nbytes() for column in self._text.values())
+        )
@@ -9,6 +9,8 @@ from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
+from text_clusters import TextClusterIndex
+
 
 class EmailNotifier:
     """Gestionnaire d'envoi d'emails aux parents"""
@@ -279,8 +281,9 @@ class EmailNotifier:
         # Calculer le taux de réussite
         total_exercises = len(exercises)
         successful_exercises = 0
-        all_strengths = []
-        all_errors = []
+        # Formulations proches d'un même point fort / d'une même erreur regroupées
+        strength_clusters = TextClusterIndex()
+        error_clusters = TextClusterIndex()
 
         for exercise in exercises:
             feedback = exercise.get("feedback", {})
@@ -298,8 +301,10 @@ class EmailNotifier:
                 pass
 
             # Collecter les points forts et erreurs
-            all_strengths.extend(feedback.get("good_points", []))
-            all_errors.extend(feedback.get("errors", []))
+            for point in feedback.get("good_points", []):
+                strength_clusters.add(point)
+            for error in feedback.get("errors", []):
+                error_clusters.add(error)
 
         success_rate = (
             int((successful_exercises / total_exercises) * 100)
@@ -308,18 +313,10 @@ class EmailNotifier:
         )
 
         # Identifier les points forts récurrents
-        from collections import Counter
-
-        strengths = [
-            strength
-            for strength, count in Counter(all_strengths).most_common(3)
-            if count >= 1
-        ]
+        strengths = [cluster["label"] for cluster in strength_clusters.top(3)]
 
         # Identifier les axes d'amélioration
-        improvement_areas = [
-            error for error, count in Counter(all_errors).most_common(3) if count >= 1
-        ]
+        improvement_areas = [cluster["label"] for cluster in error_clusters.top(3)]
 
         return {
             "chapter": chapter,
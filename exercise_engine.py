@@ -0,0 +1,398 @@
+"""
+Moteur local d'exercices de statistiques (sans Gemini)
+Exercices paramétriques et reproductibles (graine) pour les 4 types: contexte,
+plage de valeurs, taille de série et format de réponse tirés au hasard,
+réponses attendues calculées exactement avec NumPy
+"""
+
+import threading
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+EXERCISE_TYPES = ("effectif", "frequence", "moyenne", "probleme")
+
+# Contextes: sujet de la série, individus, intitulé de la colonne, unité et plage de valeurs
+CONTEXTS: List[Dict[str, Any]] = [
+    {
+        "subject": "les notes obtenues par les élèves d'une classe de 3ème à un contrôle",
+        "population": "élèves",
+        "label": "Note",
+        "unit": "",
+        "range": (4, 20),
+    },
+    {
+        "subject": "les tailles (en cm) des élèves d'une classe",
+        "population": "élèves",
+        "label": "Taille (cm)",
+        "unit": " cm",
+        "range": (145, 185),
+    },
+    {
+        "subject": "les âges des participants à un tournoi de badminton",
+        "population": "participants",
+        "label": "Âge (ans)",
+        "unit": " ans",
+        "range": (11, 17),
+    },
+    {
+        "subject": "les pointures des joueurs d'un club de basket",
+        "population": "joueurs",
+        "label": "Pointure",
+        "unit": "",
+        "range": (36, 47),
+    },
+    {
+        "subject": "le nombre de frères et sœurs des élèves d'un collège",
+        "population": "élèves",
+        "label": "Frères et sœurs",
+        "unit": "",
+        "range": (0, 6),
+    },
+    {
+        "subject": "le nombre de buts marqués par une équipe de handball à chaque match",
+        "population": "matchs",
+        "label": "Buts",
+        "unit": " buts",
+        "range": (18, 34),
+    },
+    {
+        "subject": "les températures maximales (en °C) relevées chaque jour dans une ville",
+        "population": "jours",
+        "label": "Température (°C)",
+        "unit": " °C",
+        "range": (12, 31),
+    },
+    {
+        "subject": "les durées (en minutes) du trajet entre le domicile et le collège",
+        "population": "élèves",
+        "label": "Durée (min)",
+        "unit": " min",
+        "range": (5, 45),
+    },
+    {
+        "subject": "le nombre de livres lus pendant les vacances par des élèves",
+        "population": "élèves",
+        "label": "Livres lus",
+        "unit": " livres",
+        "range": (0, 8),
+    },
+    {
+        "subject": "le nombre d'heures de sommeil des élèves la veille d'un contrôle",
+        "population": "élèves",
+        "label": "Heures de sommeil",
+        "unit": " h",
+        "range": (6, 11),
+    },
+]
+
+# Taille de la série et nombre de valeurs distinctes par difficulté (bornes incluses)
+DIFFICULTIES: Dict[str, Dict[str, Tuple[int, int]]] = {
+    "facile": {"size": (8, 12), "distinct": (3, 4)},
+    "moyen": {"size": (12, 18), "distinct": (4, 6)},
+    "difficile": {"size": (18, 25), "distinct": (5, 8)},
+}
+
+# Totaux qui donnent des pourcentages exacts, pour les fréquences faciles
+EASY_TOTALS = (10, 20, 25)
+
+FREQUENCY_FORMATS = {
+    "decimal": "sous forme décimale",
+    "fraction": "sous forme de fraction",
+    "pourcentage": "en pourcentage",
+}
+
+# Variantes de problèmes proposées selon la difficulté
+PROBLEM_VARIANTS = {
+    "facile": ("effectifs_moyenne", "mediane_etendue"),
+    "moyen": ("frequences_moyenne", "mediane_etendue"),
+    "difficile": ("seuil", "frequences_moyenne", "mediane_etendue"),
+}
+
+
+class ExerciseEngine:
+    """Génère des exercices variés et leurs réponses exactes, localement"""
+
+    def __init__(self, seed: Optional[int] = None):
+        """
+        Initialise le moteur
+
+        Args:
+            seed: Graine du moteur (None: aléatoire); chaque exercice reçoit sa
+                propre graine, conservée dans exercise_data["seed"]
+        """
+        self._seeds = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def generate(
+        self, exercise_type: str, difficulty: str = "moyen", seed: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Génère un exercice
+
+        Args:
+            exercise_type: effectif, frequence, moyenne, probleme
+            difficulty: facile, moyen, difficile
+            seed: Graine de l'exercice (le même triplet donne le même exercice)
+
+        Returns:
+            Dictionnaire au format des exercices de GeminiClient (question,
+            exercise_data, expected_answer, ...)
+
+        Raises:
+            ValueError: Si le type d'exercice est inconnu
+        """
+        builders = {
+            "effectif": self._effectif,
+            "frequence": self._frequence,
+            "moyenne": self._moyenne,
+            "probleme": self._probleme,
+        }
+        builder = builders.get(exercise_type)
+        if builder is None:
+            raise ValueError(f"Type d'exercice inconnu: {exercise_type}")
+        if difficulty not in DIFFICULTIES:
+            difficulty = "moyen"
+
+        if seed is None:
+            with self._lock:
+                seed = int(self._seeds.integers(2**63))
+        rng = np.random.default_rng(seed)
+
+        exercise = builder(rng, difficulty)
+        exercise["exercise_data"]["seed"] = seed
+        exercise["exercise_data"]["difficulty"] = difficulty
+        exercise["generated_locally"] = True
+        return exercise
+
+    def generate_many(
+        self,
+        count: int,
+        exercise_type: Optional[str] = None,
+        difficulty: str = "moyen",
+    ) -> List[Dict[str, Any]]:
+        """Génère count exercices (types tournants si exercise_type vaut None)"""
+        return [
+            self.generate(exercise_type or EXERCISE_TYPES[i % len(EXERCISE_TYPES)], difficulty)
+            for i in range(count)
+        ]
+
+    # --- Séries ---
+
+    @staticmethod
+    def _series(
+        rng: np.random.Generator,
+        difficulty: str,
+        context: Dict[str, Any],
+        size: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Valeurs distinctes triées et leurs effectifs (chacun au moins 1)"""
+        config = DIFFICULTIES[difficulty]
+        low, high = context["range"]
+        if size is None:
+            size = int(rng.integers(config["size"][0], config["size"][1] + 1))
+        distinct = int(rng.integers(config["distinct"][0], config["distinct"][1] + 1))
+        distinct = min(distinct, high - low + 1, size)
+
+        values = np.sort(rng.choice(np.arange(low, high + 1), size=distinct, replace=False))
+        counts = 1 + rng.multinomial(size - distinct, np.full(distinct, 1.0 / distinct))
+        return values, counts
+
+    @staticmethod
+    def _context(rng: np.random.Generator) -> Dict[str, Any]:
+        return CONTEXTS[int(rng.integers(len(CONTEXTS)))]
+
+    @staticmethod
+    def _raw_values(rng: np.random.Generator, values: np.ndarray, counts: np.ndarray) -> List[int]:
+        """Série brute, dans un ordre quelconque"""
+        return rng.permutation(np.repeat(values, counts)).tolist()
+
+    @staticmethod
+    def _table(label: str, values: np.ndarray, counts: np.ndarray) -> str:
+        rows = "\n".join(f"| {v} | {c} |" for v, c in zip(values.tolist(), counts.tolist()))
+        return (
+            f"| {label} | Effectif |\n|--------|----------|\n{rows}\n"
+            f"| Total | {int(counts.sum())} |"
+        )
+
+    @staticmethod
+    def _mean(values: np.ndarray, counts: np.ndarray) -> float:
+        return round(float(np.dot(values, counts) / counts.sum()), 2)
+
+    # --- Types d'exercices ---
+
+    def _effectif(self, rng: np.random.Generator, difficulty: str) -> Dict[str, Any]:
+        context = self._context(rng)
+        values, counts = self._series(rng, difficulty, context)
+        raw = self._raw_values(rng, values, counts)
+        effectifs = dict(zip(values.tolist(), counts.tolist()))
+        total = len(raw)
+        empty_rows = "\n".join("|        |          |" for _ in range(len(values)))
+
+        question = f"""On a relevé {context['subject']} :
+
+{', '.join(map(str, raw))}
+
+Complète le tableau d'effectifs suivant :
+
+| {context['label']} | Effectif |
+|--------|----------|
+{empty_rows}
+| Total  |          |"""
+
+        return {
+            "type": "effectif",
+            "type_name": "Tableau d'effectifs",
+            "question": question,
+            "exercise_data": {
+                "values": raw,
+                "expected_effectifs": effectifs,
+                "expected_total": total,
+            },
+            "expected_answer": f"Tableau d'effectifs: {effectifs}, Total: {total}",
+            "exercise_info": f"Liste de {total} valeurs à classer en effectifs",
+        }
+
+    def _frequence(self, rng: np.random.Generator, difficulty: str) -> Dict[str, Any]:
+        context = self._context(rng)
+        size = int(rng.choice(EASY_TOTALS)) if difficulty == "facile" else None
+        values, counts = self._series(rng, difficulty, context, size)
+        total = int(counts.sum())
+        format_type = list(FREQUENCY_FORMATS)[int(rng.integers(len(FREQUENCY_FORMATS)))]
+        frequences = dict(zip(values.tolist(), format_frequencies(counts, format_type)))
+
+        question = f"""Le tableau suivant donne {context['subject']} :
+
+{self._table(context['label'], values, counts)}
+
+Calcule les fréquences {FREQUENCY_FORMATS[format_type]} de chaque valeur.
+Tu peux utiliser la formule : fréquence = effectif / total
+ou le produit en croix."""
+
+        return {
+            "type": "frequence",
+            "type_name": "Calcul de fréquences",
+            "question": question,
+            "exercise_data": {
+                "effectifs": dict(zip(values.tolist(), counts.tolist())),
+                "total": total,
+                "format": format_type,
+                "expected_frequences": frequences,
+            },
+            "expected_answer": f"Fréquences ({format_type}): {frequences}",
+            "exercise_info": f"Total: {total}, Format demandé: {format_type}",
+        }
+
+    def _moyenne(self, rng: np.random.Generator, difficulty: str) -> Dict[str, Any]:
+        context = self._context(rng)
+        values, counts = self._series(rng, difficulty, context)
+        data = dict(zip(values.tolist(), counts.tolist()))
+        total = int(counts.sum())
+        moyenne = self._mean(values, counts)
+
+        question = f"""Le tableau suivant donne {context['subject']} :
+
+{self._table(context['label'], values, counts)}
+
+Calcule la moyenne pondérée de cette série (arrondie au centième si besoin).
+Utilise la formule : Moyenne = (Σ valeur × effectif) / total des effectifs"""
+
+        products = " + ".join(f"{v}×{c}" for v, c in data.items())
+        return {
+            "type": "moyenne",
+            "type_name": "Moyenne pondérée",
+            "question": question,
+            "exercise_data": {"data": data, "total": total, "expected_mean": moyenne},
+            "expected_answer": f"Moyenne = {moyenne}",
+            "exercise_info": f"Calcul: ({products}) / {total} = {moyenne}",
+        }
+
+    def _probleme(self, rng: np.random.Generator, difficulty: str) -> Dict[str, Any]:
+        context = self._context(rng)
+        values, counts = self._series(rng, difficulty, context)
+        raw = self._raw_values(rng, values, counts)
+        series = np.asarray(raw)
+        total = len(raw)
+        effectifs = dict(zip(values.tolist(), counts.tolist()))
+        moyenne = self._mean(values, counts)
+        variants = PROBLEM_VARIANTS[difficulty]
+        variant = variants[int(rng.integers(len(variants)))]
+
+        intro = f"On a relevé {context['subject']} ({total} {context['population']}) :\n{', '.join(map(str, raw))}"
+        expected: Dict[str, Any] = {"effectifs": effectifs, "moyenne": moyenne}
+
+        if variant == "effectifs_moyenne":
+            modes = values[counts == counts.max()].tolist()
+            expected["valeur_frequente"] = modes if len(modes) > 1 else modes[0]
+            questions = [
+                "Complète le tableau d'effectifs",
+                "Calcule la moyenne de la série",
+                "Quelle est la valeur la plus fréquente ?",
+            ]
+        elif variant == "frequences_moyenne":
+            expected["frequences_pct"] = dict(
+                zip(values.tolist(), format_frequencies(counts, "pourcentage"))
+            )
+            questions = [
+                "Construis le tableau d'effectifs",
+                "Calcule les fréquences en pourcentage (arrondies au dixième)",
+                "Calcule la moyenne de la série",
+                "Interprète tes résultats",
+            ]
+        elif variant == "seuil":
+            # Seuil pris parmi les valeurs intérieures: les deux groupes sont non vides
+            threshold = int(values[int(rng.integers(1, len(values)))]) if len(values) > 1 else int(values[0])
+            below = int((series < threshold).sum())
+            expected.update(
+                {
+                    "seuil": threshold,
+                    "moins_que_seuil": below,
+                    "seuil_et_plus": total - below,
+                    "pct_moins_que_seuil": round(below / total * 100, 1),
+                    "pct_seuil_et_plus": round((total - below) / total * 100, 1),
+                }
+            )
+            questions = [
+                "Construis le tableau d'effectifs et de fréquences (en pourcentage)",
+                "Calcule la moyenne de la série",
+                f"On forme deux groupes : moins de {threshold}{context['unit']} et "
+                f"{threshold}{context['unit']} ou plus. Combien y a-t-il de {context['population']} dans chaque groupe ?",
+                "Quelle proportion (en pourcentage) représente chaque groupe ?",
+            ]
+        else:
+            expected.update(
+                {
+                    "mediane": float(np.median(series)),
+                    "etendue": int(values[-1] - values[0]),
+                }
+            )
+            questions = [
+                "Range les valeurs dans l'ordre croissant",
+                "Détermine la médiane de la série",
+                "Calcule l'étendue de la série",
+                "Calcule la moyenne et compare-la à la médiane",
+            ]
+
+        numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+        return {
+            "type": "probleme",
+            "type_name": "Problème textuel",
+            "question": f"{intro}\n\n{numbered}",
+            "exercise_data": {"data": raw, "variant": variant, "expected": expected},
+            "expected_answer": f"Réponses attendues: {expected}",
+            "exercise_info": f"Problème de niveau {difficulty} avec {total} données",
+        }
+
+
+def format_frequencies(counts: np.ndarray, format_type: str) -> List[Any]:
+    """Fréquences de chaque valeur dans le format demandé"""
+    total = int(counts.sum())
+    if format_type == "fraction":
+        return [
+            f"{fraction.numerator}/{fraction.denominator}"
+            for fraction in (Fraction(int(c), total) for c in counts)
+        ]
+    if format_type == "pourcentage":
+        return np.round(counts / total * 100, 1).tolist()
+    return np.round(counts / total, 3).tolist()
@@ -1,20 +1,137 @@
 """
 Générateur d'exercices de statistiques pour niveau 3ème
 Utilise Gemini 3 Pro pour générer des exercices variés et adaptés
+Sans client Gemini, les exercices viennent du moteur local (exercise_engine)
 """
 
-import random
-from typing import Dict, Any, List, Optional
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+from google.api_core import exceptions as api_exceptions
 from gemini_client import GeminiClient
+from exercise_pool import ExercisePool
+from circuit_breaker import CircuitBreaker
+from exercise_engine import EXERCISE_TYPES, ExerciseEngine
+
+logger = logging.getLogger(__name__)
+
+# Temps (secondes) gardé en fin de budget pour le fallback local
+FALLBACK_RESERVE = 0.05
+
+# Étapes Gemini de generate(), dans l'ordre, et disjoncteur de la réserve
+STAGES = ("generate_exercise_from_examples", "generate_exercise")
+POOL_OPERATION = "generate_exercise.pool"
+
+_shared_generators: Dict[Optional[str], "ExerciseGenerator"] = {}
+_shared_generators_lock = threading.Lock()
+
+
+def get_shared_generator(
+    api_key: Optional[str] = None,
+    client_options: Optional[Dict[str, Any]] = None,
+    **generator_options,
+) -> "ExerciseGenerator":
+    """
+    Retourne le générateur (et son client Gemini, generator.gemini) partagé par
+    tout le processus pour cette clé API: créé au premier appel, puis réutilisé
+    par toutes les sessions; les options du premier appel s'appliquent
+
+    La configuration du SDK étant globale, une seule clé doit servir par processus
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    with _shared_generators_lock:
+        generator = _shared_generators.get(api_key)
+        if generator is None:
+            client = GeminiClient(api_key=api_key, **(client_options or {}))
+            generator = ExerciseGenerator(client, **generator_options)
+            _shared_generators[api_key] = generator
+    return generator
 
 
 class ExerciseGenerator:
     """Générateur d'exercices de statistiques utilisant Gemini"""
 
-    def __init__(self, gemini_client: GeminiClient):
+    def __init__(
+        self,
+        gemini_client: Optional[GeminiClient],
+        use_pool: bool = True,
+        pool_depth: int = 2,
+        pool_refill_concurrency: int = 2,
+        pool_max_age: float = 900.0,
+        pool_warm_keys: Optional[Iterable[Tuple[str, str]]] = None,
+        breaker_failure_threshold: int = 3,
+        breaker_recovery_timeout: float = 30.0,
+        default_deadline: Optional[float] = None,
+        min_stage_budget: float = 0.5,
+        engine_seed: Optional[int] = None,
+    ):
+        """
+        Initialise le générateur
+
+        Args:
+            gemini_client: Client Gemini (None: exercices générés localement uniquement)
+            use_pool: Servir les exercices standards depuis une réserve pré-générée
+            pool_depth: Nombre d'exercices gardés prêts par (type, difficulté)
+            pool_refill_concurrency: Générations simultanées en arrière-plan
+            pool_max_age: Durée de vie (secondes) d'un exercice en réserve
+            pool_warm_keys: (type, difficulté) dont la réserve est remplie dès la
+                création (None: tous les types au niveau par défaut, "moyen")
+            breaker_failure_threshold: Échecs consécutifs d'une opération Gemini
+                avant de passer directement au fallback local
+            breaker_recovery_timeout: Durée (secondes) avant de retenter Gemini
+            default_deadline: Budget de temps (secondes) d'un appel à generate()
+                quand aucun n'est précisé (None: pas de limite)
+            min_stage_budget: Temps restant minimal (secondes) pour tenter un appel
+                Gemini; en dessous, on passe directement à l'étape suivante
+            engine_seed: Graine du moteur local (exercices reproductibles)
+        """
         self.gemini = gemini_client
-        # Fallback: exercices prédéfinis si Gemini échoue
-        self.fallback_exercises = self._init_fallback_exercises()
+        # Moteur local: exercices et réponses exactes sans appel réseau
+        self.engine = ExerciseEngine(engine_seed)
+        # Un disjoncteur par opération Gemini: en cas de panne, fallback immédiat.
+        # La réserve, remplie sans budget de temps, a le sien: ses échecs
+        # n'ouvrent pas celui des requêtes, ni l'inverse
+        self.breakers = {
+            operation: CircuitBreaker(
+                operation,
+                failure_threshold=breaker_failure_threshold,
+                recovery_timeout=breaker_recovery_timeout,
+            )
+            for operation in (*STAGES, POOL_OPERATION)
+        }
+        self.default_deadline = default_deadline
+        self.min_stage_budget = min_stage_budget
+        self._deadline_lock = threading.Lock()
+        self._deadline_stats = {
+            "requests": 0,
+            "skipped_stages": {operation: 0 for operation in STAGES},
+            "over_budget": 0,
+        }
+        # Réserve d'exercices remplie en arrière-plan (via son propre disjoncteur)
+        self.pool = (
+            ExercisePool(
+                lambda exercise_type, difficulty: self._call_with_breaker(
+                    POOL_OPERATION,
+                    self.gemini.generate_exercise,
+                    exercise_type,
+                    difficulty,
+                ),
+                depth=pool_depth,
+                refill_concurrency=pool_refill_concurrency,
+                max_age=pool_max_age,
+            )
+            if use_pool and gemini_client is not None
+            else None
+        )
+        if self.pool is not None:
+            # Premiers exercices servis depuis la réserve plutôt qu'après un appel Gemini
+            self.pool.warm(
+                pool_warm_keys
+                if pool_warm_keys is not None
+                else [(exercise_type, "moyen") for exercise_type in EXERCISE_TYPES]
+            )
 
     def generate(
         self,
@@ -22,6 +139,7 @@ class ExerciseGenerator:
         difficulty: str = "moyen",
         student_profile: Optional[Dict[str, Any]] = None,
         examples_analysis: Optional[Dict[str, Any]] = None,
+        deadline: Optional[float] = None,
     ) -> Dict[str, Any]:
         """
         Génère un exercice selon le type demandé avec Gemini
@@ -32,35 +150,164 @@ class ExerciseGenerator:
             difficulty: facile, moyen, difficile
             student_profile: Profil de l'élève pour personnalisation
             examples_analysis: Analyse d'exemples d'exercices pour inspiration
+            deadline: Budget de temps total (secondes), consommé par chaque étape
+                (None: default_deadline)
         """
 
+        budget = deadline if deadline is not None else self.default_deadline
+        expires_at = time.monotonic() + budget if budget is not None else None
+        if expires_at is not None:
+            with self._deadline_lock:
+                self._deadline_stats["requests"] += 1
+
+        if self.gemini is None:
+            exercise = self._generate_fallback(exercise_type, difficulty)
+            if student_profile:
+                exercise = self._personalize_exercise(exercise, student_profile)
+            return exercise
+
         # Priorité 1: Générer avec exemples si disponibles
         if examples_analysis and examples_analysis.get("valid"):
-            try:
-                exercise = self.gemini.generate_exercise_from_examples(
-                    exercise_type, difficulty, examples_analysis
-                )
-                if exercise and not exercise.get("error"):
-                    # Personnaliser l'exercice selon le profil
-                    if student_profile:
-                        exercise = self._personalize_exercise(exercise, student_profile)
-                    return exercise
-            except Exception as e:
-                print(f"Erreur génération avec exemples: {e}")
-
-        # Priorité 2: Générer avec Gemini standard
-        try:
-            exercise = self.gemini.generate_exercise(exercise_type, difficulty)
-            if exercise and not exercise.get("error"):
+            exercise = self._run_stage(
+                "generate_exercise_from_examples",
+                expires_at,
+                self.gemini.generate_exercise_from_examples,
+                exercise_type,
+                difficulty,
+                examples_analysis,
+            )
+            if exercise:
                 # Personnaliser l'exercice selon le profil
                 if student_profile:
                     exercise = self._personalize_exercise(exercise, student_profile)
-                return exercise
-        except Exception as e:
-            print(f"Erreur génération Gemini: {e}")
+                return self._check_budget(exercise, expires_at)
+
+        # Priorité 2: Exercice pré-généré en réserve, sinon Gemini standard
+        exercise = self.pool.pop(exercise_type, difficulty) if self.pool else None
+        if exercise is None:
+            exercise = self._run_stage(
+                "generate_exercise",
+                expires_at,
+                self.gemini.generate_exercise,
+                exercise_type,
+                difficulty,
+            )
+        if exercise:
+            # Personnaliser l'exercice selon le profil
+            if student_profile:
+                exercise = self._personalize_exercise(exercise, student_profile)
+            return self._check_budget(exercise, expires_at)
+
+        # Fallback vers le moteur local
+        return self._check_budget(
+            self._generate_fallback(exercise_type, difficulty), expires_at
+        )
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Retourne les compteurs de la réserve d'exercices (hits, misses, tailles)"""
+        return self.pool.get_stats() if self.pool else {}
+
+    def get_breaker_stats(self) -> Dict[str, Any]:
+        """Retourne l'état, les compteurs et les transitions de chaque disjoncteur"""
+        return {
+            operation: breaker.get_stats()
+            for operation, breaker in self.breakers.items()
+        }
+
+    def get_deadline_stats(self) -> Dict[str, Any]:
+        """Retourne les étapes sautées faute de temps et les dépassements de budget"""
+        with self._deadline_lock:
+            return {
+                **self._deadline_stats,
+                "skipped_stages": dict(self._deadline_stats["skipped_stages"]),
+            }
+
+    def _run_stage(
+        self,
+        operation: str,
+        expires_at: Optional[float],
+        generate: Callable[..., Dict[str, Any]],
+        *args,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Exécute une étape Gemini avec le temps restant sur le budget
+
+        Returns:
+            L'exercice, ou None si l'étape a échoué ou a été sautée faute de temps
+        """
+        if expires_at is None:
+            return self._call_with_breaker(operation, generate, *args)
+
+        remaining = expires_at - time.monotonic() - FALLBACK_RESERVE
+        if remaining < self.min_stage_budget:
+            with self._deadline_lock:
+                self._deadline_stats["skipped_stages"][operation] += 1
+            return None
+        return self._call_with_breaker(
+            operation, generate, *args, expires_at=expires_at, timeout=remaining
+        )
+
+    def _check_budget(
+        self, exercise: Dict[str, Any], expires_at: Optional[float]
+    ) -> Dict[str, Any]:
+        """Compte les réponses rendues après l'échéance"""
+        if expires_at is not None and time.monotonic() > expires_at:
+            with self._deadline_lock:
+                self._deadline_stats["over_budget"] += 1
+        return exercise
+
+    def _call_with_breaker(
+        self,
+        operation: str,
+        generate: Callable[..., Dict[str, Any]],
+        *args,
+        expires_at: Optional[float] = None,
+        **kwargs,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Appelle une opération Gemini à travers son disjoncteur
+
+        Args:
+            expires_at: Échéance (time.monotonic()) du budget de l'appel: un échec
+                dû à ce budget ne compte pas comme une panne du service
 
-        # Fallback vers exercices prédéfinis
-        return self._generate_fallback(exercise_type, difficulty)
+        Returns:
+            L'exercice, ou None si l'appel a échoué ou a été court-circuité
+        """
+        breaker = self.breakers[operation]
+        if not breaker.allow_request():
+            return None
+
+        deadline_exceeded = False
+        try:
+            exercise = generate(*args, **kwargs)
+        except Exception as e:
+            logger.warning("Erreur %s: %s", operation, e)
+            exercise = None
+            deadline_exceeded = isinstance(e, api_exceptions.DeadlineExceeded)
+
+        if exercise and not exercise.get("error"):
+            breaker.record_success()
+            return exercise
+        if exercise and exercise.get("rejected"):
+            # Exercice refusé par la vérification locale: le service, lui, a répondu
+            breaker.record_success()
+            return None
+        if exercise and exercise.get("local_timeout"):
+            # Échéance atteinte en attente du quota local: le service n'est pas en cause
+            breaker.release()
+            return None
+        if expires_at is not None and (
+            deadline_exceeded
+            or (exercise and exercise.get("deadline_exceeded"))
+            or time.monotonic() >= expires_at - FALLBACK_RESERVE
+        ):
+            # Notre budget est épuisé: un service plus lent que lui n'est pas en panne
+            breaker.release()
+            return None
+
+        breaker.record_failure()
+        return None
 
     def _personalize_exercise(
         self, exercise: Dict[str, Any], student_profile: Dict[str, Any]
@@ -111,7 +358,7 @@ class ExerciseGenerator:
         return hints_map.get(exercise_type, [])
 
     def _generate_fallback(self, exercise_type: str, difficulty: str) -> Dict[str, Any]:
-        """Génère un exercice de secours si Gemini échoue"""
+        """Génère un exercice avec le moteur local (Gemini absent ou en échec)"""
 
         generators = {
             "effectif": self._generate_effectif_fallback,
@@ -128,242 +375,16 @@ class ExerciseGenerator:
 
     def _generate_effectif_fallback(self, difficulty: str) -> Dict[str, Any]:
         """Génère un exercice d'effectif (fallback)"""
-
-        if difficulty == "facile":
-            values = [random.choice([10, 11, 12]) for _ in range(10)]
-        elif difficulty == "moyen":
-            values = [random.choice([10, 11, 12, 13, 14]) for _ in range(15)]
-        else:
-            values = [
-                random.choice([8, 9, 10, 11, 12, 13, 14, 15, 16]) for _ in range(20)
-            ]
-
-        effectifs = {}
-        for val in values:
-            effectifs[val] = effectifs.get(val, 0) + 1
-
-        total = len(values)
-
-        question = f"""Voici une liste de {total} valeurs d'un caractère :
-
-{', '.join(map(str, values))}
-
-Complète le tableau d'effectifs suivant :
-
-| Valeur | Effectif |
-|--------|----------|
-|        |          |
-|        |          |
-|        |          |
-|        |          |
-| Total  |          |"""
-
-        return {
-            "type": "effectif",
-            "type_name": "Tableau d'effectifs",
-            "question": question,
-            "exercise_data": {
-                "values": values,
-                "expected_effectifs": effectifs,
-                "expected_total": total,
-            },
-            "expected_answer": f"Tableau d'effectifs: {effectifs}, Total: {total}",
-            "exercise_info": f"Liste de {total} valeurs à classer en effectifs",
-        }
+        return self.engine.generate("effectif", difficulty)
 
     def _generate_frequence_fallback(self, difficulty: str) -> Dict[str, Any]:
         """Génère un exercice de fréquence (fallback)"""
-
-        if difficulty == "facile":
-            effectifs = {10: 2, 11: 3, 12: 5}
-        elif difficulty == "moyen":
-            effectifs = {10: 3, 11: 4, 12: 5, 13: 3}
-        else:
-            effectifs = {8: 2, 9: 3, 10: 4, 11: 5, 12: 6}
-
-        total = sum(effectifs.values())
-        format_type = random.choice(["decimal", "fraction", "pourcentage"])
-
-        frequences = {}
-        for val, eff in effectifs.items():
-            if format_type == "decimal":
-                frequences[val] = round(eff / total, 3)
-            elif format_type == "fraction":
-                from fractions import Fraction
-
-                freq_frac = Fraction(eff, total)
-                frequences[val] = f"{freq_frac.numerator}/{freq_frac.denominator}"
-            else:
-                frequences[val] = round((eff / total) * 100, 1)
-
-        format_text = {
-            "decimal": "sous forme décimale",
-            "fraction": "sous forme de fraction",
-            "pourcentage": "en pourcentage",
-        }[format_type]
-
-        question = f"""Voici un tableau d'effectifs :
-
-| Valeur | Effectif |
-|--------|----------|
-{chr(10).join([f"| {val}      | {eff}      |" for val, eff in effectifs.items()])}
-| Total  | {total}     |
-
-Calcule les fréquences {format_text} de chaque valeur.
-Tu peux utiliser la formule : fréquence = effectif / total
-ou le produit en croix."""
-
-        return {
-            "type": "frequence",
-            "type_name": "Calcul de fréquences",
-            "question": question,
-            "exercise_data": {
-                "effectifs": effectifs,
-                "total": total,
-                "format": format_type,
-            },
-            "expected_answer": f"Fréquences ({format_type}): {frequences}",
-            "exercise_info": f"Total: {total}, Format demandé: {format_type}",
-        }
+        return self.engine.generate("frequence", difficulty)
 
     def _generate_moyenne_fallback(self, difficulty: str) -> Dict[str, Any]:
-        """Génère un exercice de moyenne (fallback)"""
-
-        if difficulty == "facile":
-            data = {10: 2, 11: 3, 12: 5}
-        elif difficulty == "moyen":
-            data = {10: 3, 11: 4, 12: 5, 13: 3}
-        else:
-            data = {8: 2, 9: 3, 10: 4, 11: 5, 12: 6, 13: 4}
-
-        somme_produits = sum(valeur * effectif for valeur, effectif in data.items())
-        total_effectifs = sum(data.values())
-        moyenne = round(somme_produits / total_effectifs, 2)
-
-        question = f"""Calcule la moyenne pondérée de la série statistique suivante :
-
-| Valeur | Effectif |
-|--------|----------|
-{chr(10).join([f"| {val}      | {eff}      |" for val, eff in data.items()])}
-| Total  | {sum(data.values())}     |
-
-Utilise la formule : Moyenne = (Σ valeur × effectif) / total des effectifs"""
-
-        return {
-            "type": "moyenne",
-            "type_name": "Moyenne pondérée",
-            "question": question,
-            "exercise_data": {"data": data, "total": total_effectifs},
-            "expected_answer": f"Moyenne = {moyenne}",
-            "exercise_info": f"Calcul: ({' + '.join([f'{v}×{e}' for v, e in data.items()])}) / {total_effectifs} = {moyenne}",
-        }
+        """Génère un exercice de moyenne pondérée (fallback)"""
+        return self.engine.generate("moyenne", difficulty)
 
     def _generate_probleme_fallback(self, difficulty: str) -> Dict[str, Any]:
         """Génère un problème textuel (fallback)"""
-
-        problemes = {
-            "facile": {
-                "question": """Dans une classe de 3ème, on a relevé les notes suivantes à un contrôle :
-10, 12, 10, 14, 12, 10, 12, 14, 10, 12
-
-1. Complète le tableau d'effectifs
-2. Calcule la moyenne de la classe
-3. Quelle est la note la plus fréquente ?""",
-                "data": [10, 12, 10, 14, 12, 10, 12, 14, 10, 12],
-                "expected": {
-                    "effectifs": {10: 4, 12: 4, 14: 2},
-                    "moyenne": 11.6,
-                    "note_frequente": 10,
-                },
-            },
-            "moyen": {
-                "question": """Un professeur a relevé les tailles (en cm) de ses 20 élèves de 3ème :
-150, 152, 150, 155, 152, 150, 152, 155, 150, 152,
-158, 160, 158, 155, 160, 158, 160, 155, 158, 160
-
-1. Construis le tableau d'effectifs
-2. Calcule les fréquences en pourcentage
-3. Calcule la taille moyenne de la classe
-4. Interprète tes résultats""",
-                "data": [
-                    150,
-                    152,
-                    150,
-                    155,
-                    152,
-                    150,
-                    152,
-                    155,
-                    150,
-                    152,
-                    158,
-                    160,
-                    158,
-                    155,
-                    160,
-                    158,
-                    160,
-                    155,
-                    158,
-                    160,
-                ],
-                "expected": {
-                    "effectifs": {150: 4, 152: 4, 155: 4, 158: 4, 160: 4},
-                    "frequences_pct": {150: 20, 152: 20, 155: 20, 158: 20, 160: 20},
-                    "moyenne": 155.5,
-                },
-            },
-            "difficile": {
-                "question": """Un club de sport organise un tournoi. Voici les âges des participants :
-12, 13, 12, 14, 13, 12, 13, 14, 12, 13, 15, 14, 13, 15, 14, 13, 15, 14, 13, 15
-
-1. Construis le tableau d'effectifs et de fréquences (en pourcentage)
-2. Calcule l'âge moyen des participants
-3. Le club veut organiser deux groupes : un pour les moins de 14 ans et un pour les 14 ans et plus.
-   Combien de participants dans chaque groupe ?
-4. Quelle proportion (en pourcentage) représente chaque groupe ?""",
-                "data": [
-                    12,
-                    13,
-                    12,
-                    14,
-                    13,
-                    12,
-                    13,
-                    14,
-                    12,
-                    13,
-                    15,
-                    14,
-                    13,
-                    15,
-                    14,
-                    13,
-                    15,
-                    14,
-                    13,
-                    15,
-                ],
-                "expected": {
-                    "effectifs": {12: 4, 13: 7, 14: 5, 15: 4},
-                    "moyenne": 13.5,
-                    "moins_14": 11,
-                    "plus_14": 9,
-                },
-            },
-        }
-
-        probleme = problemes.get(difficulty, problemes["moyen"])
-
-        return {
-            "type": "probleme",
-            "type_name": "Problème textuel",
-            "question": probleme["question"],
-            "exercise_data": {"data": probleme["data"], "difficulty": difficulty},
-            "expected_answer": f"Réponses attendues: {probleme['expected']}",
-            "exercise_info": f"Problème de niveau {difficulty} avec {len(probleme['data'])} données",
-        }
-
-    def _init_fallback_exercises(self) -> Dict[str, Any]:
-        """Initialise les exercices de secours"""
-        return {}
+        return self.engine.generate("probleme", difficulty)
@@ -0,0 +1,135 @@
+"""
+Réserve d'exercices pré-générés en arrière-plan
+Maintient un stock par (type, difficulté) pour que generate() réponde sans attendre Gemini
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+
+class ExercisePool:
+    """Stock d'exercices prêts à l'emploi, réalimenté par des workers en arrière-plan"""
+
+    def __init__(
+        self,
+        producer: Callable[[str, str], Optional[Dict[str, Any]]],
+        depth: int = 2,
+        refill_concurrency: int = 2,
+        max_age: float = 900.0,
+    ):
+        """
+        Initialise la réserve d'exercices
+
+        Args:
+            producer: Fonction (exercise_type, difficulty) -> exercice, appelée en arrière-plan
+            depth: Nombre d'exercices à garder prêts par (type, difficulté)
+            refill_concurrency: Nombre maximal de générations simultanées en arrière-plan
+            max_age: Durée de vie (secondes) d'un exercice en réserve avant d'être jeté
+        """
+        self.producer = producer
+        self.depth = max(0, depth)
+        self.max_age = max_age
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, refill_concurrency),
+            thread_name_prefix="exercise-pool",
+        )
+        self._lock = threading.Lock()
+        # (type, difficulté) -> file de (date de création, exercice)
+        self._pools: Dict[Tuple[str, str], Deque[Tuple[float, Dict[str, Any]]]] = (
+            defaultdict(deque)
+        )
+        self._pending: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale_discarded": 0,
+            "refills": 0,
+            "refill_errors": 0,
+        }
+
+    def pop(self, exercise_type: str, difficulty: str) -> Optional[Dict[str, Any]]:
+        """
+        Retire un exercice prêt de la réserve et déclenche son remplacement
+
+        Returns:
+            L'exercice, ou None si la réserve est vide (miss)
+        """
+        key = (exercise_type, difficulty)
+        exercise = None
+
+        with self._lock:
+            pool = self._pools[key]
+            self._discard_stale(pool)
+            if pool:
+                exercise = pool.popleft()[1]
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+
+        self._schedule_refill(key)
+        return exercise
+
+    def warm(self, keys: Iterable[Tuple[str, str]]):
+        """Lance le remplissage de la réserve pour les (type, difficulté) donnés"""
+        for key in keys:
+            self._schedule_refill(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retourne les compteurs de la réserve (hits, misses, tailles...)"""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+            stats["sizes"] = {
+                f"{ex_type}/{difficulty}": len(pool)
+                for (ex_type, difficulty), pool in self._pools.items()
+            }
+            stats["pending"] = sum(self._pending.values())
+        return stats
+
+    def shutdown(self, wait: bool = False):
+        """Arrête les workers de remplissage"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _discard_stale(self, pool: Deque[Tuple[float, Dict[str, Any]]]):
+        """Jette les exercices trop anciens (appelé sous verrou)"""
+        now = time.monotonic()
+        while pool and now - pool[0][0] > self.max_age:
+            pool.popleft()
+            self._stats["stale_discarded"] += 1
+
+    def _schedule_refill(self, key: Tuple[str, str]):
+        """Planifie autant de générations que nécessaire pour revenir à la profondeur cible"""
+        with self._lock:
+            missing = self.depth - len(self._pools[key]) - self._pending[key]
+            if missing <= 0:
+                return
+            self._pending[key] += missing
+
+        for _ in range(missing):
+            try:
+                self._executor.submit(self._refill_one, key)
+            except RuntimeError:
+                # Executor arrêté: on abandonne le remplissage
+                with self._lock:
+                    self._pending[key] -= 1
+
+    def _refill_one(self, key: Tuple[str, str]):
+        """Génère un exercice en arrière-plan et l'ajoute à la réserve"""
+        exercise = None
+        try:
+            exercise = self.producer(*key)
+        except Exception:
+            exercise = None
+
+        with self._lock:
+            self._pending[key] -= 1
+            if exercise and not exercise.get("error"):
+                self._pools[key].append((time.monotonic(), exercise))
+                self._stats["refills"] += 1
+            else:
+                self._stats["refill_errors"] += 1
@@ -0,0 +1,320 @@
+"""
+Vérification locale des réponses attendues des exercices générés par Gemini
+Recalcule effectifs, fréquences, moyenne pondérée, médiane et étendue à partir
+des données de l'exercice: une réponse fausse est corrigée sur place, un
+exercice sans données exploitables est rejeté (le fallback local prend le
+relais); des données en texte libre laissent l'exercice non vérifié
+"""
+
+import re
+import threading
+from collections import defaultdict
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from exercise_engine import FREQUENCY_FORMATS, format_frequencies
+
+VERIFY_PASS = "pass"  # Réponse attendue exacte
+VERIFY_REPAIRED = "repaired"  # Réponse attendue corrigée sur place
+VERIFY_REJECTED = "rejected"  # Données absentes ou inexploitables
+VERIFY_UNVERIFIED = "unverified"  # Données en texte libre: exercice gardé tel quel
+VERIFY_STATUSES = (VERIFY_PASS, VERIFY_REPAIRED, VERIFY_REJECTED, VERIFY_UNVERIFIED)
+
+# Écarts tolérés: les réponses du modèle sont arrondies (centième, dixième de %)
+DECIMAL_TOLERANCE = 0.006
+PERCENT_TOLERANCE = 0.6
+MEAN_TOLERANCE = 0.011
+
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """Nombre écrit par le modèle ou l'élève: 12, "12,5", "3/4", "35 %" (None sinon)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    text = value.strip().replace(" ", "").replace(" ", "").rstrip("%").replace(",", ".")
+    try:
+        return float(Fraction(text)) if "/" in text else float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def series_key(value: Any) -> Any:
+    """Clé canonique d'une valeur de série: entier, décimal, ou texte (modalité)"""
+    number = parse_number(value)
+    if number is None:
+        return str(value).strip()
+    return int(number) if number.is_integer() else number
+
+
+def count_effectifs(values: List[Any]) -> Dict[Any, int]:
+    """Effectif de chaque valeur, dans l'ordre croissant (ordre d'apparition pour du texte)"""
+    effectifs: Dict[Any, int] = {}
+    for value in values:
+        key = series_key(value)
+        effectifs[key] = effectifs.get(key, 0) + 1
+    if all(not isinstance(key, str) for key in effectifs):
+        return dict(sorted(effectifs.items()))
+    return effectifs
+
+
+def normalize_table(table: Any) -> Optional[Dict[Any, Any]]:
+    """Tableau {valeur: nombre} aux clés canoniques (None si ce n'est pas un tableau)"""
+    if not isinstance(table, dict):
+        return None
+    normalized = {}
+    for key, value in table.items():
+        number = parse_number(value)
+        if number is None:
+            return None
+        normalized[series_key(key)] = number
+    return normalized
+
+
+def normalize_keys(mapping: Any) -> Optional[Dict[Any, Any]]:
+    """Dictionnaire aux clés canoniques, valeurs inchangées (None si ce n'est pas un dict)"""
+    if not isinstance(mapping, dict):
+        return None
+    return {series_key(key): value for key, value in mapping.items()}
+
+
+def numeric_series(table: Dict[Any, float]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Valeurs triées et effectifs d'un tableau numérique (None si une clé n'est pas un
+    nombre ou si les effectifs ne sont pas des entiers positifs)"""
+    if not table or any(isinstance(key, str) for key in table):
+        return None
+    counts = np.array(list(table.values()))
+    if (counts < 0).any() or not np.all(counts == np.round(counts)) or counts.sum() == 0:
+        return None
+    order = np.argsort(np.array(list(table.keys()), dtype=float))
+    values = np.array(list(table.keys()), dtype=float)[order]
+    return values, counts[order].astype(int)
+
+
+def weighted_mean(values: np.ndarray, counts: np.ndarray) -> float:
+    """Moyenne pondérée par les effectifs"""
+    return float(np.dot(values, counts) / counts.sum())
+
+
+def median(values: np.ndarray, counts: np.ndarray) -> float:
+    """Médiane de la série (valeurs répétées selon leurs effectifs)"""
+    return float(np.median(np.repeat(values, counts)))
+
+
+def value_range(values: np.ndarray) -> float:
+    """Étendue: plus grande valeur moins plus petite"""
+    return float(values[-1] - values[0])
+
+
+def frequency_matches(answer: Any, counts_value: int, total: int, format_type: str) -> bool:
+    """Compare une fréquence donnée à effectif / total, à l'arrondi près"""
+    exact = Fraction(counts_value, total)
+    if format_type == "fraction" and isinstance(answer, str) and "/" in answer:
+        try:
+            return Fraction(answer.replace(" ", "")) == exact
+        except (ValueError, ZeroDivisionError):
+            return False
+    number = parse_number(answer)
+    if number is None:
+        return False
+    if format_type == "pourcentage":
+        return abs(number - float(exact) * 100) <= PERCENT_TOLERANCE
+    return abs(number - float(exact)) <= DECIMAL_TOLERANCE
+
+
+def _number(value: float) -> Any:
+    """Nombre sans décimale inutile (12.0 -> 12), pour les réponses corrigées"""
+    return int(value) if float(value).is_integer() else round(float(value), 2)
+
+
+class ExerciseVerifier:
+    """Vérifie et corrige les réponses attendues, avec compteurs par type d'exercice"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {status: 0 for status in VERIFY_STATUSES}
+        )
+
+    def verify(self, exercise: Dict[str, Any]) -> str:
+        """
+        Vérifie un exercice au format de GeminiClient._parse_exercise
+
+        La réponse attendue (exercise_data["expected_answer"] et expected_answer)
+        est corrigée sur place si besoin; le détail est ajouté dans
+        exercise["verification"] ({"status", "issues"}).
+
+        Returns:
+            VERIFY_PASS, VERIFY_REPAIRED, VERIFY_REJECTED ou VERIFY_UNVERIFIED
+        """
+        checks = {
+            "effectif": self._check_effectif,
+            "frequence": self._check_frequence,
+            "moyenne": self._check_moyenne,
+            "probleme": self._check_probleme,
+        }
+        exercise_type = exercise.get("type", "")
+        data = exercise.get("exercise_data")
+        check = checks.get(exercise_type)
+
+        if check is None or not isinstance(data, dict) or not data:
+            status, issues = VERIFY_REJECTED, ["Exercice sans données vérifiables"]
+        elif isinstance(data.get("data"), str) and data["data"].strip():
+            # Énoncé en texte libre (ex: exercice inspiré d'exemples): rien à corriger
+            # de façon sûre, la réponse attendue du modèle est gardée telle quelle
+            if exercise_type == "probleme":
+                self._check_probleme(data, {}, [])
+            status = VERIFY_UNVERIFIED
+            issues = ["Données en texte libre: réponse attendue non vérifiée"]
+        else:
+            expected = data.get("expected_answer")
+            if not isinstance(expected, dict):
+                expected = {}
+            issues = []
+            rejection = check(data, expected, issues)
+            if rejection:
+                status, issues = VERIFY_REJECTED, [rejection]
+            elif issues:
+                status = VERIFY_REPAIRED
+                data["expected_answer"] = expected
+                exercise["expected_answer"] = str(expected)
+            else:
+                status = VERIFY_PASS
+
+        exercise["verification"] = {"status": status, "issues": issues}
+        with self._lock:
+            self._stats[exercise_type or "inconnu"][status] += 1
+        return status
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Exercices vérifiés et taux pass/repaired/rejected/unverified, globalement et par type"""
+        with self._lock:
+            by_type = {exercise_type: dict(counts) for exercise_type, counts in self._stats.items()}
+
+        totals = {status: 0 for status in VERIFY_STATUSES}
+        for counts in by_type.values():
+            for status, n in counts.items():
+                totals[status] += n
+        checked = sum(totals.values())
+        stats: Dict[str, Any] = {"checked": checked, "by_type": by_type}
+        for status, n in totals.items():
+            stats[f"{status}_rate"] = round(n / checked, 3) if checked else 0.0
+        return stats
+
+    # --- Vérifications par type (retournent un motif de rejet, ou None) ---
+
+    @staticmethod
+    def _check_effectif(
+        data: Dict[str, Any], expected: Dict[str, Any], issues: List[str]
+    ) -> Optional[str]:
+        values = data.get("data")
+        if not isinstance(values, list) or not values:
+            return "Liste de valeurs absente"
+
+        effectifs = count_effectifs(values)
+        if normalize_table(expected.get("tableau")) != effectifs:
+            issues.append("Tableau d'effectifs recalculé")
+            expected["tableau"] = {str(value): n for value, n in effectifs.items()}
+        if parse_number(expected.get("total")) != len(values):
+            issues.append(f"Total corrigé: {len(values)}")
+            expected["total"] = len(values)
+        return None
+
+    @staticmethod
+    def _check_frequence(
+        data: Dict[str, Any], expected: Dict[str, Any], issues: List[str]
+    ) -> Optional[str]:
+        table = normalize_table(data.get("data"))
+        if not table or any(n < 0 or not float(n).is_integer() for n in table.values()):
+            return "Tableau d'effectifs absent ou invalide"
+
+        counts = np.array([int(n) for n in table.values()])
+        total = int(counts.sum())
+        if total == 0:
+            return "Effectif total nul"
+        if parse_number(data.get("total")) != total:
+            issues.append(f"Total corrigé: {total}")
+            data["total"] = total
+
+        format_type = expected.get("format") or data.get("format")
+        if format_type not in FREQUENCY_FORMATS:
+            format_type = "decimal"
+        answers = normalize_keys(expected.get("frequences"))
+        if answers is None or any(
+            key not in answers or not frequency_matches(answers[key], int(n), total, format_type)
+            for key, n in zip(table, counts)
+        ):
+            issues.append(f"Fréquences recalculées ({format_type})")
+            expected["frequences"] = {
+                str(key): frequency
+                for key, frequency in zip(table, format_frequencies(counts, format_type))
+            }
+        expected["format"] = format_type
+        return None
+
+    @staticmethod
+    def _check_moyenne(
+        data: Dict[str, Any], expected: Dict[str, Any], issues: List[str]
+    ) -> Optional[str]:
+        series = numeric_series(normalize_table(data.get("data")) or {})
+        if series is None:
+            return "Série statistique absente ou non numérique"
+
+        values, counts = series
+        mean = weighted_mean(values, counts)
+        answer = parse_number(expected.get("moyenne"))
+        if answer is None or abs(answer - mean) > MEAN_TOLERANCE:
+            issues.append(f"Moyenne corrigée: {round(mean, 2)}")
+            products = " + ".join(f"{_number(v)}×{c}" for v, c in zip(values, counts))
+            expected["moyenne"] = round(mean, 2)
+            expected["calculs"] = f"({products}) / {int(counts.sum())} = {round(mean, 2)}"
+        return None
+
+    @staticmethod
+    def _check_probleme(
+        data: Dict[str, Any], expected: Dict[str, Any], issues: List[str]
+    ) -> Optional[str]:
+        raw = data.get("data")
+        structured = True
+        table = normalize_table(raw)
+        if table is None:
+            if isinstance(raw, list):
+                table = count_effectifs(raw)
+            else:
+                # Données en texte libre: on recalcule, sans corriger (extraction incertaine)
+                structured = False
+                table = count_effectifs(_NUMBER_RE.findall(str(raw or "")))
+        series = numeric_series(table)
+        if series is None:
+            return "Aucune donnée numérique exploitable"
+
+        values, counts = series
+        computed = {
+            "effectif_total": int(counts.sum()),
+            "moyenne": round(weighted_mean(values, counts), 2),
+            "mediane": _number(median(values, counts)),
+            "etendue": _number(value_range(values)),
+        }
+        data["verified"] = computed
+        if not structured:
+            return None
+
+        checks = (
+            ("moyenne", "Moyenne", MEAN_TOLERANCE),
+            ("mediane", "Médiane", 1e-9),
+            ("etendue", "Étendue", 1e-9),
+        )
+        for key, label, tolerance in checks:
+            if key not in expected:
+                continue
+            answer = parse_number(expected[key])
+            if answer is None or abs(answer - computed[key]) > tolerance:
+                issues.append(f"{label} corrigée: {computed[key]}")
+                expected[key] = computed[key]
+        return None
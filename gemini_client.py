@@ -4,22 +4,125 @@ Gère la vision (analyse d'images) et le raisonnement mathématique
 """
 
 import os
+import hashlib
+import logging
+import threading
+import time
 import google.generativeai as genai
-from typing import Optional, Dict, Any, List
+from google.api_core import exceptions as api_exceptions
+from collections import OrderedDict
+from typing import Optional, Callable, Dict, Any, Iterable, Iterator, List, Union
 from PIL import Image
 import io
 import base64
+from response_cache import ResponseCache
+from model_registry import ModelRegistry
+from structured_output import RESPONSE_SCHEMAS, generation_config_for, parse_json_object
+from rate_limiter import (
+    IMAGE_TOKENS,
+    LocalTimeout,
+    RateLimiter,
+    count_images,
+    estimate_tokens,
+)
+from hedging import FIRST_CHUNK_SUFFIX, Hedger
+from telemetry import (
+    Telemetry,
+    annotate,
+    merge_annotations,
+    note_parse,
+    note_verification,
+    run_annotated,
+)
+from exercise_verifier import VERIFY_REJECTED, ExerciseVerifier
+from token_budget import TokenBudget, shrink_list
+from prompt_templates import (
+    DETAILED_ANALYSIS_PROMPT,
+    EXAMPLES_ANALYSIS_PROMPT,
+    EXAMPLES_DATA_FORMATS,
+    EXERCISE_FROM_EXAMPLES_PROMPT,
+    EXERCISE_PROMPTS,
+    HISTORY_SECTION,
+    SINGLE_PASS_PROMPT,
+    STEP_ANALYSIS_PROMPT,
+)
+
+# Les fichiers de l'API File expirent après 48 h: on les réutilise au plus 47 h
+FILE_API_MAX_AGE = 47 * 3600
+
+logger = logging.getLogger(__name__)
+
+# genai.configure modifie un état global du SDK: la clé et les clients de
+# transport qu'il met en cache servent à tous les modèles, appels synchrones,
+# asynchrones, sondes (genai.get_model) et uploads (genai.upload_file) compris.
+# Une seule clé API par processus: en configurer une autre l'applique à tous
+_configure_lock = threading.Lock()
+_configured_key: Optional[str] = None
+
+
+def _env_float(name: str) -> Optional[float]:
+    """Lit un nombre dans une variable d'environnement (None si absente ou vide)"""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def request_options_for(deadline: Optional[float]) -> Optional[Dict[str, float]]:
+    """Options de requête du SDK portant le temps restant avant l'échéance"""
+    if deadline is None:
+        return None
+    return {"timeout": max(0.001, deadline - time.monotonic())}
 
 
 class GeminiClient:
     """Client pour Gemini 3 Pro avec support de la vision"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        enable_cache: bool = True,
+        exercise_cache_variants: int = 3,
+        grading_mode: str = "two_pass",
+        use_file_api: bool = False,
+        image_part_cache_size: int = 32,
+        probe_models: bool = True,
+        structured_output: bool = True,
+        rate_limiter: Optional[RateLimiter] = None,
+        hedging: bool = False,
+        hedge_operations: Iterable[str] = ("generate_exercise", "tutor"),
+        telemetry: Optional[Telemetry] = None,
+        token_budget: Optional[TokenBudget] = None,
+        validate_token_counts: int = 0,
+        verify_exercises: bool = True,
+    ):
         """
         Initialise le client Gemini
 
         Args:
             api_key: Clé API Gemini (ou depuis variable d'environnement)
+            cache: Cache disque des réponses (créé par défaut si enable_cache)
+            enable_cache: Activer le cache disque des réponses
+            exercise_cache_variants: Nombre de variantes distinctes servies depuis
+                le cache avant de redemander un nouvel exercice au modèle
+            grading_mode: Mode de correction par défaut, "two_pass" (démarche puis
+                feedback, deux appels) ou "single_pass" (un seul appel)
+            use_file_api: Uploader chaque copie une fois via l'API File et
+                référencer le fichier, au lieu d'envoyer les octets à chaque appel
+            image_part_cache_size: Nombre d'images encodées gardées en mémoire
+            probe_models: Sonder en arrière-plan la disponibilité des modèles candidats
+            structured_output: Demander des réponses en mode JSON (avec schéma
+                de réponse quand la forme est fixe)
+            rate_limiter: Limiteur de débit partagé par tous les appels (par défaut
+                dimensionné par GEMINI_RPM et GEMINI_TPM, sans limite s'ils sont absents)
+            hedging: Couvrir les requêtes lentes par une seconde requête (p90)
+            hedge_operations: Opérations couvertes quand hedging est activé
+            telemetry: Mesures par appel (par défaut configurées par
+                GEMINI_TELEMETRY_PATH et GEMINI_METRICS_PORT)
+            token_budget: Budgets de tokens d'entrée et limites de sortie par opération
+            validate_token_counts: Recaler l'estimation locale des tokens avec
+                count_tokens une fois sur N prompts (0: jamais)
+            verify_exercises: Recalculer localement les réponses attendues des
+                exercices générés (corrigées sur place, ou exercice rejeté)
         """
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
@@ -28,8 +131,6 @@ class GeminiClient:
                 "Définissez GEMINI_API_KEY dans vos variables d'environnement"
             )
 
-        genai.configure(api_key=self.api_key)
-
         # Utiliser Gemini 3 Pro (ou le modèle disponible)
         # Essayer différents modèles dans l'ordre de préférence
         models_to_try = [
@@ -39,49 +140,438 @@ class GeminiClient:
             "gemini-pro",
         ]
 
-        self.model = None
-        for model_name in models_to_try:
+        global _configured_key
+        with _configure_lock:
+            # Reconfigurer avec la même clé recréerait les clients de transport:
+            # les modèles de tous les GeminiClient partagent ainsi le même canal gRPC
+            if _configured_key != self.api_key:
+                if _configured_key is not None:
+                    logger.warning(
+                        "Nouvelle clé API Gemini: elle remplace la précédente "
+                        "pour tous les clients du processus"
+                    )
+                genai.configure(api_key=self.api_key)
+                _configured_key = self.api_key
+
+        # Chaque appel est routé vers le meilleur modèle sain, avec bascule
+        self.registry = ModelRegistry(
+            {name: genai.GenerativeModel(name) for name in models_to_try},
+            probe=self._probe_model,
+        )
+        if probe_models:
+            threading.Thread(
+                target=self.registry.probe, name="gemini-probe", daemon=True
+            ).start()
+
+        self.cache = cache or (ResponseCache() if enable_cache else None)
+        self.exercise_cache_variants = exercise_cache_variants
+        self.grading_mode = grading_mode
+        self.structured_output = structured_output
+        self.rate_limiter = rate_limiter or RateLimiter(
+            requests_per_minute=_env_float("GEMINI_RPM"),
+            tokens_per_minute=_env_float("GEMINI_TPM"),
+        )
+        self.hedger = Hedger(hedge_operations) if hedging else None
+        self.telemetry = telemetry or Telemetry.from_env()
+        self.token_budget = token_budget or TokenBudget(
+            count_fn=self._count_tokens, validate_every=validate_token_counts
+        )
+        self.verifier = ExerciseVerifier() if verify_exercises else None
+
+        # Images encodées (ou uploadées) une seule fois, par hash du contenu
+        self.use_file_api = use_file_api
+        self.image_part_cache_size = image_part_cache_size
+        self._image_parts: "OrderedDict[str, tuple]" = OrderedDict()
+        self._image_parts_lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        """Modèle actuellement le mieux classé (un appel direct contourne le routage)"""
+        return self.registry.candidates()[0][1]
+
+    @model.setter
+    def model(self, model: Any):
+        """Remplace les candidats par un modèle unique"""
+        self.registry = ModelRegistry(
+            {getattr(model, "model_name", None) or "custom": model}
+        )
+
+    @property
+    def model_name(self) -> str:
+        """Modèle préféré (stable, sert de clé au cache de réponses)"""
+        return self.registry.names[0]
+
+    @staticmethod
+    def _probe_model(model_name: str) -> bool:
+        """Vérifie qu'un modèle existe et supporte generateContent"""
+        info = genai.get_model(f"models/{model_name}")
+        return "generateContent" in info.supported_generation_methods
+
+    def generate_text_stream(
+        self, prompt: Any, operation: str = "tutor"
+    ) -> Iterator[str]:
+        """
+        Génère une réponse en streaming, morceau par morceau
+
+        Args:
+            prompt: Prompt (ou contenu) à envoyer
+            operation: Nom de l'opération
+
+        Yields:
+            Les fragments de texte au fur et à mesure de leur génération
+        """
+        yield from self.telemetry.track_stream(
+            operation, self._stream_with_failover(prompt, operation)
+        )
+
+    def _stream_with_failover(self, prompt: Any, operation: str) -> Iterator[str]:
+        """Streaming couvert (hedging) ou avec bascule tant que rien n'a été affiché"""
+        if self.hedger is not None and self.hedger.applies(operation):
+            yield from self.hedger.first_chunk(
+                self.registry,
+                operation,
+                lambda name, model: self._open_stream(name, model, prompt, operation),
+                estimate_tokens(prompt),
+            )
+            return
+
+        last_error: Optional[Exception] = None
+        for name, model in self.registry.candidates(operation):
+            started = False
             try:
-                self.model = genai.GenerativeModel(model_name)
-                break
-            except Exception:
+                for text in self._open_stream(name, model, prompt, operation):
+                    started = True
+                    yield text
+            except Exception as e:
+                if started:
+                    # Déjà partiellement affiché: on ne rejoue pas sur un autre modèle
+                    raise
+                last_error = e
                 continue
+            return
+
+        raise last_error or RuntimeError("Aucun modèle Gemini disponible")
+
+    def _open_stream(
+        self, name: str, model: Any, prompt: Any, operation: str
+    ) -> Iterator[str]:
+        """Streaming sur un modèle donné, avec mesure du délai du premier fragment"""
+        tokens = estimate_tokens(prompt)
+        queue_wait = self.rate_limiter.acquire(tokens)
+        annotate(model=name, queue_wait_ms=round(queue_wait * 1000, 1))
+        start = time.perf_counter()
+        started = False
+        chunk = None
+        try:
+            for chunk in model.generate_content(
+                prompt, generation_config=self._generation_config(operation), stream=True
+            ):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Fragment sans texte (ex: métadonnées de fin ou blocage)
+                    continue
+                if text:
+                    if not started:
+                        started = True
+                        self.registry.record(
+                            name,
+                            operation + FIRST_CHUNK_SUFFIX,
+                            time.perf_counter() - start,
+                            ok=True,
+                        )
+                    yield text
+        except Exception:
+            self.registry.record(name, operation, time.perf_counter() - start, ok=False)
+            raise
+
+        self.registry.record(name, operation, time.perf_counter() - start, ok=True)
+        # Le dernier fragment porte l'usage de tout le streaming
+        self._record_usage(chunk, tokens, prompt)
+
+    def _call_with_failover(
+        self,
+        operation: str,
+        contents: Any,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Essaie les modèles candidats dans l'ordre du registre jusqu'au premier succès
+
+        Chaque tentative passe par le limiteur de débit, qui réessaie le même
+        modèle sur les erreurs temporaires avant de basculer sur le suivant.
+        Avec un timeout, chaque requête reçoit le temps restant sur l'échéance.
+        Les opérations couvertes (hedging) lancent une seconde requête si la
+        première dépasse le p90 de latence.
+        """
+        tokens = estimate_tokens(contents)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        def attempt(name: str, model: Any) -> Any:
+            start = time.perf_counter()
+            report: Dict[str, Any] = {}
+            try:
+                response = self.rate_limiter.call(
+                    lambda: model.generate_content(
+                        contents,
+                        generation_config=generation_config,
+                        request_options=request_options_for(deadline),
+                    ),
+                    tokens,
+                    deadline,
+                    report,
+                )
+                self._record_usage(response, tokens, contents)
+                response.text  # Lève une erreur si la réponse est bloquée ou vide
+            except LocalTimeout:
+                # Échéance atteinte dans la file du limiteur: rien à reprocher au modèle
+                raise
+            except Exception:
+                self.registry.record(
+                    name, operation, time.perf_counter() - start, ok=False
+                )
+                raise
+            finally:
+                annotate(model=name, **report)
+            self.registry.record(name, operation, time.perf_counter() - start, ok=True)
+            return response
+
+        if self.hedger is not None and self.hedger.applies(operation):
+            return self.hedger.run(self.registry, operation, attempt, tokens).text
+
+        last_error: Optional[Exception] = None
+        for name, model in self.registry.candidates(operation):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                return attempt(name, model).text
+            except LocalTimeout:
+                # Même limiteur pour tous les modèles: inutile de basculer
+                raise
+            except Exception as e:
+                last_error = e
+
+        if last_error is None and deadline is not None:
+            raise LocalTimeout("Délai épuisé avant l'appel à Gemini")
+        raise last_error or RuntimeError("Aucun modèle Gemini disponible")
+
+    def _record_usage(self, response: Any, estimated_tokens: int, contents: Any = None):
+        """
+        Corrige le quota de tokens avec l'usage réel rapporté par l'API
+        et complète la mesure de l'appel en cours
+        """
+        usage = getattr(response, "usage_metadata", None)
+        total = getattr(usage, "total_token_count", 0) or 0
+        if total:
+            self.rate_limiter.adjust_tokens(total - estimated_tokens)
+
+        annotate(
+            prompt_tokens=getattr(usage, "prompt_token_count", 0) or estimated_tokens,
+            output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+            # L'API ne détaille pas les tokens par modalité: estimation par image
+            image_tokens=IMAGE_TOKENS * count_images(contents),
+        )
+
+    def get_telemetry_summary(self) -> Dict[str, Dict[str, Any]]:
+        """Appels, erreurs, résultats de parsing et latences p50/p95/p99 par opération"""
+        return self.telemetry.summary()
 
-        if self.model is None:
-            # Utiliser le modèle par défaut
-            self.model = genai.GenerativeModel("gemini-1.5-flash")
+    def get_hedge_stats(self) -> Dict[str, Any]:
+        """Taux de couverture des requêtes et coût supplémentaire (requêtes, tokens)"""
+        return self.hedger.get_stats() if self.hedger else {}
+
+    def get_rate_limit_stats(self) -> Dict[str, Any]:
+        """Statistiques du limiteur de débit (attente en file, nouvelles tentatives)"""
+        return self.rate_limiter.get_stats()
+
+    def _prepare_image_part(self, image: Union[Image.Image, Dict[str, Any]]) -> Any:
+        """
+        Encode une image une seule fois et retourne une partie réutilisable entre appels
+
+        L'encodage (ou l'upload via l'API File) est mis en cache par hash du contenu,
+        si bien que les deux étapes d'une correction et les recorrections d'une même
+        copie partagent le même encodage.
+        """
+        if isinstance(image, dict):
+            data, mime_type = image["data"], image.get("mime_type", "image/jpeg")
+            digest = hashlib.sha256(data).hexdigest()
+        else:
+            data, mime_type = None, "image/jpeg"
+            hasher = hashlib.sha256(f"{image.mode}:{image.size}:".encode("utf-8"))
+            hasher.update(image.tobytes())
+            digest = hasher.hexdigest()
+
+        with self._image_parts_lock:
+            cached = self._image_parts.get(digest)
+            if cached and time.time() - cached[0] < FILE_API_MAX_AGE:
+                self._image_parts.move_to_end(digest)
+                return cached[1]
+
+        if data is None:
+            data = self._encode_image(image)
+
+        if self.use_file_api:
+            part = genai.upload_file(io.BytesIO(data), mime_type=mime_type)
+        else:
+            part = genai.protos.Part(
+                inline_data=genai.protos.Blob(mime_type=mime_type, data=data)
+            )
+
+        with self._image_parts_lock:
+            self._image_parts[digest] = (time.time(), part)
+            while len(self._image_parts) > self.image_part_cache_size:
+                self._image_parts.popitem(last=False)
+        return part
+
+    @staticmethod
+    def _encode_image(image: Image.Image) -> bytes:
+        """Encode une image PIL en JPEG (bien plus rapide que le WebP sans perte du SDK)"""
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        return buffer.getvalue()
+
+    def _generation_config(self, operation: str) -> Optional[Dict[str, Any]]:
+        """
+        Configuration de génération d'une opération: mode JSON si activé
+        (opérations à réponse JSON uniquement) et nombre maximal de tokens générés
+        """
+        config: Dict[str, Any] = {}
+        if self.structured_output and operation in RESPONSE_SCHEMAS:
+            config.update(generation_config_for(operation))
+        max_output_tokens = self.token_budget.output_limit(operation)
+        if max_output_tokens:
+            config["max_output_tokens"] = max_output_tokens
+        return config or None
+
+    def _count_tokens(self, contents: Any) -> int:
+        """Comptage exact des tokens par l'API (appel réseau)"""
+        return self.model.count_tokens(contents).total_tokens
+
+    def get_token_budget_stats(self) -> Dict[str, Any]:
+        """Réductions de prompts par opération et recalage de l'estimation des tokens"""
+        return self.token_budget.get_stats()
+
+    def get_verification_stats(self) -> Dict[str, Any]:
+        """Taux de réponses attendues exactes, corrigées et d'exercices rejetés"""
+        return self.verifier.get_stats() if self.verifier else {}
+
+    def _generate_text(
+        self,
+        operation: str,
+        contents: Any,
+        use_cache: bool = True,
+        cache_variants: int = 1,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        parse: Optional[Callable[[str], Dict[str, Any]]] = None,
+    ) -> Any:
+        """
+        Appelle le modèle et retourne le texte de la réponse, via le cache si possible
+
+        Args:
+            operation: Nom de l'opération (sert aux durées de vie du cache)
+            contents: Prompt, ou liste prompt + images
+            use_cache: Consulter/alimenter le cache disque pour cet appel
+            cache_variants: Nombre de variantes distinctes à faire tourner en cache
+            generation_config: Configuration de génération (mode JSON, schéma...)
+            timeout: Délai maximal (secondes) de l'appel, bascules et nouvelles
+                tentatives comprises (None: pas de limite)
+            parse: Analyse de la réponse; on retourne alors son résultat, et la
+                réponse n'est mise en cache que s'il ne contient pas de clé "error"
+
+        La clé de cache porte sur le modèle préféré: une réponse servie par un
+        autre modèle (bascule, couverture) n'est pas mise en cache
+        """
+        key = None
+        if self.cache is not None and use_cache:
+            key = self.cache.make_key(self.model_name, contents, generation_config)
+            cached = self.cache.get(operation, key, cache_variants)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return parse(cached) if parse else cached
+
+        # Annotations de l'appel recueillies à part pour connaître le modèle qui a répondu
+        annotations: Dict[str, Any] = {}
+        try:
+            text = run_annotated(
+                annotations,
+                self._call_with_failover,
+                operation,
+                contents,
+                generation_config,
+                timeout,
+            )
+        finally:
+            merge_annotations(annotations)
+        result = parse(text) if parse else text
+
+        if (
+            key is not None
+            and annotations.get("model") == self.model_name
+            and not (parse and "error" in result)
+        ):
+            self.cache.put(operation, key, text, cache_variants)
+        return result
 
     def analyze_handwritten_solution(
         self,
-        image: Image.Image,
+        image: Union[Image.Image, Dict[str, Any]],
         exercise_type: str,
         exercise_data: Dict[str, Any],
         question: str,
         student_history: Optional[Dict[str, Any]] = None,
+        grading_mode: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Analyse une copie manuscrite d'un élève avec raisonnement multi-étapes
 
         Args:
-            image: Image PIL de la copie de l'élève
+            image: Image PIL de la copie, ou blob {"mime_type", "data"} déjà encodé
             exercise_type: Type d'exercice (effectif, frequence, moyenne, probleme)
             exercise_data: Données de l'exercice (réponse attendue, etc.)
             question: Question posée à l'élève
             student_history: Historique de l'élève pour personnalisation
+            grading_mode: "two_pass" ou "single_pass" (par défaut self.grading_mode)
 
         Returns:
             Dictionnaire avec feedback, erreurs, bons points, correction, analyse_detailed
         """
 
-        # Étape 1: Analyse de la démarche (raisonnement multi-étapes)
-        step1_prompt = self._build_step_analysis_prompt(
-            exercise_type, exercise_data, question, student_history
-        )
-
         try:
+            # Encodage unique de la copie, partagé par toutes les étapes
+            image_part = self._prepare_image_part(image)
+
+            if (grading_mode or self.grading_mode) == "single_pass":
+                # Un seul appel vision: démarche et feedback dans la même réponse
+                prompt = self._build_single_pass_prompt(
+                    exercise_type, exercise_data, question, student_history
+                )
+                with self.telemetry.track("analyze_handwritten_solution.single_pass"):
+                    response_text = self._generate_text(
+                        "analyze_handwritten_solution",
+                        [prompt, image_part],
+                        use_cache=False,
+                        generation_config=self._generation_config("single_pass"),
+                    )
+                    return self._parse_single_pass(response_text)
+
+            # Étape 1: Analyse de la démarche (raisonnement multi-étapes)
+            step1_prompt = self._build_step_analysis_prompt(
+                exercise_type, exercise_data, question, student_history
+            )
+
             # Analyser l'image avec Gemini - Étape 1: Extraction de la démarche
-            response_step1 = self.model.generate_content([step1_prompt, image])
-            step1_analysis = self._parse_step_analysis(response_step1.text)
+            with self.telemetry.track("analyze_handwritten_solution.step_analysis"):
+                step1_text = self._generate_text(
+                    "analyze_handwritten_solution",
+                    [step1_prompt, image_part],
+                    use_cache=False,
+                    generation_config=self._generation_config("step_analysis"),
+                )
+                step1_analysis = self._parse_step_analysis(step1_text)
 
             # Étape 2: Analyse détaillée avec la démarche extraite
             step2_prompt = self._build_detailed_analysis_prompt(
@@ -91,10 +581,16 @@ class GeminiClient:
                 step1_analysis,
                 student_history,
             )
-            response_step2 = self.model.generate_content([step2_prompt, image])
-
-            # Parser la réponse finale
-            feedback = self._parse_feedback(response_step2.text)
+            with self.telemetry.track("analyze_handwritten_solution.detailed_analysis"):
+                step2_text = self._generate_text(
+                    "analyze_handwritten_solution",
+                    [step2_prompt, image_part],
+                    use_cache=False,
+                    generation_config=self._generation_config("detailed_analysis"),
+                )
+
+                # Parser la réponse finale
+                feedback = self._parse_feedback(step2_text)
             feedback["step_analysis"] = step1_analysis
             feedback["reasoning_steps"] = step1_analysis.get("steps", [])
 
@@ -190,42 +686,34 @@ ATTENTION SPÉCIALE:
     ) -> str:
         """Construit le prompt pour l'analyse étape par étape de la démarche"""
 
-        history_context = ""
-        if student_history:
-            history_context = f"""
-CONTEXTE DE L'ÉLÈVE:
-- Difficultés précédentes: {student_history.get('common_errors', [])}
-- Points forts: {student_history.get('strengths', [])}
-- Niveau moyen: {student_history.get('average_score', 'Non défini')}
-"""
-
-        return f"""Tu es un expert en analyse pédagogique. Analyse la copie manuscrite étape par étape.
-
-QUESTION: {question}
-TYPE: {exercise_data.get('type_name', exercise_type)}
-{history_context}
-
-INSTRUCTIONS:
-1. Identifie TOUTES les étapes de la démarche de l'élève (même partielles ou erronées)
-2. Pour chaque étape, note si elle est correcte, incorrecte, ou partielle
-3. Identifie les erreurs de raisonnement (pas seulement de calcul)
-4. Note les méthodes alternatives utilisées
+        return self.token_budget.fit(
+            "step_analysis",
+            lambda max_items, max_chars: STEP_ANALYSIS_PROMPT.render(
+                question=question,
+                type_name=exercise_data.get("type_name", exercise_type),
+                history_context=self._history_context(student_history, max_items, max_chars),
+            ),
+        )
 
-Réponds en JSON:
-{{
-    "steps": [
-        {{
-            "step_number": 1,
-            "description": "Description de l'étape identifiée",
-            "status": "correct|incorrect|partial",
-            "student_work": "Ce que l'élève a écrit/fait",
-            "reasoning": "Analyse du raisonnement de l'élève"
-        }}
-    ],
-    "method_used": "Description de la méthode utilisée par l'élève",
-    "alternative_methods": ["Autres méthodes possibles"],
-    "reasoning_errors": ["Erreurs de raisonnement identifiées"]
-}}"""
+    @staticmethod
+    def _history_context(
+        student_history: Optional[Dict[str, Any]],
+        max_items: Optional[int] = None,
+        max_chars: Optional[int] = None,
+    ) -> str:
+        """
+        Section « contexte de l'élève » du prompt, listes réduites à max_items
+        éléments de max_chars caractères (section retirée si max_items vaut 0)
+        """
+        if not student_history or max_items == 0:
+            return ""
+        return HISTORY_SECTION.render(
+            common_errors=shrink_list(
+                student_history.get("common_errors", []), max_items, max_chars
+            ),
+            strengths=shrink_list(student_history.get("strengths", []), max_items, max_chars),
+            average_score=student_history.get("average_score", "Non défini"),
+        )
 
     def _build_detailed_analysis_prompt(
         self,
@@ -237,136 +725,144 @@ Réponds en JSON:
     ) -> str:
         """Construit le prompt pour l'analyse détaillée avec la démarche extraite"""
 
-        steps_text = "\n".join(
-            [
-                f"Étape {s.get('step_number', i+1)}: {s.get('description', '')} - {s.get('status', '')}"
-                for i, s in enumerate(step_analysis.get("steps", []))
-            ]
-        )
+        steps = [
+            f"Étape {s.get('step_number', i+1)}: {s.get('description', '')} - {s.get('status', '')}"
+            for i, s in enumerate(step_analysis.get("steps", []))
+        ]
 
-        return f"""Tu es un professeur de mathématiques de 3ème qui corrige avec bienveillance.
+        # La démarche extraite n'est jamais retirée, seulement raccourcie
+        return self.token_budget.fit(
+            "detailed_analysis",
+            lambda max_items, max_chars: DETAILED_ANALYSIS_PROMPT.render(
+                question=question,
+                type_name=exercise_data.get("type_name", exercise_type),
+                expected_answer=exercise_data.get("expected_answer", "N/A"),
+                steps_text="\n".join(
+                    shrink_list(steps, max_items and max(max_items * 2, 4), max_chars)
+                ),
+                method_used=step_analysis.get("method_used", "Non identifiée"),
+                reasoning_errors=", ".join(
+                    shrink_list(
+                        step_analysis.get("reasoning_errors", []),
+                        max_items and max(max_items, 1),
+                        max_chars,
+                    )
+                ),
+            ),
+        )
 
-QUESTION: {question}
-TYPE: {exercise_data.get('type_name', exercise_type)}
-RÉPONSE ATTENDUE: {exercise_data.get('expected_answer', 'N/A')}
+    def _build_single_pass_prompt(
+        self,
+        exercise_type: str,
+        exercise_data: Dict[str, Any],
+        question: str,
+        student_history: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Construit le prompt de correction en un seul appel (démarche + feedback)"""
+
+        return self.token_budget.fit(
+            "single_pass",
+            lambda max_items, max_chars: SINGLE_PASS_PROMPT.render(
+                question=question,
+                type_name=exercise_data.get("type_name", exercise_type),
+                expected_answer=exercise_data.get("expected_answer", "N/A"),
+                history_context=self._history_context(student_history, max_items, max_chars),
+            ),
+        )
 
-DÉMARCHE IDENTIFIÉE DE L'ÉLÈVE:
-{steps_text}
+    def _parse_single_pass(self, response_text: str) -> Dict[str, Any]:
+        """Parse une correction en un seul appel vers le même format que le mode deux étapes"""
 
-MÉTHODE UTILISÉE: {step_analysis.get('method_used', 'Non identifiée')}
-ERREURS DE RAISONNEMENT: {', '.join(step_analysis.get('reasoning_errors', []))}
+        # Feedback en dernier: c'est son résultat de parsing (regex possible) qui est mesuré
+        parsed_steps = self._parse_step_analysis(response_text)
+        feedback = self._parse_feedback(response_text)
 
-INSTRUCTIONS:
-1. Utilise l'analyse de la démarche pour donner un feedback précis
-2. Pour chaque étape incorrecte, explique pourquoi et comment corriger
-3. Valorise les étapes correctes et les bonnes méthodes
-4. Propose une correction qui suit la logique de l'élève quand c'est possible
-5. Adapte le niveau d'explication selon les difficultés identifiées
+        step_analysis = {
+            "steps": parsed_steps.get("steps", []),
+            "method_used": parsed_steps.get("method_used", ""),
+            "alternative_methods": parsed_steps.get("alternative_methods", []),
+            "reasoning_errors": parsed_steps.get("reasoning_errors", []),
+        }
+        feedback["step_analysis"] = step_analysis
+        feedback["reasoning_steps"] = step_analysis["steps"]
 
-Réponds en JSON:
-{{
-    "feedback": "Commentaire général bienveillant (2-3 phrases)",
-    "errors": ["erreur 1 avec contexte", "erreur 2 avec contexte"],
-    "good_points": ["point positif 1 détaillé", "point positif 2 détaillé"],
-    "correction": "Correction détaillée étape par étape avec explications",
-    "score": "Note sur 20 ou évaluation qualitative",
-    "next_steps": ["Recommandations pour progresser"],
-    "personalized_tips": ["Conseils personnalisés basés sur les erreurs"]
-}}"""
+        return feedback
 
     def _parse_step_analysis(self, response_text: str) -> Dict[str, Any]:
         """Parse l'analyse étape par étape"""
 
-        import json
-        import re
-
-        json_match = re.search(
-            r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", response_text, re.DOTALL
-        )
-
-        if json_match:
-            try:
-                json_str = json_match.group()
-                json_str = re.sub(r"```json\s*", "", json_str)
-                json_str = re.sub(r"```\s*", "", json_str)
-                return json.loads(json_str)
-            except (json.JSONDecodeError, AttributeError):
-                pass
+        step_analysis, outcome = parse_json_object(response_text)
+        note_parse(outcome)
+        if step_analysis is not None:
+            return step_analysis
 
         return {"steps": [], "method_used": "", "reasoning_errors": []}
 
     def _parse_exercise(self, response_text: str, exercise_type: str) -> Dict[str, Any]:
         """Parse la réponse de Gemini pour extraire l'exercice généré"""
 
-        import json
-        import re
+        exercise_data, outcome = parse_json_object(response_text)
+        note_parse(outcome)
+        if exercise_data is not None:
+            exercise = {
+                "type": exercise_type,
+                "type_name": exercise_data.get("type_name", exercise_type),
+                "question": exercise_data.get("question", ""),
+                "exercise_data": exercise_data,
+                "expected_answer": str(exercise_data.get("expected_answer", "")),
+                "exercise_info": str(exercise_data),
+            }
+        else:
+            # Fallback: retourner un exercice basique
+            exercise = {
+                "type": exercise_type,
+                "type_name": exercise_type,
+                "question": response_text[:500],
+                "exercise_data": {},
+                "expected_answer": "",
+                "exercise_info": "",
+            }
 
-        json_match = re.search(
-            r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", response_text, re.DOTALL
-        )
+        if self.verifier is None:
+            return exercise
 
-        if json_match:
-            try:
-                json_str = json_match.group()
-                json_str = re.sub(r"```json\s*", "", json_str)
-                json_str = re.sub(r"```\s*", "", json_str)
-                exercise_data = json.loads(json_str)
-
-                return {
-                    "type": exercise_type,
-                    "type_name": exercise_data.get("type_name", exercise_type),
-                    "question": exercise_data.get("question", ""),
-                    "exercise_data": exercise_data,
-                    "expected_answer": str(exercise_data.get("expected_answer", "")),
-                    "exercise_info": str(exercise_data),
-                }
-            except (json.JSONDecodeError, AttributeError):
-                pass
-
-        # Fallback: retourner un exercice basique
-        return {
-            "type": exercise_type,
-            "type_name": exercise_type,
-            "question": response_text[:500],
-            "exercise_data": {},
-            "expected_answer": "",
-            "exercise_info": "",
-        }
+        # Réponse attendue recalculée localement plutôt que de redemander un exercice
+        status = self.verifier.verify(exercise)
+        note_verification(status)
+        if status == VERIFY_REJECTED:
+            return {
+                "error": "Exercice rejeté: " + "; ".join(exercise["verification"]["issues"]),
+                # Gemini a répondu: ce n'est pas une panne du service
+                "rejected": True,
+                "question": "",
+                "exercise_data": {},
+            }
+        exercise["exercise_info"] = str(exercise["exercise_data"])
+        return exercise
 
     def _parse_feedback(self, response_text: str) -> Dict[str, Any]:
         """Parse la réponse de Gemini pour extraire le feedback structuré"""
 
-        import json
         import re
 
-        # Essayer d'extraire le JSON de la réponse (plusieurs tentatives)
-        # Pattern 1: JSON entre accolades
-        json_match = re.search(
-            r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", response_text, re.DOTALL
-        )
+        # Extraire le JSON de la réponse (blocs ```json, texte autour, troncature...)
+        feedback_data, outcome = parse_json_object(response_text)
 
-        if json_match:
-            try:
-                json_str = json_match.group()
-                # Nettoyer le JSON (enlever les markdown code blocks)
-                json_str = re.sub(r"```json\s*", "", json_str)
-                json_str = re.sub(r"```\s*", "", json_str)
-                feedback_data = json.loads(json_str)
-
-                # S'assurer que tous les champs sont présents
-                return {
-                    "feedback": feedback_data.get("feedback", response_text),
-                    "errors": feedback_data.get("errors", []),
-                    "good_points": feedback_data.get("good_points", []),
-                    "correction": feedback_data.get("correction", ""),
-                    "score": feedback_data.get("score", "Non évalué"),
-                    "next_steps": feedback_data.get("next_steps", []),
-                    "personalized_tips": feedback_data.get("personalized_tips", []),
-                }
-            except (json.JSONDecodeError, AttributeError):
-                pass
+        if feedback_data is not None:
+            note_parse(outcome)
+            # S'assurer que tous les champs sont présents
+            return {
+                "feedback": feedback_data.get("feedback", response_text),
+                "errors": feedback_data.get("errors", []),
+                "good_points": feedback_data.get("good_points", []),
+                "correction": feedback_data.get("correction", ""),
+                "score": feedback_data.get("score", "Non évalué"),
+                "next_steps": feedback_data.get("next_steps", []),
+                "personalized_tips": feedback_data.get("personalized_tips", []),
+            }
 
         # Si pas de JSON valide, parser manuellement avec regex
+        note_parse("regex")
         errors = re.findall(
             r"(?:erreur|Erreur|❌)[:\-]?\s*(.+?)(?:\n|$)", response_text, re.IGNORECASE
         )
@@ -389,7 +885,11 @@ Réponds en JSON:
         }
 
     def generate_exercise(
-        self, exercise_type: str, difficulty: str = "moyen"
+        self,
+        exercise_type: str,
+        difficulty: str = "moyen",
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
     ) -> Dict[str, Any]:
         """
         Génère un exercice de statistiques avec Gemini
@@ -397,6 +897,8 @@ Réponds en JSON:
         Args:
             exercise_type: Type d'exercice (effectif, frequence, moyenne, probleme)
             difficulty: Niveau de difficulté (facile, moyen, difficile)
+            use_cache: Autoriser le cache disque des réponses pour cet appel
+            timeout: Délai maximal (secondes) de génération (None: pas de limite)
 
         Returns:
             Dictionnaire avec question, données, réponse attendue
@@ -405,123 +907,50 @@ Réponds en JSON:
         prompt = self._build_exercise_prompt(exercise_type, difficulty)
 
         try:
-            response = self.model.generate_content(prompt)
-            # Parser la réponse pour extraire l'exercice
-            exercise = self._parse_exercise(response.text, exercise_type)
+            with self.telemetry.track("generate_exercise"):
+                # Exercice extrait et vérifié avant toute mise en cache
+                exercise = self._generate_text(
+                    "generate_exercise",
+                    prompt,
+                    use_cache=use_cache,
+                    cache_variants=self.exercise_cache_variants,
+                    generation_config=self._generation_config("exercise"),
+                    timeout=timeout,
+                    parse=lambda text: self._parse_exercise(text, exercise_type),
+                )
             return exercise
         except Exception as e:
-            return {
-                "error": f"Erreur lors de la génération: {str(e)}",
-                "question": "",
-                "exercise_data": {},
-            }
+            return self._generation_error(e)
+
+    @staticmethod
+    def _generation_error(error: Exception) -> Dict[str, Any]:
+        """
+        Résultat d'une génération en échec; "local_timeout" signale une échéance
+        atteinte en attente du quota local, qui ne met pas en cause le service,
+        "deadline_exceeded" une échéance de l'appel atteinte pendant la requête
+        """
+        result: Dict[str, Any] = {
+            "error": f"Erreur lors de la génération: {str(error)}",
+            "question": "",
+            "exercise_data": {},
+        }
+        if isinstance(error, LocalTimeout):
+            result["local_timeout"] = True
+        elif isinstance(error, api_exceptions.DeadlineExceeded):
+            result["deadline_exceeded"] = True
+        return result
 
     def _build_exercise_prompt(self, exercise_type: str, difficulty: str) -> str:
         """Construit le prompt pour générer un exercice avec Gemini"""
 
-        base_instruction = f"""Tu es un professeur de mathématiques créatif qui génère des exercices de statistiques pour des élèves de 3ème.
-
-Niveau de difficulté: {difficulty}
-- Facile: 8-12 valeurs, nombres simples (10-15)
-- Moyen: 12-18 valeurs, nombres variés (8-16)
-- Difficile: 18-25 valeurs, nombres plus variés (5-20)
-
-IMPORTANT: Génère un exercice ORIGINAL et VARIÉ. Ne répète pas toujours les mêmes exemples.
-Utilise des contextes différents (notes, tailles, âges, températures, etc.).
-
-Réponds UNIQUEMENT en JSON valide, sans texte avant ou après."""
-
-        prompts = {
-            "effectif": f"""{base_instruction}
-
-Type d'exercice: Tableau d'effectifs
-
-Génère un exercice où:
-1. Tu fournis une liste de valeurs d'un caractère (choisis un contexte intéressant: notes, tailles, âges, etc.)
-2. L'élève doit compléter un tableau d'effectifs
-3. L'exercice est adapté au niveau 3ème et à la difficulté {difficulty}
-
-Format JSON:
-{{
-    "question": "Énoncé complet et clair de l'exercice avec contexte",
-    "data": ["valeur1", "valeur2", ...],
-    "expected_answer": {{
-        "tableau": {{"valeur1": effectif1, "valeur2": effectif2, ...}},
-        "total": nombre_total
-    }},
-    "type_name": "Tableau d'effectifs",
-    "context": "Description du contexte (ex: notes d'un contrôle)"
-}}""",
-            "frequence": f"""{base_instruction}
-
-Type d'exercice: Calcul de fréquences
-
-Génère un exercice où:
-1. Tu fournis un tableau d'effectifs (choisis un format: décimal, fraction, ou pourcentage)
-2. L'élève doit calculer les fréquences
-3. L'exercice permet l'utilisation de la formule ou du produit en croix
-4. L'exercice est adapté au niveau 3ème et à la difficulté {difficulty}
-
-Format JSON:
-{{
-    "question": "Énoncé complet avec tableau d'effectifs et demande de calcul",
-    "data": {{"valeur1": effectif1, "valeur2": effectif2, ...}},
-    "total": nombre_total,
-    "expected_answer": {{
-        "frequences": {{"valeur1": freq1, "valeur2": freq2, ...}},
-        "format": "decimal|fraction|pourcentage"
-    }},
-    "type_name": "Calcul de fréquences",
-    "context": "Description du contexte"
-}}""",
-            "moyenne": f"""{base_instruction}
-
-Type d'exercice: Moyenne pondérée
-
-Génère un exercice où:
-1. Tu fournis une série statistique avec effectifs (choisis un contexte intéressant)
-2. L'élève doit calculer la moyenne pondérée
-3. L'exercice est adapté au niveau 3ème et à la difficulté {difficulty}
-
-Format JSON:
-{{
-    "question": "Énoncé complet avec série statistique et demande de calcul",
-    "data": {{"valeur1": effectif1, "valeur2": effectif2, ...}},
-    "expected_answer": {{
-        "moyenne": valeur_moyenne,
-        "calculs": "détail des calculs étape par étape"
-    }},
-    "type_name": "Moyenne pondérée",
-    "context": "Description du contexte"
-}}""",
-            "probleme": f"""{base_instruction}
-
-Type d'exercice: Problème textuel de statistiques
-
-Génère un problème où:
-1. C'est une situation concrète et réaliste (choisis un contexte varié: sport, école, vie quotidienne, etc.)
-2. Le problème implique des calculs statistiques (moyenne, effectifs, fréquences)
-3. Le problème demande une interprétation du résultat
-4. Le problème est adapté au niveau 3ème et à la difficulté {difficulty}
-
-Format JSON:
-{{
-    "question": "Énoncé complet du problème avec situation concrète",
-    "data": "liste des données fournies dans le problème",
-    "expected_answer": {{
-        "reponse": "réponse attendue",
-        "calculs": "détail des calculs étape par étape",
-        "interpretation": "interprétation du résultat dans le contexte"
-    }},
-    "type_name": "Problème textuel",
-    "context": "Description du contexte du problème"
-}}""",
-        }
-
-        return prompts.get(exercise_type, prompts["effectif"])
+        template = EXERCISE_PROMPTS.get(exercise_type, EXERCISE_PROMPTS["effectif"])
+        return template.render(difficulty=difficulty)
 
     def analyze_exercise_examples(
-        self, images: List[Image.Image], chapter: str = "statistiques"
+        self,
+        images: List[Image.Image],
+        chapter: str = "statistiques",
+        use_cache: bool = True,
     ) -> Dict[str, Any]:
         """
         Analyse plusieurs exemples d'exercices pour vérifier leur complétude
@@ -530,6 +959,7 @@ Format JSON:
         Args:
             images: Liste d'images PIL d'exercices (3-10 images)
             chapter: Nom du chapitre (par défaut "statistiques")
+            use_cache: Autoriser le cache disque des réponses pour cet appel
 
         Returns:
             Dictionnaire avec validation, analyse et exemples extraits
@@ -546,8 +976,14 @@ Format JSON:
 
         try:
             # Analyser toutes les images ensemble
-            response = self.model.generate_content([prompt] + images)
-            analysis = self._parse_examples_analysis(response.text)
+            with self.telemetry.track("analyze_exercise_examples"):
+                response_text = self._generate_text(
+                    "analyze_exercise_examples",
+                    [prompt] + images,
+                    use_cache=use_cache,
+                    generation_config=self._generation_config("examples_analysis"),
+                )
+                analysis = self._parse_examples_analysis(response_text)
 
             return analysis
 
@@ -561,87 +997,23 @@ Format JSON:
     def _build_examples_analysis_prompt(self, chapter: str, num_images: int) -> str:
         """Construit le prompt pour analyser les exemples d'exercices"""
 
-        return f"""Tu es un expert en pédagogie mathématique. Analyse ces {num_images} exemples d'exercices de statistiques de niveau 3ème.
-
-CHAPITRE: {chapter}
-
-INSTRUCTIONS:
-1. Pour chaque image, identifie:
-   - Le type d'exercice (effectif, frequence, moyenne, probleme)
-   - L'énoncé complet de l'exercice
-   - Si l'exercice est complet (énoncé + données + question claire)
-   - Le niveau de difficulté (facile, moyen, difficile)
-   - Le contexte (notes, tailles, âges, etc.)
-
-2. Vérifie que tous les exercices sont:
-   - En lien avec le chapitre des statistiques
-   - Adaptés au niveau 3ème
-   - Complets (énoncé, données, question)
-
-3. Extrais les caractéristiques communes:
-   - Styles d'énoncés
-   - Types de contextes utilisés
-   - Formats de présentation
-   - Niveaux de difficulté
-
-Réponds UNIQUEMENT en JSON valide:
-
-{{
-    "valid": true/false,
-    "validation_errors": ["erreur 1", "erreur 2"] si valid=false,
-    "examples": [
-        {{
-            "exercise_number": 1,
-            "type": "effectif|frequence|moyenne|probleme",
-            "question": "Énoncé complet de l'exercice",
-            "context": "Description du contexte",
-            "difficulty": "facile|moyen|difficile",
-            "is_complete": true/false,
-            "data": "Données de l'exercice si visible"
-        }}
-    ],
-    "common_characteristics": {{
-        "styles": ["style 1", "style 2"],
-        "contexts": ["contexte 1", "contexte 2"],
-        "formats": ["format 1", "format 2"],
-        "difficulty_range": "facile à difficile"
-    }},
-    "recommendations": "Recommandations pour générer des exercices similaires"
-}}"""
+        return EXAMPLES_ANALYSIS_PROMPT.render(chapter=chapter, num_images=num_images)
 
     def _parse_examples_analysis(self, response_text: str) -> Dict[str, Any]:
         """Parse l'analyse des exemples d'exercices"""
 
-        import json
-        import re
-
-        json_match = re.search(
-            r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}", response_text, re.DOTALL
-        )
+        analysis, outcome = parse_json_object(response_text)
+        note_parse(outcome)
 
-        if json_match:
-            try:
-                json_str = json_match.group()
-                json_str = re.sub(r"```json\s*", "", json_str)
-                json_str = re.sub(r"```\s*", "", json_str)
-                analysis = json.loads(json_str)
-
-                # S'assurer que tous les champs sont présents
-                return {
-                    "valid": analysis.get("valid", False),
-                    "validation_errors": analysis.get("validation_errors", []),
-                    "examples": analysis.get("examples", []),
-                    "common_characteristics": analysis.get(
-                        "common_characteristics", {}
-                    ),
-                    "recommendations": analysis.get("recommendations", ""),
-                }
-            except (json.JSONDecodeError, AttributeError) as e:
-                return {
-                    "valid": False,
-                    "error": f"Erreur de parsing JSON: {str(e)}",
-                    "examples": [],
-                }
+        if analysis is not None:
+            # S'assurer que tous les champs sont présents
+            return {
+                "valid": analysis.get("valid", False),
+                "validation_errors": analysis.get("validation_errors", []),
+                "examples": analysis.get("examples", []),
+                "common_characteristics": analysis.get("common_characteristics", {}),
+                "recommendations": analysis.get("recommendations", ""),
+            }
 
         return {
             "valid": False,
@@ -654,6 +1026,8 @@ Réponds UNIQUEMENT en JSON valide:
         exercise_type: str,
         difficulty: str,
         examples_analysis: Dict[str, Any],
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
     ) -> Dict[str, Any]:
         """
         Génère un exercice en s'inspirant des exemples fournis
@@ -663,6 +1037,8 @@ Réponds UNIQUEMENT en JSON valide:
             exercise_type: Type d'exercice souhaité
             difficulty: Niveau de difficulté
             examples_analysis: Analyse des exemples d'exercices
+            use_cache: Autoriser le cache disque des réponses pour cet appel
+            timeout: Délai maximal (secondes) de génération (None: pas de limite)
 
         Returns:
             Dictionnaire avec l'exercice généré
@@ -673,16 +1049,20 @@ Réponds UNIQUEMENT en JSON valide:
         )
 
         try:
-            response = self.model.generate_content(prompt)
-            exercise = self._parse_exercise(response.text, exercise_type)
+            with self.telemetry.track("generate_exercise_from_examples"):
+                exercise = self._generate_text(
+                    "generate_exercise_from_examples",
+                    prompt,
+                    use_cache=use_cache,
+                    cache_variants=self.exercise_cache_variants,
+                    generation_config=self._generation_config("exercise"),
+                    timeout=timeout,
+                    parse=lambda text: self._parse_exercise(text, exercise_type),
+                )
             exercise["inspired_by_examples"] = True
             return exercise
         except Exception as e:
-            return {
-                "error": f"Erreur lors de la génération: {str(e)}",
-                "question": "",
-                "exercise_data": {},
-            }
+            return self._generation_error(e)
 
     def _build_exercise_from_examples_prompt(
         self,
@@ -692,43 +1072,34 @@ Réponds UNIQUEMENT en JSON valide:
     ) -> str:
         """Construit le prompt pour générer un exercice inspiré des exemples"""
 
-        examples_text = "\n".join(
-            [
-                f"Exemple {i+1} ({ex.get('type', 'inconnu')}): {ex.get('question', '')[:200]}"
-                for i, ex in enumerate(examples_analysis.get("examples", [])[:5])
-            ]
-        )
-
+        examples = [
+            f"Exemple {i+1} ({ex.get('type', 'inconnu')}): {ex.get('question', '')[:200]}"
+            for i, ex in enumerate(examples_analysis.get("examples", [])[:5])
+        ]
         characteristics = examples_analysis.get("common_characteristics", {})
-        styles = ", ".join(characteristics.get("styles", []))
-        contexts = ", ".join(characteristics.get("contexts", []))
-
-        return f"""Tu es un professeur de mathématiques créatif. Génère un NOUVEL exercice de statistiques de niveau 3ème.
-
-TYPE D'EXERCICE DEMANDÉ: {exercise_type}
-DIFFICULTÉ: {difficulty}
-
-EXEMPLES DE RÉFÉRENCE (à utiliser comme inspiration, PAS à reproduire):
-{examples_text}
-
-CARACTÉRISTIQUES COMMUNES DES EXEMPLES:
-- Styles: {styles}
-- Contextes: {contexts}
-- Formats: {', '.join(characteristics.get('formats', []))}
 
-INSTRUCTIONS IMPORTANTES:
-1. Inspire-toi du STYLE et du FORMAT des exemples
-2. Utilise des CONTEXTES similaires mais différents
-3. Crée un exercice NOUVEAU et ORIGINAL (pas une copie)
-4. Adapte au niveau 3ème et à la difficulté {difficulty}
-5. Assure-toi que l'exercice est complet et clair
-
-Réponds UNIQUEMENT en JSON valide:
-
-{{
-    "question": "Énoncé complet et original de l'exercice",
-    "data": "données de l'exercice",
-    "expected_answer": {{"réponse": "réponse attendue"}},
-    "type_name": "{exercise_type}",
-    "context": "Description du contexte utilisé"
-}}"""
+        # Au moins un exemple est gardé: c'est la raison d'être de ce prompt
+        return self.token_budget.fit(
+            "exercise_from_examples",
+            lambda max_items, max_chars: EXERCISE_FROM_EXAMPLES_PROMPT.render(
+                exercise_type=exercise_type,
+                difficulty=difficulty,
+                data_format=EXAMPLES_DATA_FORMATS.get(
+                    exercise_type, EXAMPLES_DATA_FORMATS["effectif"]
+                ),
+                examples_text="\n".join(
+                    shrink_list(
+                        examples, max_items and max(max_items, 1), max_chars and max_chars * 2
+                    )
+                ),
+                styles=", ".join(
+                    shrink_list(characteristics.get("styles", []), max_items, max_chars)
+                ),
+                contexts=", ".join(
+                    shrink_list(characteristics.get("contexts", []), max_items, max_chars)
+                ),
+                formats=", ".join(
+                    shrink_list(characteristics.get("formats", []), max_items, max_chars)
+                ),
+            ),
+        )
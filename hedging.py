@@ -0,0 +1,304 @@
+"""
+Requêtes couvertes (hedged requests) pour les appels Gemini sensibles à la latence
+Si la première requête n'a pas répondu au bout du p90 de latence observé,
+une seconde part (sur un modèle alternatif si possible); la première réponse gagne
+"""
+
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from model_registry import ModelRegistry
+from telemetry import merge_annotations, run_annotated, run_annotated_async
+
+# Suffixe des opérations dont on mesure le délai avant le premier fragment (streaming)
+FIRST_CHUNK_SUFFIX = ":first_chunk"
+
+
+class Hedger:
+    """Politique de couverture des requêtes lentes, avec compteurs de coût"""
+
+    def __init__(
+        self,
+        operations: Iterable[str] = ("generate_exercise", "tutor"),
+        quantile: float = 0.9,
+        min_samples: int = 10,
+        max_workers: int = 16,
+    ):
+        """
+        Initialise la couverture des requêtes
+
+        Args:
+            operations: Opérations couvertes (les autres partent normalement)
+            quantile: Percentile de latence au-delà duquel la seconde requête part
+            min_samples: Mesures nécessaires avant de couvrir (sinon pas de couverture)
+            max_workers: Threads disponibles pour les requêtes synchrones en parallèle
+        """
+        self.operations = set(operations)
+        self.quantile = quantile
+        self.min_samples = min_samples
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gemini-hedge"
+        )
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            # Perdants abandonnés (une requête synchrone partie n'est pas interrompue)
+            "abandoned": 0,
+            "extra_requests": 0,
+            "extra_prompt_tokens": 0,
+            "extra_output_tokens": 0,
+        }
+
+    def applies(self, operation: str) -> bool:
+        """Indique si une opération est couverte"""
+        return operation in self.operations
+
+    def hedge_delay(
+        self, registry: ModelRegistry, name: str, operation: str
+    ) -> Optional[float]:
+        """Attente avant la seconde requête (None: pas assez de mesures pour couvrir)"""
+        return registry.latency_percentile(
+            name, operation, self.quantile, min_samples=self.min_samples
+        )
+
+    def run(
+        self,
+        registry: ModelRegistry,
+        operation: str,
+        attempt: Callable[[str, Any], Any],
+        tokens: int = 0,
+    ) -> Any:
+        """
+        Exécute attempt(nom, modèle) avec couverture, et retourne la première réponse
+
+        Une tentative en échec passe au candidat suivant, comme sans couverture.
+        Une requête synchrone déjà partie ne peut pas être interrompue: le perdant
+        est annulé s'il attend encore un thread, sinon sa réponse est ignorée.
+        """
+        return self._race(registry, operation, attempt, operation, tokens, self._abandon_losers)
+
+    async def run_async(
+        self,
+        registry: ModelRegistry,
+        operation: str,
+        attempt: Callable[[str, Any], Awaitable[Any]],
+        tokens: int = 0,
+    ) -> Any:
+        """Équivalent asynchrone de run(); les perdants sont réellement annulés"""
+        candidates = deque(registry.candidates(operation))
+        primary = candidates.popleft()
+        delay = self.hedge_delay(registry, primary[0], operation)
+        self._count("calls")
+        annotations: Dict[asyncio.Future, Dict[str, Any]] = {}
+
+        def start(name: str, model: Any) -> asyncio.Future:
+            scope: Dict[str, Any] = {}
+            task = asyncio.ensure_future(run_annotated_async(scope, attempt(name, model)))
+            annotations[task] = scope
+            return task
+
+        pending = {start(*primary)}
+        hedges: Set[asyncio.Future] = set()
+        failed = None
+
+        while pending:
+            finished, pending = await asyncio.wait(
+                pending,
+                timeout=delay if not hedges else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not finished:
+                self._count_hedge(tokens)
+                hedge = start(*(candidates.popleft() if candidates else primary))
+                hedges.add(hedge)
+                pending.add(hedge)
+                continue
+            for task in finished:
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                        self._count("abandoned")
+                    if task in hedges:
+                        self._count("hedge_wins")
+                    merge_annotations(annotations[task])
+                    return task.result()
+                failed = task
+            if not pending and candidates:
+                pending.add(start(*candidates.popleft()))
+
+        merge_annotations(annotations[failed])
+        raise failed.exception()
+
+    def first_chunk(
+        self,
+        registry: ModelRegistry,
+        operation: str,
+        open_stream: Callable[[str, Any], Iterator[str]],
+        tokens: int = 0,
+    ) -> Iterator[str]:
+        """
+        Démarre un streaming couvert: si le premier fragment tarde au-delà du p90,
+        un second streaming démarre; le premier à produire un fragment est conservé
+        et l'autre est fermé dès qu'il en produit un (fin de sa lecture). Un
+        streaming en échec avant son premier fragment passe au candidat suivant
+
+        Returns:
+            Itérateur des fragments du streaming gagnant
+        """
+
+        def start(name: str, model: Any) -> Tuple[Iterator[str], str]:
+            stream = open_stream(name, model)
+            return stream, next(stream)
+
+        def chained(stream: Iterator[str], first_text: str) -> Iterator[str]:
+            yield first_text
+            yield from stream
+
+        # La suite du streaming gagnant s'exécute chez l'appelant, hors des
+        # annotations de sa tentative
+        return chained(
+            *self._race(
+                registry,
+                operation,
+                start,
+                operation + FIRST_CHUNK_SUFFIX,
+                tokens,
+                self._close_losers,
+            )
+        )
+
+    def record_loser_usage(self, response: Any):
+        """Ajoute au coût les tokens générés par une requête perdante terminée"""
+        usage = getattr(response, "usage_metadata", None)
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        with self._lock:
+            self._stats["extra_output_tokens"] += output_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Compteurs de couverture: taux de couverture, victoires et coût supplémentaire"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = (
+            round(stats["hedged"] / stats["calls"], 3) if stats["calls"] else 0.0
+        )
+        stats["hedge_win_rate"] = (
+            round(stats["hedge_wins"] / stats["hedged"], 3) if stats["hedged"] else 0.0
+        )
+        return stats
+
+    def shutdown(self):
+        """Arrête les threads de couverture"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _race(
+        self,
+        registry: ModelRegistry,
+        operation: str,
+        fn: Callable[[str, Any], Any],
+        latency_operation: str,
+        tokens: int,
+        abandon: Callable[[Iterable[Future]], None],
+    ) -> Any:
+        """
+        Lance fn(nom, modèle) sur le premier candidat, une couverture s'il tarde
+        au-delà du percentile de latency_operation, et le candidat suivant après
+        chaque échec; abandon(perdants) est appelé une fois la course gagnée
+
+        Returns:
+            Le résultat de la première tentative réussie (sinon la dernière erreur est levée)
+        """
+        candidates = deque(registry.candidates(operation))
+        primary = candidates.popleft()
+        delay = self.hedge_delay(registry, primary[0], latency_operation)
+        self._count("calls")
+        # Annotations de télémétrie de chaque tentative: seules celles retenues sont reportées
+        annotations: Dict[Future, Dict[str, Any]] = {}
+
+        pending = {self._submit(annotations, fn, *primary)}
+        hedges: Set[Future] = set()
+        failed = None
+
+        while pending:
+            # Sans mesures suffisantes (delay None), pas de couverture; au plus une par appel
+            finished, pending = wait(
+                pending, timeout=delay if not hedges else None, return_when=FIRST_COMPLETED
+            )
+            if not finished:
+                # Requête lente: couverture, sur un modèle alternatif si possible
+                self._count_hedge(tokens)
+                hedge = self._submit(
+                    annotations, fn, *(candidates.popleft() if candidates else primary)
+                )
+                hedges.add(hedge)
+                pending.add(hedge)
+                continue
+            for future in finished:
+                if future.exception() is None:
+                    abandon(pending)
+                    if future in hedges:
+                        self._count("hedge_wins")
+                    merge_annotations(annotations[future])
+                    return future.result()
+                failed = future
+            if not pending and candidates:
+                # Échec: candidat suivant, comme sans couverture
+                pending.add(self._submit(annotations, fn, *candidates.popleft()))
+
+        merge_annotations(annotations[failed])
+        raise failed.exception()
+
+    def _submit(
+        self, annotations: Dict[Future, Dict[str, Any]], fn: Callable[..., Any], *args: Any
+    ) -> Future:
+        """
+        Soumet fn au pool dans une copie du contexte de l'appelant; ses annotations
+        de télémétrie sont collectées à part, dans annotations[future]
+        """
+        scope: Dict[str, Any] = {}
+        future = self._executor.submit(
+            contextvars.copy_context().run, run_annotated, scope, fn, *args
+        )
+        annotations[future] = scope
+        return future
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _count_hedge(self, tokens: int):
+        with self._lock:
+            self._stats["hedged"] += 1
+            self._stats["extra_requests"] += 1
+            self._stats["extra_prompt_tokens"] += tokens
+
+    def _abandon_losers(self, losers: Iterable[Future]):
+        for loser in losers:
+            self._count("abandoned")
+            if not loser.cancel():
+                # Déjà en cours: on ignore sa réponse mais on compte ce qu'elle a coûté
+                loser.add_done_callback(self._record_abandoned)
+
+    def _record_abandoned(self, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            self.record_loser_usage(future.result())
+
+    def _close_losers(self, losers: Iterable[Future]):
+        for loser in losers:
+            self._count("abandoned")
+            loser.add_done_callback(self._close_stream)
+
+    @staticmethod
+    def _close_stream(future: Future):
+        """Ferme le streaming perdant dès qu'il a produit son premier fragment"""
+        if not future.cancelled() and future.exception() is None:
+            stream, _ = future.result()
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
@@ -0,0 +1,199 @@
+"""
+Prétraitement des photos de copies avant l'envoi à Gemini
+Redresse, recadre, réduit et réencode les images pour limiter les octets envoyés
+"""
+
+import io
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageFilter, ImageOps
+
+
+class ImagePreprocessor:
+    """Pipeline de prétraitement d'une photo de copie manuscrite"""
+
+    def __init__(
+        self,
+        max_long_edge: int = 1600,
+        crop_page: bool = True,
+        grayscale: bool = True,
+        autocontrast: bool = True,
+        output_format: str = "JPEG",
+        target_bytes: int = 300 * 1024,
+        min_quality: int = 40,
+        max_quality: int = 90,
+    ):
+        """
+        Initialise le pipeline
+
+        Args:
+            max_long_edge: Taille maximale (pixels) du plus grand côté
+            crop_page: Recadrer automatiquement sur la feuille
+            grayscale: Convertir en niveaux de gris
+            autocontrast: Normaliser le contraste
+            output_format: Format de réencodage (JPEG ou WEBP)
+            target_bytes: Budget d'octets visé pour l'image encodée
+            min_quality: Qualité minimale acceptée avant de réduire la résolution
+            max_quality: Qualité de départ de l'encodage
+        """
+        self.max_long_edge = max_long_edge
+        self.crop_page = crop_page
+        self.grayscale = grayscale
+        self.autocontrast = autocontrast
+        self.output_format = output_format.upper()
+        self.target_bytes = target_bytes
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+
+    def process(
+        self, image: Image.Image, original_bytes: Optional[int] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Prétraite une image et la réencode
+
+        Args:
+            image: Image PIL telle qu'uploadée
+            original_bytes: Taille du fichier uploadé (estimée si absente)
+
+        Returns:
+            (blob {"mime_type", "data"} utilisable directement par Gemini, métriques)
+        """
+        start = time.perf_counter()
+        original_size = image.size
+        if original_bytes is None:
+            original_bytes = image.width * image.height * len(image.getbands())
+
+        if image.format == "JPEG" and max(image.size) > 2 * self.max_long_edge:
+            # Décodage JPEG directement à résolution réduite (1/2, 1/4 ou 1/8)
+            scale = self.max_long_edge / max(image.size)
+            image.draft(image.mode, (int(image.width * scale), int(image.height * scale)))
+
+        processed = ImageOps.exif_transpose(image)
+        if processed.mode not in ("RGB", "L"):
+            processed = processed.convert("RGB")
+
+        if self.crop_page:
+            processed = self._crop_to_page(processed)
+
+        processed = self._downscale(processed, self.max_long_edge)
+
+        if self.grayscale:
+            processed = processed.convert("L")
+        if self.autocontrast:
+            processed = ImageOps.autocontrast(processed, cutoff=1)
+
+        data, quality, processed = self._encode_within_budget(processed)
+
+        metrics = {
+            "original_size": original_size,
+            "output_size": processed.size,
+            "original_bytes": original_bytes,
+            "output_bytes": len(data),
+            "bytes_saved": max(0, original_bytes - len(data)),
+            "compression_ratio": round(original_bytes / max(1, len(data)), 2),
+            "quality": quality,
+            "preprocess_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        blob = {"mime_type": f"image/{self.output_format.lower()}", "data": data}
+        return blob, metrics
+
+    def _crop_to_page(self, image: Image.Image) -> Image.Image:
+        """Recadre sur la zone claire principale (la feuille) si elle est nettement détectée"""
+
+        # Travailler sur une miniature pour la détection
+        probe = image.convert("L")
+        probe.thumbnail((512, 512))
+        threshold = self._otsu_threshold(probe.histogram())
+
+        mask = probe.point(lambda p: 255 if p > threshold else 0)
+        # Érosion pour ignorer les reflets isolés hors de la feuille
+        mask = mask.filter(ImageFilter.MinFilter(5))
+        bbox = mask.getbbox()
+        if not bbox:
+            return image
+
+        left, top, right, bottom = bbox
+        area_ratio = ((right - left) * (bottom - top)) / (probe.width * probe.height)
+        if area_ratio < 0.3 or area_ratio > 0.95:
+            # Pas de feuille distincte du fond: ne rien recadrer
+            return image
+
+        scale_x = image.width / probe.width
+        scale_y = image.height / probe.height
+        margin = 4
+        box = (
+            max(0, int((left - margin) * scale_x)),
+            max(0, int((top - margin) * scale_y)),
+            min(image.width, int((right + margin) * scale_x)),
+            min(image.height, int((bottom + margin) * scale_y)),
+        )
+        return image.crop(box)
+
+    @staticmethod
+    def _otsu_threshold(histogram) -> int:
+        """Seuil d'Otsu sur un histogramme de niveaux de gris (256 classes)"""
+        total = sum(histogram)
+        sum_all = sum(i * h for i, h in enumerate(histogram))
+        sum_bg, weight_bg = 0.0, 0
+        best_threshold, best_variance = 127, 0.0
+
+        for level, count in enumerate(histogram):
+            weight_bg += count
+            if weight_bg == 0:
+                continue
+            weight_fg = total - weight_bg
+            if weight_fg == 0:
+                break
+            sum_bg += level * count
+            mean_bg = sum_bg / weight_bg
+            mean_fg = (sum_all - sum_bg) / weight_fg
+            variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+            if variance > best_variance:
+                best_variance, best_threshold = variance, level
+
+        return best_threshold
+
+    @staticmethod
+    def _downscale(image: Image.Image, long_edge: int) -> Image.Image:
+        """Réduit l'image pour que son plus grand côté ne dépasse pas long_edge"""
+        if max(image.size) <= long_edge:
+            return image
+        scale = long_edge / max(image.size)
+        new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(new_size, Image.LANCZOS)
+
+    def _encode(self, image: Image.Image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.output_format, quality=quality, optimize=True)
+        return buffer.getvalue()
+
+    def _encode_within_budget(
+        self, image: Image.Image
+    ) -> Tuple[bytes, int, Image.Image]:
+        """
+        Cherche la meilleure qualité tenant dans target_bytes (recherche dichotomique),
+        en réduisant la résolution si même la qualité minimale dépasse le budget
+        """
+        for _ in range(4):
+            data = self._encode(image, self.max_quality)
+            if len(data) <= self.target_bytes:
+                return data, self.max_quality, image
+
+            low, high = self.min_quality, self.max_quality - 1
+            best = None
+            while low <= high:
+                quality = (low + high) // 2
+                candidate = self._encode(image, quality)
+                if len(candidate) <= self.target_bytes:
+                    best = (candidate, quality)
+                    low = quality + 1
+                else:
+                    high = quality - 1
+
+            if best:
+                return best[0], best[1], image
+
+            image = self._downscale(image, int(max(image.size) * 0.75))
+
+        return self._encode(image, self.min_quality), self.min_quality, image
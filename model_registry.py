@@ -0,0 +1,199 @@
+"""
+Registre des modèles Gemini candidats et routage selon la latence
+Sonde la disponibilité des modèles, suit leurs latences et taux d'erreur,
+et ordonne les candidats pour chaque appel (avec bascule sur le suivant)
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+
+class ModelRegistry:
+    """Suivi de santé et de latence des modèles, par modèle et par opération"""
+
+    def __init__(
+        self,
+        models: Dict[str, Any],
+        probe: Optional[Callable[[str], bool]] = None,
+        window: int = 50,
+        max_error_rate: float = 0.5,
+        failure_threshold: int = 3,
+        cooldown: float = 60.0,
+        max_attempts: int = 3,
+        error_horizon: float = 300.0,
+    ):
+        """
+        Initialise le registre
+
+        Args:
+            models: Modèles candidats {nom: objet modèle}, par ordre de préférence
+            probe: Fonction nom -> disponible, utilisée par probe() (None: pas de sonde)
+            window: Nombre d'appels récents conservés pour les percentiles
+            max_error_rate: Taux d'erreur au-delà duquel un modèle est déprioritisé
+            failure_threshold: Échecs consécutifs avant de mettre un modèle de côté
+            cooldown: Durée (secondes) pendant laquelle un modèle en échec est écarté
+            max_attempts: Nombre maximal de modèles essayés pour un même appel
+            error_horizon: Âge maximal (secondes) des échecs pris en compte dans le
+                taux d'erreur, pour qu'un modèle écarté finisse par être réessayé
+        """
+        self.models = dict(models)
+        self.names = list(self.models)
+        self.probe_fn = probe
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts
+        self.error_horizon = error_horizon
+
+        self._lock = threading.Lock()
+        # (modèle, opération) -> fenêtre de (horodatage, latence, succès)
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float, bool]]] = defaultdict(
+            lambda: deque(maxlen=self.window)
+        )
+        self._consecutive_failures: Dict[str, int] = defaultdict(int)
+        self._down_until: Dict[str, float] = {}
+        self._probe_results: Dict[str, bool] = {}
+        # Modèles dont la dernière sonde a échoué, classés en dernier jusqu'à
+        # ce qu'une sonde ou un appel réussisse (au-delà du cooldown)
+        self._probe_failed: Set[str] = set()
+
+    def probe(self) -> Dict[str, bool]:
+        """Sonde chaque modèle candidat et écarte ceux qui ne répondent pas"""
+        if self.probe_fn is None:
+            return {}
+
+        results = {}
+        for name in self.names:
+            start = time.perf_counter()
+            try:
+                available = bool(self.probe_fn(name))
+            except Exception:
+                available = False
+            results[name] = available
+
+            with self._lock:
+                self._probe_results[name] = available
+                if available:
+                    self._probe_failed.discard(name)
+                    self._down_until.pop(name, None)
+                    self._samples[(name, "probe")].append(
+                        (time.monotonic(), time.perf_counter() - start, True)
+                    )
+                else:
+                    self._probe_failed.add(name)
+                    self._down_until[name] = time.monotonic() + self.cooldown
+
+        return results
+
+    def record(self, name: str, operation: str, latency: float, ok: bool):
+        """Enregistre le résultat d'un appel"""
+        with self._lock:
+            self._samples[(name, operation)].append((time.monotonic(), latency, ok))
+            if ok:
+                self._consecutive_failures[name] = 0
+                self._probe_failed.discard(name)
+                self._down_until.pop(name, None)
+            else:
+                self._consecutive_failures[name] += 1
+                if self._consecutive_failures[name] >= self.failure_threshold:
+                    self._down_until[name] = time.monotonic() + self.cooldown
+
+    def candidates(self, operation: str = "default") -> List[Tuple[str, Any]]:
+        """
+        Retourne les modèles à essayer, du meilleur au moins bon
+
+        Les modèles sains passent avant ceux en échec, puis avant ceux dont la
+        sonde a échoué (modèle inexistant ou non activé); ensuite, le classement
+        suit la latence attendue (p50 corrigé du taux d'erreur). Un modèle sans
+        mesures reçoit la meilleure latence connue: à égalité, l'ordre de
+        préférence initial décide.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expected = {name: self._expected_latency(name, operation) for name in self.names}
+            known = [value for value in expected.values() if value is not None]
+            best_known = min(known) if known else 0.0
+
+            def sort_key(item):
+                index, name = item
+                is_down = self._down_until.get(name, 0) > now
+                error_rate = self._error_rate(name, operation)
+                latency = expected[name] if expected[name] is not None else best_known
+                return (
+                    is_down,
+                    name in self._probe_failed,
+                    error_rate > self.max_error_rate,
+                    latency,
+                    index,
+                )
+
+            ordered = sorted(enumerate(self.names), key=sort_key)
+
+        return [(name, self.models[name]) for _, name in ordered][: self.max_attempts]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Latences p50/p95, taux d'erreur et état par modèle et par opération"""
+        now = time.monotonic()
+        stats: Dict[str, Any] = {}
+        with self._lock:
+            for name in self.names:
+                operations = {}
+                for (model_name, operation), samples in self._samples.items():
+                    if model_name != name or not samples:
+                        continue
+                    latencies = sorted(latency for _, latency, _ in samples)
+                    operations[operation] = {
+                        "calls": len(samples),
+                        "p50_ms": round(self._percentile(latencies, 0.5) * 1000, 1),
+                        "p95_ms": round(self._percentile(latencies, 0.95) * 1000, 1),
+                        "error_rate": round(self._error_rate(name, operation), 3),
+                    }
+                stats[name] = {
+                    "healthy": self._down_until.get(name, 0) <= now,
+                    "probe_ok": self._probe_results.get(name),
+                    "operations": operations,
+                }
+        return stats
+
+    def latency_percentile(
+        self, name: str, operation: str, quantile: float, min_samples: int = 1
+    ) -> Optional[float]:
+        """
+        Percentile de latence (secondes) d'un modèle pour une opération
+        (None s'il y a moins de min_samples mesures)
+        """
+        with self._lock:
+            samples = self._samples.get((name, operation))
+            if not samples or len(samples) < min_samples:
+                return None
+            return self._percentile(
+                sorted(latency for _, latency, _ in samples), quantile
+            )
+
+    @staticmethod
+    def _percentile(ordered: List[float], quantile: float) -> float:
+        index = min(len(ordered) - 1, int(quantile * len(ordered)))
+        return ordered[index]
+
+    def _error_rate(self, name: str, operation: str) -> float:
+        """Taux d'erreur récent (appelé sous verrou)"""
+        horizon = time.monotonic() - self.error_horizon
+        recent = [
+            ok for timestamp, _, ok in self._samples.get((name, operation), ())
+            if timestamp >= horizon
+        ]
+        if not recent:
+            return 0.0
+        return sum(1 for ok in recent if not ok) / len(recent)
+
+    def _expected_latency(self, name: str, operation: str) -> Optional[float]:
+        """Latence attendue, corrigée des échecs (appelé sous verrou)"""
+        samples = self._samples.get((name, operation))
+        successes = sorted(latency for _, latency, ok in samples or () if ok)
+        if not successes:
+            return None
+        success_rate = max(0.05, 1.0 - self._error_rate(name, operation))
+        return self._percentile(successes, 0.5) / success_rate
@@ -0,0 +1,307 @@
+"""
+Stockage durable des profils élèves (SQLite en mode WAL)
+Table students et table history indexée par (student_id, exercise_type, timestamp);
+écritures groupées par lots, profils relus depuis un cache mémoire et historique
+détaillé chargé seulement à la demande
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from student_profile import RECENT_WINDOW, StudentProfile
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    student_id TEXT PRIMARY KEY,
+    name TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL REFERENCES students (student_id),
+    exercise_type TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    score REAL NOT NULL,
+    errors TEXT NOT NULL,
+    good_points TEXT NOT NULL,
+    error_types TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_student_type_time
+    ON history (student_id, exercise_type, timestamp);
+"""
+
+_INSERT_HISTORY = """
+INSERT INTO history (
+    student_id, exercise_type, difficulty, score, errors, good_points, error_types, timestamp
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class ProfileStore:
+    """Profils élèves persistants, partagés par toutes les sessions du processus"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        cache_size: int = 256,
+    ):
+        """
+        Ouvre (ou crée) la base
+
+        Args:
+            path: Fichier SQLite (ou STUDENT_DB_PATH, par défaut data/students.db)
+            batch_size: Résultats en attente au-delà desquels on écrit immédiatement
+            flush_interval: Délai maximal (secondes) avant l'écriture des résultats
+                en attente (0: pas d'écriture en arrière-plan)
+            cache_size: Nombre de profils gardés en mémoire
+        """
+        self.path = path or os.getenv("STUDENT_DB_PATH", os.path.join("data", "students.db"))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+
+        # Une connexion partagée (autocommit), protégée par le verrou
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self._lock = threading.RLock()
+        self._pending: List[Tuple[Any, ...]] = []
+        self._cache: "OrderedDict[str, StudentProfile]" = OrderedDict()
+        self._stats = {
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "history_loads": 0,
+        }
+
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically,
+                args=(flush_interval,),
+                name="profile-store-flush",
+                daemon=True,
+            )
+            self._flusher.start()
+        atexit.register(self.close)
+
+    def get_profile(self, student_id: str, name: Optional[str] = None) -> StudentProfile:
+        """
+        Profil d'un élève: depuis le cache, sinon relu depuis la base (créé s'il
+        n'existe pas); les résultats ajoutés au profil sont enregistrés
+        """
+        with self._lock:
+            profile = self._cache.get(student_id)
+            if profile is not None:
+                self._cache.move_to_end(student_id)
+                self._stats["cache_hits"] += 1
+                if name:
+                    self.set_name(student_id, name)
+                return profile
+
+            self._stats["cache_misses"] += 1
+            # Les résultats en attente doivent être en base avant la relecture
+            self.flush()
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR IGNORE INTO students (student_id, name, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (student_id, name, now, now),
+            )
+            if name:
+                self.set_name(student_id, name)
+
+            profile = StudentProfile(student_id=student_id, store=self)
+            aggregates, last_id = self._load_aggregates(student_id)
+            profile._restore(
+                aggregates,
+                older_history_loader=lambda: self.load_history(student_id, last_id),
+            )
+
+            self._cache[student_id] = profile
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return profile
+
+    def set_name(self, student_id: str, name: str):
+        """Enregistre le prénom de l'élève"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE students SET name = ?, updated_at = ? WHERE student_id = ?",
+                (name, time.time(), student_id),
+            )
+
+    def record(self, student_id: str, result: Dict[str, Any]):
+        """Met un résultat en attente d'écriture (appelé par StudentProfile.add_result)"""
+        row = (
+            student_id,
+            result["exercise_type"],
+            result["difficulty"],
+            result["score"],
+            json.dumps(result["errors"], ensure_ascii=False),
+            json.dumps(result["good_points"], ensure_ascii=False),
+            json.dumps(result.get("error_types", []), ensure_ascii=False),
+            result["timestamp"],
+        )
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Écrit les résultats en attente en une seule transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            now = time.time()
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(_INSERT_HISTORY, rows)
+                self._conn.executemany(
+                    "UPDATE students SET updated_at = ? WHERE student_id = ?",
+                    [(now, student_id) for student_id in {row[0] for row in rows}],
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                # Gardés pour la prochaine tentative
+                self._pending[:0] = rows
+                raise
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(rows)
+
+    def load_history(
+        self, student_id: str, up_to_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Historique détaillé d'un élève, du plus ancien au plus récent"""
+        with self._lock:
+            self._stats["history_loads"] += 1
+            rows = self._conn.execute(
+                "SELECT exercise_type, difficulty, score, errors, good_points, error_types, "
+                "timestamp FROM history WHERE student_id = ? AND id <= ? ORDER BY id",
+                (student_id, up_to_id if up_to_id is not None else 2**62),
+            ).fetchall()
+        return [
+            {
+                "exercise_type": exercise_type,
+                "difficulty": difficulty,
+                "score": score,
+                "errors": json.loads(errors),
+                "good_points": json.loads(good_points),
+                "error_types": json.loads(error_types),
+                "timestamp": timestamp,
+            }
+            for exercise_type, difficulty, score, errors, good_points, error_types, timestamp in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache (hits, misses), écritures groupées et chargements d'historique"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["cached_profiles"] = len(self._cache)
+        return stats
+
+    def close(self):
+        """Écrit les résultats en attente et ferme la base"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    def _load_aggregates(self, student_id: str) -> Tuple[Dict[str, Any], int]:
+        """Agrégats du profil calculés par SQLite, sans lire l'historique en Python"""
+        conn = self._conn
+        # Types dans l'ordre du premier exercice (comme exercise_types_attempted)
+        by_type = {
+            exercise_type: {"count": count, "score_sum": score_sum, "best_score": best}
+            for exercise_type, count, score_sum, best in conn.execute(
+                "SELECT exercise_type, COUNT(*), SUM(score), MAX(score) FROM history "
+                "WHERE student_id = ? GROUP BY exercise_type ORDER BY MIN(id)",
+                (student_id,),
+            )
+        }
+        recent = [
+            score
+            for (score,) in conn.execute(
+                "SELECT score FROM history WHERE student_id = ? ORDER BY id DESC LIMIT ?",
+                (student_id, RECENT_WINDOW),
+            )
+        ][::-1]
+
+        def json_values(
+            column: str, group_by_type: bool = False, per_result: bool = False
+        ) -> List[tuple]:
+            # Valeurs des listes JSON, dans l'ordre de première apparition
+            # (per_result: une valeur répétée dans un résultat n'est comptée qu'une fois)
+            prefix = "h.exercise_type, " if group_by_type else ""
+            count = "COUNT(DISTINCT h.id)" if per_result else "COUNT(*)"
+            return conn.execute(
+                f"SELECT {prefix}j.value, {count}, MIN(h.id * 1000 + j.key) AS first "
+                f"FROM history h, json_each(h.{column}) j WHERE h.student_id = ? "
+                f"GROUP BY {prefix}j.value ORDER BY first",
+                (student_id,),
+            ).fetchall()
+
+        def multi_value_lists(column: str) -> List[List[str]]:
+            # Listes de plusieurs valeurs: deux formulations du même groupe dans un
+            # résultat ne comptent qu'une fois (le regroupement se fait en Python)
+            return [
+                json.loads(values)
+                for (values,) in conn.execute(
+                    f"SELECT {column} FROM history "
+                    f"WHERE student_id = ? AND json_array_length({column}) > 1",
+                    (student_id,),
+                )
+            ]
+
+        last_id = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM history WHERE student_id = ?", (student_id,)
+        ).fetchone()[0]
+        error_types = json_values("error_types")
+        aggregates = {
+            "by_type": by_type,
+            "recent_scores": recent,
+            "errors": [
+                (value, count) for value, count, _ in json_values("errors", per_result=True)
+            ],
+            "error_lists": multi_value_lists("errors"),
+            "error_types": [(value, count) for value, count, _ in error_types],
+            "error_types_by_exercise": [
+                (exercise_type, value, count)
+                for exercise_type, value, count, _ in json_values("error_types", True)
+            ],
+            "strengths": [
+                (value, count)
+                for value, count, _ in json_values("good_points", per_result=True)
+            ],
+            "strength_lists": multi_value_lists("good_points"),
+        }
+        return aggregates, last_id
+
+    def _flush_periodically(self, interval: float):
+        while not self._closed.wait(interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Nouvelle tentative au prochain intervalle
+                pass
@@ -0,0 +1,401 @@
+"""
+Prompts précompilés de GeminiClient
+Chaque gabarit est analysé une seule fois au chargement du module; le rendu
+ne fait plus que concaténer les morceaux avec les valeurs de l'appel
+"""
+
+from string import Formatter
+from typing import Any, Dict, List, Tuple
+
+
+class PromptTemplate:
+    """Gabarit de prompt (syntaxe str.format) découpé une fois pour toutes"""
+
+    def __init__(self, text: str):
+        """
+        Découpe le gabarit en morceaux littéraux et champs à remplacer
+
+        Args:
+            text: Gabarit au format str.format ({champ}, accolades doublées pour le JSON)
+        """
+        self.text = text
+        self._parts: List[Tuple[str, str]] = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if spec or conversion:
+                raise ValueError(f"Champ non supporté dans un gabarit: {field}")
+            self._parts.append((literal, field or ""))
+        self.fields = frozenset(field for _, field in self._parts if field)
+
+    def render(self, **values: Any) -> str:
+        """
+        Remplit le gabarit
+
+        Raises:
+            KeyError: Si un champ du gabarit n'a pas de valeur
+        """
+        return "".join(
+            literal + (str(values[field]) if field else "")
+            for literal, field in self._parts
+        )
+
+
+HISTORY_SECTION = PromptTemplate(
+    """
+CONTEXTE DE L'ÉLÈVE:
+- Difficultés précédentes: {common_errors}
+- Points forts: {strengths}
+- Niveau moyen: {average_score}
+"""
+)
+
+STEP_ANALYSIS_PROMPT = PromptTemplate(
+    """Tu es un expert en analyse pédagogique. Analyse la copie manuscrite étape par étape.
+
+QUESTION: {question}
+TYPE: {type_name}
+{history_context}
+
+INSTRUCTIONS:
+1. Identifie TOUTES les étapes de la démarche de l'élève (même partielles ou erronées)
+2. Pour chaque étape, note si elle est correcte, incorrecte, ou partielle
+3. Identifie les erreurs de raisonnement (pas seulement de calcul)
+4. Note les méthodes alternatives utilisées
+
+Réponds en JSON:
+{{
+    "steps": [
+        {{
+            "step_number": 1,
+            "description": "Description de l'étape identifiée",
+            "status": "correct|incorrect|partial",
+            "student_work": "Ce que l'élève a écrit/fait",
+            "reasoning": "Analyse du raisonnement de l'élève"
+        }}
+    ],
+    "method_used": "Description de la méthode utilisée par l'élève",
+    "alternative_methods": ["Autres méthodes possibles"],
+    "reasoning_errors": ["Erreurs de raisonnement identifiées"]
+}}"""
+)
+
+DETAILED_ANALYSIS_PROMPT = PromptTemplate(
+    """Tu es un professeur de mathématiques de 3ème qui corrige avec bienveillance.
+
+QUESTION: {question}
+TYPE: {type_name}
+RÉPONSE ATTENDUE: {expected_answer}
+
+DÉMARCHE IDENTIFIÉE DE L'ÉLÈVE:
+{steps_text}
+
+MÉTHODE UTILISÉE: {method_used}
+ERREURS DE RAISONNEMENT: {reasoning_errors}
+
+INSTRUCTIONS:
+1. Utilise l'analyse de la démarche pour donner un feedback précis
+2. Pour chaque étape incorrecte, explique pourquoi et comment corriger
+3. Valorise les étapes correctes et les bonnes méthodes
+4. Propose une correction qui suit la logique de l'élève quand c'est possible
+5. Adapte le niveau d'explication selon les difficultés identifiées
+
+Réponds en JSON:
+{{
+    "feedback": "Commentaire général bienveillant (2-3 phrases)",
+    "errors": ["erreur 1 avec contexte", "erreur 2 avec contexte"],
+    "good_points": ["point positif 1 détaillé", "point positif 2 détaillé"],
+    "correction": "Correction détaillée étape par étape avec explications",
+    "score": "Note sur 20 ou évaluation qualitative",
+    "next_steps": ["Recommandations pour progresser"],
+    "personalized_tips": ["Conseils personnalisés basés sur les erreurs"]
+}}"""
+)
+
+SINGLE_PASS_PROMPT = PromptTemplate(
+    """Tu es un professeur de mathématiques de 3ème qui corrige avec bienveillance une copie manuscrite.
+
+QUESTION: {question}
+TYPE: {type_name}
+RÉPONSE ATTENDUE: {expected_answer}
+{history_context}
+
+INSTRUCTIONS:
+1. Identifie TOUTES les étapes de la démarche de l'élève (même partielles ou erronées)
+2. Pour chaque étape, note si elle est correcte, incorrecte, ou partielle
+3. Identifie les erreurs de raisonnement (pas seulement de calcul)
+4. Pour chaque étape incorrecte, explique pourquoi et comment corriger
+5. Valorise les étapes correctes et les bonnes méthodes
+6. Propose une correction qui suit la logique de l'élève quand c'est possible
+
+Réponds UNIQUEMENT en JSON:
+{{
+    "steps": [
+        {{
+            "step_number": 1,
+            "description": "Description de l'étape identifiée",
+            "status": "correct|incorrect|partial",
+            "student_work": "Ce que l'élève a écrit/fait",
+            "reasoning": "Analyse du raisonnement de l'élève"
+        }}
+    ],
+    "method_used": "Description de la méthode utilisée par l'élève",
+    "alternative_methods": ["Autres méthodes possibles"],
+    "reasoning_errors": ["Erreurs de raisonnement identifiées"],
+    "feedback": "Commentaire général bienveillant (2-3 phrases)",
+    "errors": ["erreur 1 avec contexte", "erreur 2 avec contexte"],
+    "good_points": ["point positif 1 détaillé", "point positif 2 détaillé"],
+    "correction": "Correction détaillée étape par étape avec explications",
+    "score": "Note sur 20 ou évaluation qualitative",
+    "next_steps": ["Recommandations pour progresser"],
+    "personalized_tips": ["Conseils personnalisés basés sur les erreurs"]
+}}"""
+)
+
+_EXERCISE_BASE_INSTRUCTION = """Tu es un professeur de mathématiques créatif qui génère des exercices de statistiques pour des élèves de 3ème.
+
+Niveau de difficulté: {difficulty}
+- Facile: 8-12 valeurs, nombres simples (10-15)
+- Moyen: 12-18 valeurs, nombres variés (8-16)
+- Difficile: 18-25 valeurs, nombres plus variés (5-20)
+
+IMPORTANT: Génère un exercice ORIGINAL et VARIÉ. Ne répète pas toujours les mêmes exemples.
+Utilise des contextes différents (notes, tailles, âges, températures, etc.).
+
+Réponds UNIQUEMENT en JSON valide, sans texte avant ou après."""
+
+# Un gabarit par type d'exercice, construits une seule fois (et non à chaque appel)
+EXERCISE_PROMPTS: Dict[str, PromptTemplate] = {
+    "effectif": PromptTemplate(
+        _EXERCISE_BASE_INSTRUCTION
+        + """
+
+Type d'exercice: Tableau d'effectifs
+
+Génère un exercice où:
+1. Tu fournis une liste de valeurs d'un caractère (choisis un contexte intéressant: notes, tailles, âges, etc.)
+2. L'élève doit compléter un tableau d'effectifs
+3. L'exercice est adapté au niveau 3ème et à la difficulté {difficulty}
+
+Format JSON:
+{{
+    "question": "Énoncé complet et clair de l'exercice avec contexte",
+    "data": ["valeur1", "valeur2", ...],
+    "expected_answer": {{
+        "tableau": {{"valeur1": effectif1, "valeur2": effectif2, ...}},
+        "total": nombre_total
+    }},
+    "type_name": "Tableau d'effectifs",
+    "context": "Description du contexte (ex: notes d'un contrôle)"
+}}"""
+    ),
+    "frequence": PromptTemplate(
+        _EXERCISE_BASE_INSTRUCTION
+        + """
+
+Type d'exercice: Calcul de fréquences
+
+Génère un exercice où:
+1. Tu fournis un tableau d'effectifs (choisis un format: décimal, fraction, ou pourcentage)
+2. L'élève doit calculer les fréquences
+3. L'exercice permet l'utilisation de la formule ou du produit en croix
+4. L'exercice est adapté au niveau 3ème et à la difficulté {difficulty}
+
+Format JSON:
+{{
+    "question": "Énoncé complet avec tableau d'effectifs et demande de calcul",
+    "data": {{"valeur1": effectif1, "valeur2": effectif2, ...}},
+    "total": nombre_total,
+    "expected_answer": {{
+        "frequences": {{"valeur1": freq1, "valeur2": freq2, ...}},
+        "format": "decimal|fraction|pourcentage"
+    }},
+    "type_name": "Calcul de fréquences",
+    "context": "Description du contexte"
+}}"""
+    ),
+    "moyenne": PromptTemplate(
+        _EXERCISE_BASE_INSTRUCTION
+        + """
+
+Type d'exercice: Moyenne pondérée
+
+Génère un exercice où:
+1. Tu fournis une série statistique avec effectifs (choisis un contexte intéressant)
+2. L'élève doit calculer la moyenne pondérée
+3. L'exercice est adapté au niveau 3ème et à la difficulté {difficulty}
+
+Format JSON:
+{{
+    "question": "Énoncé complet avec série statistique et demande de calcul",
+    "data": {{"valeur1": effectif1, "valeur2": effectif2, ...}},
+    "expected_answer": {{
+        "moyenne": valeur_moyenne,
+        "calculs": "détail des calculs étape par étape"
+    }},
+    "type_name": "Moyenne pondérée",
+    "context": "Description du contexte"
+}}"""
+    ),
+    "probleme": PromptTemplate(
+        _EXERCISE_BASE_INSTRUCTION
+        + """
+
+Type d'exercice: Problème textuel de statistiques
+
+Génère un problème où:
+1. C'est une situation concrète et réaliste (choisis un contexte varié: sport, école, vie quotidienne, etc.)
+2. Le problème implique des calculs statistiques (moyenne, effectifs, fréquences)
+3. Le problème demande une interprétation du résultat
+4. Le problème est adapté au niveau 3ème et à la difficulté {difficulty}
+
+Format JSON:
+{{
+    "question": "Énoncé complet du problème avec situation concrète",
+    "data": [valeur1, valeur2, ...],
+    "expected_answer": {{
+        "reponse": "réponse attendue",
+        "moyenne": moyenne_de_la_serie,
+        "mediane": mediane_de_la_serie,
+        "etendue": etendue_de_la_serie,
+        "calculs": "détail des calculs étape par étape",
+        "interpretation": "interprétation du résultat dans le contexte"
+    }},
+    "type_name": "Problème textuel",
+    "context": "Description du contexte du problème"
+}}"""
+    ),
+}
+
+EXAMPLES_ANALYSIS_PROMPT = PromptTemplate(
+    """Tu es un expert en pédagogie mathématique. Analyse ces {num_images} exemples d'exercices de statistiques de niveau 3ème.
+
+CHAPITRE: {chapter}
+
+INSTRUCTIONS:
+1. Pour chaque image, identifie:
+   - Le type d'exercice (effectif, frequence, moyenne, probleme)
+   - L'énoncé complet de l'exercice
+   - Si l'exercice est complet (énoncé + données + question claire)
+   - Le niveau de difficulté (facile, moyen, difficile)
+   - Le contexte (notes, tailles, âges, etc.)
+
+2. Vérifie que tous les exercices sont:
+   - En lien avec le chapitre des statistiques
+   - Adaptés au niveau 3ème
+   - Complets (énoncé, données, question)
+
+3. Extrais les caractéristiques communes:
+   - Styles d'énoncés
+   - Types de contextes utilisés
+   - Formats de présentation
+   - Niveaux de difficulté
+
+Réponds UNIQUEMENT en JSON valide:
+
+{{
+    "valid": true/false,
+    "validation_errors": ["erreur 1", "erreur 2"] si valid=false,
+    "examples": [
+        {{
+            "exercise_number": 1,
+            "type": "effectif|frequence|moyenne|probleme",
+            "question": "Énoncé complet de l'exercice",
+            "context": "Description du contexte",
+            "difficulty": "facile|moyen|difficile",
+            "is_complete": true/false,
+            "data": "Données de l'exercice si visible"
+        }}
+    ],
+    "common_characteristics": {{
+        "styles": ["style 1", "style 2"],
+        "contexts": ["contexte 1", "contexte 2"],
+        "formats": ["format 1", "format 2"],
+        "difficulty_range": "facile à difficile"
+    }},
+    "recommendations": "Recommandations pour générer des exercices similaires"
+}}"""
+)
+
+EXERCISE_FROM_EXAMPLES_PROMPT = PromptTemplate(
+    """Tu es un professeur de mathématiques créatif. Génère un NOUVEL exercice de statistiques de niveau 3ème.
+
+TYPE D'EXERCICE DEMANDÉ: {exercise_type}
+DIFFICULTÉ: {difficulty}
+
+EXEMPLES DE RÉFÉRENCE (à utiliser comme inspiration, PAS à reproduire):
+{examples_text}
+
+CARACTÉRISTIQUES COMMUNES DES EXEMPLES:
+- Styles: {styles}
+- Contextes: {contexts}
+- Formats: {formats}
+
+INSTRUCTIONS IMPORTANTES:
+1. Inspire-toi du STYLE et du FORMAT des exemples
+2. Utilise des CONTEXTES similaires mais différents
+3. Crée un exercice NOUVEAU et ORIGINAL (pas une copie)
+4. Adapte au niveau 3ème et à la difficulté {difficulty}
+5. Assure-toi que l'exercice est complet et clair
+
+Réponds UNIQUEMENT en JSON valide:
+
+{{
+    "question": "Énoncé complet et original de l'exercice",
+{data_format},
+    "type_name": "{exercise_type}",
+    "context": "Description du contexte utilisé"
+}}"""
+)
+
+# Données et réponse attendue structurées comme dans EXERCISE_PROMPTS, pour que
+# l'exercice inspiré des exemples soit vérifiable localement
+EXAMPLES_DATA_FORMATS: Dict[str, str] = {
+    "effectif": """    "data": ["valeur1", "valeur2", ...],
+    "expected_answer": {"tableau": {"valeur1": effectif1, ...}, "total": nombre_total}""",
+    "frequence": """    "data": {"valeur1": effectif1, "valeur2": effectif2, ...},
+    "total": nombre_total,
+    "expected_answer": {"frequences": {"valeur1": freq1, ...}, "format": "decimal|fraction|pourcentage"}""",
+    "moyenne": """    "data": {"valeur1": effectif1, "valeur2": effectif2, ...},
+    "expected_answer": {"moyenne": valeur_moyenne, "calculs": "détail des calculs"}""",
+    "probleme": """    "data": [valeur1, valeur2, ...],
+    "expected_answer": {"reponse": "réponse attendue", "moyenne": moyenne_de_la_serie, "mediane": mediane_de_la_serie, "etendue": etendue_de_la_serie}""",
+}
+
+TUTOR_SYSTEM_INSTRUCTION = """Tu es un professeur de mathématiques pour des élèves de 3ème.
+Chapitre : Statistiques (moyenne, médiane, étendue, effectifs, fréquences).
+Réponds de façon claire, courte, pédagogique. Utilise le gras (**texte**) pour les notions clés.
+Ne donne pas la réponse directe d'un exercice, guide l'élève par étapes."""
+
+TUTOR_SUMMARY_SECTION = PromptTemplate(
+    """
+
+RÉSUMÉ DE LA CONVERSATION JUSQU'ICI:
+{summary}"""
+)
+
+TUTOR_SUMMARY_PROMPT = PromptTemplate(
+    """Tu résumes une conversation entre un élève de 3ème et son professeur de mathématiques (statistiques).
+
+RÉSUMÉ PRÉCÉDENT:
+{summary}
+
+NOUVEAUX ÉCHANGES:
+{transcript}
+
+Écris un nouveau résumé (10 lignes maximum) qui intègre le résumé précédent et les nouveaux échanges.
+Garde: les notions déjà expliquées, les exemples et valeurs utilisés, les erreurs et difficultés de l'élève,
+ce qu'il a compris, et la question en cours s'il y en a une.
+Réponds uniquement avec le résumé, sans introduction."""
+)
+
+# Commentaire d'une réponse corrigée localement: ni données ni réponses dans le
+# prompt, qui est ainsi partagé (et mis en cache) entre élèves aux mêmes erreurs
+ANSWER_FEEDBACK_PROMPT = PromptTemplate(
+    """Tu es un professeur de mathématiques bienveillant. Un élève de 3ème a répondu à un exercice de statistiques ({type_name}).
+
+Note: {score}
+Erreurs détectées: {errors}
+Points réussis: {good_points}
+
+Écris un commentaire de 2 phrases maximum, en tutoyant l'élève: encourage-le et donne-lui un conseil
+pour sa principale erreur, sans donner la correction. Réponds uniquement avec le commentaire."""
+)
@@ -0,0 +1,338 @@
+"""
+Limiteur de débit des appels Gemini (requêtes/minute et tokens/minute)
+Seaux à jetons partagés par tous les appels d'un client, avec nouvelles
+tentatives en backoff exponentiel sur les erreurs de quota ou de disponibilité
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+# Tokens comptés par Gemini pour une image
+IMAGE_TOKENS = 258
+
+# Erreurs pour lesquelles une nouvelle tentative a des chances de réussir
+RETRYABLE_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+)
+RETRYABLE_STATUS_CODES = (429, 500, 503, 504)
+
+_RETRY_IN_RE = re.compile(r"retry in ([\d.]+)\s*(ms|s)", re.IGNORECASE)
+
+
+class LocalTimeout(TimeoutError):
+    """
+    Échéance atteinte avant l'envoi de la requête (attente du quota local):
+    ni le modèle ni le service ne sont en cause
+    """
+
+
+def estimate_tokens(contents: Any) -> int:
+    """Estimation locale des tokens d'une requête: ~4 caractères par token"""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, str):
+            tokens += max(1, len(part) // 4)
+        elif isinstance(part, dict) and "parts" in part:
+            # Tour de conversation {"role", "parts"}
+            tokens += estimate_tokens(part["parts"])
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+def count_images(contents: Any) -> int:
+    """Nombre d'images (ou fichiers) dans une requête, tours de conversation compris"""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    count = 0
+    for part in parts:
+        if isinstance(part, dict) and "parts" in part:
+            count += count_images(part["parts"])
+        elif part is not None and not isinstance(part, str):
+            count += 1
+    return count
+
+
+def is_retryable(error: Exception) -> bool:
+    """Indique si une erreur est temporaire (quota, surcharge, délai)"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+
+def retry_hint(error: Exception) -> Optional[float]:
+    """
+    Délai (secondes) demandé par le serveur avant de réessayer, s'il y en a un
+
+    Cherche un RetryInfo dans les détails de l'erreur, un en-tête Retry-After,
+    puis un message du type « Please retry in 12.5s ».
+    """
+    for detail in getattr(error, "details", None) or ():
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and (delay.seconds or delay.nanos):
+            return delay.seconds + delay.nanos / 1e9
+
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("Retry-After") if response else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    match = _RETRY_IN_RE.search(str(error))
+    if match:
+        value = float(match.group(1))
+        return value / 1000 if match.group(2).lower() == "ms" else value
+    return None
+
+
+class RateLimiter:
+    """Seaux à jetons (requêtes et tokens par minute) et backoff exponentiel avec jitter"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        burst_seconds: float = 60.0,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 32.0,
+    ):
+        """
+        Initialise le limiteur
+
+        Args:
+            requests_per_minute: Quota de requêtes par minute (None: pas de limite)
+            tokens_per_minute: Quota de tokens par minute (None: pas de limite)
+            burst_seconds: Capacité des seaux, en secondes de quota (60: une minute)
+            max_retries: Nombre maximal de nouvelles tentatives par appel
+            base_delay: Délai (secondes) avant la première nouvelle tentative
+            max_delay: Délai maximal entre deux tentatives
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        # nom -> [niveau, dernière mise à jour]; le niveau peut devenir négatif
+        # (réservation): l'appelant attend alors le temps de le remonter
+        self._buckets: Dict[str, list] = {}
+        for name, limit in (("requests", requests_per_minute), ("tokens", tokens_per_minute)):
+            if limit:
+                self._buckets[name] = [self._capacity(limit), now]
+        self._paused_until = 0.0
+        self._waits: Deque[float] = deque(maxlen=500)
+        self._stats = {
+            "calls": 0,
+            "throttled": 0,
+            "retries": 0,
+            "retry_hints": 0,
+            "exhausted": 0,
+            "deadline_exceeded": 0,
+            "wait_s": 0.0,
+        }
+
+    def _capacity(self, limit: float) -> float:
+        return max(1.0, limit * self.burst_seconds / 60.0)
+
+    def _limit(self, name: str) -> float:
+        return self.requests_per_minute if name == "requests" else self.tokens_per_minute
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Réserve une requête et ses tokens, et retourne l'attente nécessaire (secondes)
+
+        Les réservations sont servies dans l'ordre d'arrivée: chaque appel
+        consomme immédiatement son dû et attend que les seaux se remplissent.
+        """
+        now = time.monotonic()
+        with self._lock:
+            wait = max(0.0, self._paused_until - now)
+            for name, bucket in self._buckets.items():
+                limit = self._limit(name)
+                rate = limit / 60.0
+                capacity = self._capacity(limit)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                bucket[0] -= 1 if name == "requests" else min(tokens, capacity)
+                if bucket[0] < 0:
+                    wait = max(wait, -bucket[0] / rate)
+
+            self._stats["calls"] += 1
+            if wait > 0:
+                self._stats["throttled"] += 1
+            self._stats["wait_s"] += wait
+            self._waits.append(wait)
+        return wait
+
+    def release(self, tokens: int = 0):
+        """Rend une réservation qui ne sera pas utilisée"""
+        with self._lock:
+            for name, bucket in self._buckets.items():
+                capacity = self._capacity(self._limit(name))
+                bucket[0] += 1 if name == "requests" else min(tokens, capacity)
+
+    def adjust_tokens(self, delta: int):
+        """Corrige le seau de tokens avec l'usage réel (delta = réel - estimé)"""
+        with self._lock:
+            bucket = self._buckets.get("tokens")
+            if bucket is not None:
+                bucket[0] -= delta
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> float:
+        """
+        Attend (en bloquant) le droit d'envoyer une requête; retourne l'attente
+
+        Raises:
+            LocalTimeout: Si l'attente dépasserait l'échéance (time.monotonic())
+        """
+        wait = self._reserve_before(tokens, deadline)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 0, deadline: Optional[float] = None) -> float:
+        """Équivalent asynchrone de acquire()"""
+        wait = self._reserve_before(tokens, deadline)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def _reserve_before(self, tokens: int, deadline: Optional[float]) -> float:
+        wait = self.reserve(tokens)
+        if deadline is not None and time.monotonic() + wait >= deadline:
+            self.release(tokens)
+            with self._lock:
+                self._stats["deadline_exceeded"] += 1
+            raise LocalTimeout("Délai épuisé en attente du quota Gemini")
+        return wait
+
+    def backoff_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """
+        Délai avant la tentative suivante
+
+        Respecte le délai demandé par le serveur (et suspend alors tous les appels
+        du limiteur d'autant), sinon backoff exponentiel avec jitter complet.
+        """
+        hint = retry_hint(error) if error is not None else None
+        if hint is not None:
+            delay = min(self.max_delay, hint) * random.uniform(1.0, 1.1)
+            with self._lock:
+                self._stats["retry_hints"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            return delay
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        tokens: int = 0,
+        deadline: Optional[float] = None,
+        report: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """
+        Exécute fn() dans le quota, en réessayant sur les erreurs temporaires
+
+        Args:
+            fn: Appel à exécuter
+            tokens: Tokens estimés de la requête
+            deadline: Échéance (time.monotonic()) au-delà de laquelle on ne réessaie plus
+            report: Dictionnaire complété avec "retries" et "queue_wait_ms" de cet appel
+
+        Raises:
+            La dernière erreur si elle n'est pas temporaire, si les tentatives sont
+            épuisées ou si l'échéance ne laisse pas le temps d'une nouvelle tentative
+        """
+        report = report if report is not None else {}
+        report.update(retries=0, queue_wait_ms=0.0)
+        attempt = 0
+        while True:
+            wait = self.acquire(tokens, deadline)
+            report["queue_wait_ms"] = round(report["queue_wait_ms"] + wait * 1000, 1)
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                report["retries"] = attempt
+
+    async def call_async(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        tokens: int = 0,
+        deadline: Optional[float] = None,
+        report: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """Équivalent asynchrone de call(); fn retourne une coroutine"""
+        report = report if report is not None else {}
+        report.update(retries=0, queue_wait_ms=0.0)
+        attempt = 0
+        while True:
+            wait = await self.acquire_async(tokens, deadline)
+            report["queue_wait_ms"] = round(report["queue_wait_ms"] + wait * 1000, 1)
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                report["retries"] = attempt
+
+    def _retry_delay(
+        self, error: Exception, attempt: int, deadline: Optional[float]
+    ) -> Optional[float]:
+        """Délai avant la tentative suivante, ou None s'il ne faut pas réessayer"""
+        if not is_retryable(error):
+            return None
+        if attempt >= self.max_retries:
+            with self._lock:
+                self._stats["exhausted"] += 1
+            return None
+
+        delay = self.backoff_delay(attempt, error)
+        with self._lock:
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                self._stats["deadline_exceeded"] += 1
+                return None
+            self._stats["retries"] += 1
+        return delay
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Compteurs du limiteur et attente dans la file (moyenne, p95)"""
+        with self._lock:
+            stats = dict(self._stats)
+            waits = sorted(self._waits)
+        stats["wait_s"] = round(stats["wait_s"], 3)
+        stats["mean_wait_ms"] = (
+            round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0
+        )
+        stats["p95_wait_ms"] = (
+            round(waits[min(len(waits) - 1, int(0.95 * len(waits)))] * 1000, 1)
+            if waits
+            else 0.0
+        )
+        stats["requests_per_minute"] = self.requests_per_minute
+        stats["tokens_per_minute"] = self.tokens_per_minute
+        return stats
@@ -0,0 +1,220 @@
+"""
+Cache disque des réponses Gemini, adressé par contenu
+Évite de renvoyer des prompts identiques entre sessions et redémarrages
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+
+# Durées de vie par défaut (secondes) selon le type d'opération
+DEFAULT_TTLS = {
+    "generate_exercise": 7 * 24 * 3600,
+    "generate_exercise_from_examples": 24 * 3600,
+    "analyze_exercise_examples": 30 * 24 * 3600,
+}
+
+
+class ResponseCache:
+    """Cache LRU sur disque des textes de réponse, borné en taille"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = 50 * 1024 * 1024,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 24 * 3600,
+    ):
+        """
+        Initialise le cache
+
+        Args:
+            cache_dir: Dossier du cache (ou GEMINI_CACHE_DIR, par défaut .gemini_cache)
+            max_bytes: Taille maximale du cache sur disque avant éviction LRU
+            ttls: Durées de vie par opération (complète DEFAULT_TTLS)
+            default_ttl: Durée de vie des opérations non listées
+        """
+        self.cache_dir = cache_dir or os.getenv("GEMINI_CACHE_DIR", ".gemini_cache")
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # clé -> taille du fichier, du moins récemment utilisé au plus récent
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._load_index()
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        contents: Any,
+        generation_config: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Calcule la clé d'une requête: hash du modèle, du prompt, des images et de la config
+        """
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        for part in parts:
+            if isinstance(part, str):
+                digest.update(b"text:")
+                digest.update(part.encode("utf-8"))
+            elif isinstance(part, Image.Image):
+                digest.update(f"image:{part.mode}:{part.size}:".encode("utf-8"))
+                digest.update(part.tobytes())
+            elif isinstance(part, dict) and "data" in part:
+                digest.update(f"blob:{part.get('mime_type', '')}:".encode("utf-8"))
+                digest.update(part["data"])
+            elif getattr(part, "inline_data", None) is not None:
+                digest.update(f"blob:{part.inline_data.mime_type}:".encode("utf-8"))
+                digest.update(part.inline_data.data)
+            else:
+                digest.update(repr(part).encode("utf-8"))
+
+        digest.update(
+            json.dumps(generation_config or {}, sort_keys=True, default=str).encode(
+                "utf-8"
+            )
+        )
+        return digest.hexdigest()
+
+    def get(self, operation: str, key: str, variants: int = 1) -> Optional[str]:
+        """
+        Retourne une réponse en cache, ou None s'il faut appeler le modèle
+
+        Avec variants=N > 1, le cache accumule d'abord N réponses distinctes,
+        puis sert ces N variantes une fois chacune avant de redemander
+        une nouvelle réponse au modèle.
+        """
+        with self._lock:
+            entry = self._read(key)
+            if entry is None or self._is_expired(operation, entry):
+                if entry is not None:
+                    self._delete(key)
+                self._stats["misses"] += 1
+                return None
+
+            stored = entry["variants"]
+            if variants <= 1:
+                text = stored[-1]
+            elif len(stored) < variants or entry["served"] >= len(stored):
+                self._stats["misses"] += 1
+                return None
+            else:
+                text = stored[entry["served"]]
+                entry["served"] += 1
+                self._write(key, entry)
+
+            self._touch(key)
+            self._stats["hits"] += 1
+            return text
+
+    def put(self, operation: str, key: str, text: str, variants: int = 1):
+        """Enregistre une réponse fraîche du modèle"""
+        with self._lock:
+            entry = self._read(key)
+            if entry is None or self._is_expired(operation, entry) or variants <= 1:
+                entry = {"operation": operation, "variants": [], "served": 0}
+
+            entry["variants"] = (entry["variants"] + [text])[-max(1, variants) :]
+            entry["served"] = 0
+            entry["created_at"] = time.time()
+            self._write(key, entry)
+            self._stats["writes"] += 1
+            self._evict()
+
+    def clear(self):
+        """Vide entièrement le cache"""
+        with self._lock:
+            for key in list(self._index):
+                self._delete(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retourne les compteurs du cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._index)
+            stats["bytes"] = self._total_bytes
+        return stats
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """Reconstruit l'index LRU à partir des fichiers présents (ordre mtime)"""
+        files: List[tuple] = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name[:-5], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def _is_expired(self, operation: str, entry: Dict[str, Any]) -> bool:
+        ttl = self.ttls.get(operation, self.default_ttl)
+        return time.time() - entry.get("created_at", 0) > ttl
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        if key not in self._index:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._delete(key)
+            return None
+
+    def _write(self, key: str, entry: Dict[str, Any]):
+        path = self._path(key)
+        # Nom unique: plusieurs processus (ou threads) peuvent écrire la même entrée
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        data = json.dumps(entry, ensure_ascii=False)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        self._total_bytes += size - self._index.pop(key, 0)
+        self._index[key] = size
+
+    def _touch(self, key: str):
+        """Marque une entrée comme récemment utilisée (mémoire et mtime disque)"""
+        self._index.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _delete(self, key: str):
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes"""
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            oldest = next(iter(self._index))
+            self._delete(oldest)
+            self._stats["evictions"] += 1
@@ -0,0 +1,259 @@
+"""
+Sorties structurées de Gemini: schémas de réponse JSON et parseur tolérant
+Le parseur est partagé par toutes les méthodes de GeminiClient qui attendent du JSON
+"""
+
+import ast
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Résultats possibles d'un parsing
+PARSE_JSON = "json"  # JSON valide (directement ou après extraction)
+PARSE_REPAIRED = "repaired"  # JSON réparé (virgules en trop, troncature, quotes simples)
+PARSE_FAILED = "failed"  # Aucun JSON exploitable
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+_STEPS = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "step_number": {"type": "integer"},
+            "description": {"type": "string"},
+            "status": {"type": "string", "enum": ["correct", "incorrect", "partial"]},
+            "student_work": {"type": "string"},
+            "reasoning": {"type": "string"},
+        },
+        "required": ["step_number", "description", "status"],
+    },
+}
+
+_STEP_ANALYSIS_PROPERTIES = {
+    "steps": _STEPS,
+    "method_used": {"type": "string"},
+    "alternative_methods": _STRING_LIST,
+    "reasoning_errors": _STRING_LIST,
+}
+
+_FEEDBACK_PROPERTIES = {
+    "feedback": {"type": "string"},
+    "errors": _STRING_LIST,
+    "good_points": _STRING_LIST,
+    "correction": {"type": "string"},
+    "score": {"type": "string"},
+    "next_steps": _STRING_LIST,
+    "personalized_tips": _STRING_LIST,
+}
+
+# Schémas de réponse par opération (sous-ensemble OpenAPI accepté par Gemini)
+RESPONSE_SCHEMAS: Dict[str, Optional[Dict[str, Any]]] = {
+    "step_analysis": {
+        "type": "object",
+        "properties": _STEP_ANALYSIS_PROPERTIES,
+        "required": ["steps", "method_used", "reasoning_errors"],
+    },
+    "detailed_analysis": {
+        "type": "object",
+        "properties": _FEEDBACK_PROPERTIES,
+        "required": ["feedback", "errors", "good_points", "correction", "score"],
+    },
+    "single_pass": {
+        "type": "object",
+        "properties": {**_STEP_ANALYSIS_PROPERTIES, **_FEEDBACK_PROPERTIES},
+        "required": ["steps", "feedback", "errors", "good_points", "correction", "score"],
+    },
+    "examples_analysis": {
+        "type": "object",
+        "properties": {
+            "valid": {"type": "boolean"},
+            "validation_errors": _STRING_LIST,
+            "examples": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "exercise_number": {"type": "integer"},
+                        "type": {
+                            "type": "string",
+                            "enum": ["effectif", "frequence", "moyenne", "probleme"],
+                        },
+                        "question": {"type": "string"},
+                        "context": {"type": "string"},
+                        "difficulty": {
+                            "type": "string",
+                            "enum": ["facile", "moyen", "difficile"],
+                        },
+                        "is_complete": {"type": "boolean"},
+                        "data": {"type": "string"},
+                    },
+                    "required": ["exercise_number", "type", "question"],
+                },
+            },
+            "common_characteristics": {
+                "type": "object",
+                "properties": {
+                    "styles": _STRING_LIST,
+                    "contexts": _STRING_LIST,
+                    "formats": _STRING_LIST,
+                    "difficulty_range": {"type": "string"},
+                },
+            },
+            "recommendations": {"type": "string"},
+        },
+        "required": ["valid", "examples"],
+    },
+    # Les clés de "data" et "expected_answer" dépendent des valeurs de l'exercice:
+    # impossible à décrire dans le schéma, on impose seulement le mode JSON
+    "exercise": None,
+}
+
+
+def generation_config_for(operation: str) -> Dict[str, Any]:
+    """Configuration de génération en mode JSON (avec schéma si disponible)"""
+    config: Dict[str, Any] = {"response_mime_type": "application/json"}
+    schema = RESPONSE_SCHEMAS.get(operation)
+    if schema is not None:
+        config["response_schema"] = schema
+    return config
+
+
+def parse_json_response(response_text: str) -> Tuple[Optional[Any], str]:
+    """
+    Extrait le JSON d'une réponse de modèle, même imparfaite
+
+    Étapes: retrait des blocs ```json, lecture directe, extraction du premier
+    objet par comptage d'accolades (en ignorant celles des chaînes), puis
+    réparation (virgules finales, quotes simples, réponse tronquée).
+
+    Returns:
+        (données, résultat) avec résultat parmi PARSE_JSON, PARSE_REPAIRED, PARSE_FAILED
+    """
+    if not response_text:
+        return None, PARSE_FAILED
+
+    text = response_text.strip()
+    fence = _FENCE_RE.search(text)
+    if fence and "{" in fence.group(1):
+        text = fence.group(1).strip()
+
+    data = _loads(text)
+    if data is not None:
+        return data, PARSE_JSON
+
+    start = _find_json_start(text)
+    if start < 0:
+        return None, PARSE_FAILED
+
+    candidate, stack, commas = _scan_balanced(text, start)
+    if not stack:
+        data = _loads(candidate)
+        if data is not None:
+            return data, PARSE_JSON
+        data = _repair(candidate)
+        return (data, PARSE_REPAIRED) if data is not None else (None, PARSE_FAILED)
+
+    # Réponse tronquée: refermer chaînes et structures encore ouvertes
+    data = _close_truncated(candidate, stack, commas)
+    return (data, PARSE_REPAIRED) if data is not None else (None, PARSE_FAILED)
+
+
+def parse_json_object(response_text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Comme parse_json_response, mais n'accepte qu'un objet JSON"""
+    data, outcome = parse_json_response(response_text)
+    if isinstance(data, dict):
+        return data, outcome
+    return None, PARSE_FAILED
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        # strict=False: accepte les retours à la ligne bruts dans les chaînes
+        return json.loads(text, strict=False)
+    except (json.JSONDecodeError, ValueError):
+        return None
+
+
+def _find_json_start(text: str) -> int:
+    positions = [p for p in (text.find("{"), text.find("[")) if p >= 0]
+    return min(positions) if positions else -1
+
+
+def _scan_balanced(text: str, start: int) -> Tuple[str, List[str], List[int]]:
+    """
+    Parcourt le texte depuis start en suivant chaînes et imbrications
+
+    Returns:
+        (texte candidat, fermetures encore attendues, positions des virgules
+        de premier niveau de la structure ouverte la plus profonde)
+    """
+    stack: List[str] = []
+    commas: List[List[int]] = []
+    in_string = False
+    escaped = False
+
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            commas.append([])
+        elif char in "}]":
+            if stack:
+                stack.pop()
+                commas.pop()
+            if not stack:
+                return text[start : index + 1], [], []
+        elif char == "," and commas:
+            commas[-1].append(index - start)
+
+    candidate = text[start:]
+    if in_string:
+        candidate += '"'
+    return candidate, stack, commas[-1] if commas else []
+
+
+def _repair(candidate: str) -> Optional[Any]:
+    """Corrige les défauts courants d'un objet complet"""
+    cleaned = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+    data = _loads(cleaned)
+    if data is not None:
+        return data
+
+    # Syntaxe Python (quotes simples, True/False/None)
+    try:
+        data = ast.literal_eval(cleaned)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return data if isinstance(data, (dict, list)) else None
+
+
+def _close_truncated(candidate: str, stack: List[str], commas: List[int]) -> Optional[Any]:
+    """Referme une réponse tronquée, en reculant jusqu'au dernier élément complet"""
+    closers = "".join(reversed(stack))
+    attempts = [candidate.rstrip()]
+    # Couper au dernier élément complet de la structure la plus profonde
+    attempts += [candidate[:position] for position in reversed(commas[-3:])]
+
+    for attempt in attempts:
+        attempt = attempt.rstrip().rstrip(",")
+        if attempt.endswith(":"):
+            attempt += " null"
+        data = _repair(attempt + closers)
+        if data is not None:
+            return data
+    return None
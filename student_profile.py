@@ -1,21 +1,138 @@
 """
 Gestion du profil de l'élève et personnalisation adaptative
+Les agrégats (sommes par type, fenêtre des derniers scores, erreurs les plus
+fréquentes) sont tenus à jour à chaque résultat: les requêtes sur le profil
+ne dépendent pas de la longueur de l'historique. L'historique détaillé est
+stocké par colonnes (CompactHistory); les erreurs et points forts formulés
+différemment sont regroupés (TextClusterIndex) avant d'être comptés
 """
 
-from typing import Dict, Any, List, Optional
-from collections import Counter, defaultdict
+import threading
+import time
+from typing import Callable, Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter, defaultdict, deque
+
+from compact_history import CompactHistory
+from text_clusters import TextClusterIndex
+
+# Scores récents utilisés pour la difficulté recommandée et la tendance
+RECENT_WINDOW = 5
+TREND_WINDOW = 3
+# Groupes d'erreurs et de points forts les plus fréquents gardés à jour
+# (get_profile en retourne au plus 5)
+TOP_ERRORS = 5
+
+
+class _TopCounter:
+    """Compteur qui maintient ses k clés les plus fréquentes à chaque incrément"""
+
+    def __init__(self, k: int = TOP_ERRORS):
+        self.k = k
+        self.counts: Counter = Counter()
+        # Ordre de première apparition: départage les égalités comme Counter.most_common
+        self._first_seen: Dict[Any, int] = {}
+        self._top: List[Any] = []
+
+    def add(self, key: Any):
+        if key not in self._first_seen:
+            self._first_seen[key] = len(self._first_seen)
+        self.counts[key] += 1
+        # Seule la clé incrémentée peut entrer dans le top ou y changer de rang
+        if key not in self._top:
+            if len(self._top) >= self.k and self._rank(key) >= self._rank(self._top[-1]):
+                return
+            self._top.append(key)
+        self._top.sort(key=self._rank)
+        del self._top[self.k :]
+
+    def load(self, counts: Iterable[Tuple[Any, int]]):
+        """Remplace le contenu par des comptages, donnés dans l'ordre de première apparition"""
+        self.counts = Counter()
+        self._first_seen = {}
+        for key, count in counts:
+            self._first_seen[key] = len(self._first_seen)
+            self.counts[key] = count
+        self._top = sorted(self.counts, key=self._rank)[: self.k]
+
+    def most_common(self) -> List[tuple]:
+        return [(key, self.counts[key]) for key in self._top]
+
+    def _rank(self, key: Any) -> tuple:
+        return (-self.counts[key], self._first_seen[key])
 
 
 class StudentProfile:
     """Gère le profil et l'historique de l'élève pour personnalisation"""
 
-    def __init__(self):
-        self.history: List[Dict[str, Any]] = []
-        self.scores: List[float] = []
-        self.errors_by_type: Dict[str, List[str]] = defaultdict(list)
-        self.strengths: List[str] = []
+    def __init__(self, student_id: Optional[str] = None, store: Optional[Any] = None):
+        """
+        Initialise un profil vide
+
+        Args:
+            student_id: Identifiant de l'élève (profil persistant)
+            store: ProfileStore où enregistrer chaque résultat (None: profil en mémoire)
+        """
+        self.student_id = student_id
+        self.store = store
+        # Un profil du ProfileStore est partagé par toutes les sessions ouvertes
+        # avec le même identifiant: les résultats sont ajoutés un par un
+        self._lock = threading.RLock()
+
+        # Historique détaillé: chargé à la demande pour un profil relu depuis le store
+        self._history = CompactHistory()
+        self._older_history_loader: Optional[Callable[[], List[Dict[str, Any]]]] = None
+
+        # Types d'erreurs structurés (correction locale), comptés par type d'exercice
+        self.error_types_by_exercise: Dict[str, Counter] = defaultdict(Counter)
+        # Formulations proches regroupées; les compteurs portent sur les groupes
+        self.error_clusters = TextClusterIndex()
+        self.strength_clusters = TextClusterIndex()
         self.exercise_types_attempted: Dict[str, int] = defaultdict(int)
-        self.difficulty_progression: Dict[str, List[str]] = defaultdict(list)
+
+        # Agrégats incrémentaux
+        self._count = 0
+        self._score_sum = 0.0
+        self._best_score = 0.0
+        self._recent_scores: deque = deque(maxlen=RECENT_WINDOW)
+        self._type_score_sums: Dict[str, float] = defaultdict(float)
+        self._errors = _TopCounter()
+        self._error_types = _TopCounter()
+        self._strengths = _TopCounter()
+
+    @property
+    def history(self) -> CompactHistory:
+        """Résultats, du plus ancien au plus récent (chaque entrée se lit comme un dict)"""
+        self._load_older_history()
+        return self._history
+
+    @property
+    def strengths(self) -> List[str]:
+        """Points forts distincts (un libellé par groupe), dans l'ordre d'apparition"""
+        return self.strength_clusters.labels()
+
+    @property
+    def scores(self) -> Sequence[float]:
+        """Scores (float32), du plus ancien au plus récent"""
+        self._load_older_history()
+        return self._history.scores
+
+    @property
+    def errors_by_type(self) -> Dict[str, List[str]]:
+        """Erreurs par type d'exercice, reconstruites depuis l'historique"""
+        history = self.history
+        errors_by_type: Dict[str, List[str]] = defaultdict(list)
+        for i in range(len(history)):
+            errors_by_type[history.exercise_type(i)].extend(history.errors(i))
+        return errors_by_type
+
+    @property
+    def difficulty_progression(self) -> Dict[str, List[str]]:
+        """Difficultés successives par type d'exercice, reconstruites depuis l'historique"""
+        history = self.history
+        progression: Dict[str, List[str]] = defaultdict(list)
+        for i in range(len(history)):
+            progression[history.exercise_type(i)].append(history.difficulty(i))
+        return progression
 
     def add_result(
         self,
@@ -24,82 +141,108 @@ class StudentProfile:
         feedback: Dict[str, Any],
         exercise_data: Dict[str, Any],
     ):
-        """Ajoute un résultat d'exercice au profil"""
-
-        # Extraire le score
-        score_str = feedback.get("score", "0/20")
-        try:
-            if "/" in score_str:
-                score = float(score_str.split("/")[0])
-            else:
+        """
+        Ajoute un résultat d'exercice au profil
+
+        Args:
+            exercise_type: Type d'exercice (effectif, frequence, moyenne, probleme)
+            difficulty: Niveau de difficulté
+            feedback: Feedback de la correction (score "x/20", errors, good_points,
+                et error_types pour une correction locale)
+            exercise_data: Exercice corrigé
+        """
+
+        with self._lock:
+            # Extraire le score
+            score_str = feedback.get("score", "0/20")
+            try:
+                if "/" in score_str:
+                    score = float(score_str.split("/")[0])
+                else:
+                    score = 0.0
+            except:
                 score = 0.0
-        except:
-            score = 0.0
-
-        # Enregistrer le résultat
-        result = {
-            "exercise_type": exercise_type,
-            "difficulty": difficulty,
-            "score": score,
-            "errors": feedback.get("errors", []),
-            "good_points": feedback.get("good_points", []),
-            "timestamp": self._get_timestamp(),
-        }
-
-        self.history.append(result)
-        self.scores.append(score)
-        self.exercise_types_attempted[exercise_type] += 1
-        self.difficulty_progression[exercise_type].append(difficulty)
-
-        # Analyser les erreurs
-        for error in feedback.get("errors", []):
-            self.errors_by_type[exercise_type].append(error)
-
-        # Analyser les points forts
-        for point in feedback.get("good_points", []):
-            if point not in self.strengths:
-                self.strengths.append(point)
+
+            # Enregistrer le résultat
+            self._history.append(
+                exercise_type,
+                difficulty,
+                score,
+                feedback.get("errors", []),
+                feedback.get("good_points", []),
+                feedback.get("error_types", []),
+                int(time.time()),
+            )
+            self.exercise_types_attempted[exercise_type] += 1
+
+            self._count += 1
+            self._score_sum += score
+            self._best_score = score if self._count == 1 else max(self._best_score, score)
+            self._recent_scores.append(score)
+            self._type_score_sums[exercise_type] += score
+
+            # Analyser les erreurs (un groupe compte au plus une fois par résultat)
+            for cluster_id in self._result_clusters(self.error_clusters, feedback.get("errors", [])):
+                self._errors.add(cluster_id)
+            for code in feedback.get("error_types", []):
+                self.error_types_by_exercise[exercise_type][code] += 1
+                self._error_types.add(code)
+
+            # Analyser les points forts
+            for cluster_id in self._result_clusters(
+                self.strength_clusters, feedback.get("good_points", [])
+            ):
+                self._strengths.add(cluster_id)
+
+            if self.store is not None:
+                self.store.record(self.student_id, self._history[-1])
 
     def get_profile(self) -> Dict[str, Any]:
         """Retourne le profil complet de l'élève"""
 
-        # Calculer les erreurs les plus communes
-        all_errors = []
-        for errors in self.errors_by_type.values():
-            all_errors.extend(errors)
-
-        common_errors = [
-            error for error, count in Counter(all_errors).most_common(5) if count >= 2
-        ]
+        with self._lock:
+            # Groupes d'erreurs les plus communs (tenus à jour par add_result)
+            error_clusters = [
+                {"label": self.error_clusters.label(cluster_id), "count": count}
+                for cluster_id, count in self._errors.most_common()
+                if count >= 2
+            ]
+            common_error_types = [
+                code for code, count in self._error_types.most_common() if count >= 2
+            ]
 
-        # Calculer la moyenne des scores
-        average_score = sum(self.scores) / len(self.scores) if self.scores else 0.0
+            # Calculer la moyenne des scores
+            average_score = self._score_sum / self._count if self._count else 0.0
 
-        # Déterminer le niveau recommandé
-        recommended_difficulty = self._recommend_difficulty()
+            # Déterminer le niveau recommandé
+            recommended_difficulty = self._recommend_difficulty()
 
-        # Identifier les types d'exercices à travailler
-        weak_areas = self._identify_weak_areas()
+            # Identifier les types d'exercices à travailler
+            weak_areas = self._identify_weak_areas()
 
-        return {
-            "common_errors": common_errors,
-            "strengths": self.strengths[:5],  # Top 5
-            "average_score": round(average_score, 1),
-            "total_exercises": len(self.history),
-            "recommended_difficulty": recommended_difficulty,
-            "weak_areas": weak_areas,
-            "exercise_types_attempted": dict(self.exercise_types_attempted),
-            "recent_scores": self.scores[-5:] if len(self.scores) >= 5 else self.scores,
-        }
+            return {
+                "common_errors": [cluster["label"] for cluster in error_clusters],
+                "error_clusters": error_clusters,
+                "common_error_types": common_error_types,
+                "strengths": [  # Top 5
+                    self.strength_clusters.label(cluster_id)
+                    for cluster_id, _ in self._strengths.most_common()
+                ],
+                "average_score": round(average_score, 1),
+                "total_exercises": self._count,
+                "recommended_difficulty": recommended_difficulty,
+                "weak_areas": weak_areas,
+                "exercise_types_attempted": dict(self.exercise_types_attempted),
+                "recent_scores": list(self._recent_scores),
+            }
 
     def _recommend_difficulty(self) -> str:
         """Recommandation de difficulté basée sur les performances récentes"""
 
-        if not self.scores:
+        if not self._count:
             return "moyen"
 
-        recent_scores = self.scores[-5:] if len(self.scores) >= 5 else self.scores
-        avg_recent = sum(recent_scores) / len(recent_scores)
+        avg_recent = sum(self._recent_scores) / len(self._recent_scores)
 
         if avg_recent >= 16:
             return "difficile"
@@ -112,15 +255,11 @@ class StudentProfile:
         """Identifie les domaines où l'élève a des difficultés"""
 
         weak_areas = []
-        type_scores = defaultdict(list)
-
-        # Calculer les scores moyens par type d'exercice
-        for result in self.history:
-            type_scores[result["exercise_type"]].append(result["score"])
 
-        for ex_type, scores in type_scores.items():
-            avg_score = sum(scores) / len(scores)
-            if avg_score < 12 and len(scores) >= 2:
+        # Scores moyens par type d'exercice (sommes et effectifs tenus à jour)
+        for ex_type, count in self.exercise_types_attempted.items():
+            avg_score = self._type_score_sums[ex_type] / count
+            if avg_score < 12 and count >= 2:
                 weak_areas.append(ex_type)
 
         return weak_areas
@@ -145,15 +284,12 @@ class StudentProfile:
     def get_personalized_difficulty(self, exercise_type: str) -> str:
         """Retourne la difficulté personnalisée pour un type d'exercice"""
 
-        # Filtrer les résultats pour ce type
-        type_results = [r for r in self.history if r["exercise_type"] == exercise_type]
-
-        if not type_results:
+        count = self.exercise_types_attempted.get(exercise_type, 0)
+        if not count:
             return "moyen"
 
-        # Calculer la moyenne pour ce type
-        type_scores = [r["score"] for r in type_results]
-        avg_score = sum(type_scores) / len(type_scores)
+        # Moyenne pour ce type
+        avg_score = self._type_score_sums[exercise_type] / count
 
         # Recommander selon la performance
         if avg_score >= 16:
@@ -163,43 +299,116 @@ class StudentProfile:
         else:
             return "facile"
 
-    def _get_timestamp(self) -> str:
-        """Retourne un timestamp simple"""
-        from datetime import datetime
-
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def _restore(
+        self,
+        aggregates: Dict[str, Any],
+        older_history_loader: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+    ):
+        """
+        Restaure les agrégats d'un profil enregistré (ProfileStore); l'historique
+        détaillé n'est lu qu'au premier accès, via older_history_loader
+        """
+        by_type = aggregates["by_type"]
+        self._count = sum(entry["count"] for entry in by_type.values())
+        self._score_sum = sum(entry["score_sum"] for entry in by_type.values())
+        self._best_score = max((entry["best_score"] for entry in by_type.values()), default=0.0)
+        self._type_score_sums = defaultdict(
+            float, {t: entry["score_sum"] for t, entry in by_type.items()}
+        )
+        self.exercise_types_attempted = defaultdict(
+            int, {t: entry["count"] for t, entry in by_type.items()}
+        )
+        self._recent_scores = deque(aggregates["recent_scores"], maxlen=RECENT_WINDOW)
+        self.error_clusters = TextClusterIndex()
+        self._errors.load(
+            self._cluster_counts(
+                self.error_clusters, aggregates["errors"], aggregates["error_lists"]
+            )
+        )
+        self._error_types.load(aggregates["error_types"])
+        self.error_types_by_exercise = defaultdict(Counter)
+        for exercise_type, code, count in aggregates["error_types_by_exercise"]:
+            self.error_types_by_exercise[exercise_type][code] = count
+        self.strength_clusters = TextClusterIndex()
+        self._strengths.load(
+            self._cluster_counts(
+                self.strength_clusters, aggregates["strengths"], aggregates["strength_lists"]
+            )
+        )
+        self._older_history_loader = older_history_loader
+
+    @staticmethod
+    def _result_clusters(index: TextClusterIndex, texts: Iterable[str]) -> List[int]:
+        """Groupes distincts des textes d'un résultat, dans l'ordre d'apparition"""
+        cluster_ids = (index.add(text) for text in texts)
+        return list(dict.fromkeys(i for i in cluster_ids if i is not None))
+
+    @staticmethod
+    def _cluster_counts(
+        index: TextClusterIndex,
+        counts: Iterable[Tuple[str, int]],
+        lists: Iterable[List[str]] = (),
+    ) -> List[Tuple[int, int]]:
+        """
+        Regroupe des comptages (texte, résultats où il figure) donnés dans l'ordre
+        de première apparition; lists: textes des résultats qui en ont plusieurs,
+        pour ne compter qu'une fois un groupe cité sous plusieurs formulations
+        """
+        by_cluster: Dict[int, int] = {}
+        for text, count in counts:
+            cluster_id = index.add(text, count)
+            if cluster_id is not None:
+                by_cluster[cluster_id] = by_cluster.get(cluster_id, 0) + count
+        for texts in lists:
+            cluster_ids = [index.get(text) for text in set(texts)]
+            for cluster_id in set(cluster_ids):
+                if cluster_id is not None:
+                    by_cluster[cluster_id] -= cluster_ids.count(cluster_id) - 1
+        return list(by_cluster.items())
+
+    def _load_older_history(self):
+        """Place l'historique enregistré avant les résultats ajoutés depuis le chargement"""
+        with self._lock:
+            loader = self._older_history_loader
+            if loader is None:
+                return
+            self._older_history_loader = None
+            self._history.prepend(loader())
 
     def get_progress_summary(self) -> Dict[str, Any]:
         """Résumé de la progression de l'élève"""
 
-        if not self.history:
-            return {
-                "message": "Aucun exercice complété pour le moment",
-                "trend": "stable",
-            }
-
-        # Calculer la tendance
-        if len(self.scores) >= 3:
-            recent_avg = sum(self.scores[-3:]) / 3
-            older_avg = (
-                sum(self.scores[:-3]) / (len(self.scores) - 3)
-                if len(self.scores) > 3
-                else recent_avg
-            )
-
-            if recent_avg > older_avg + 1:
-                trend = "amélioration"
-            elif recent_avg < older_avg - 1:
-                trend = "baisse"
+        with self._lock:
+            if not self._count:
+                return {
+                    "message": "Aucun exercice complété pour le moment",
+                    "trend": "stable",
+                }
+
+            # Calculer la tendance
+            total = self._count
+            if total >= TREND_WINDOW:
+                recent_sum = sum(list(self._recent_scores)[-TREND_WINDOW:])
+                recent_avg = recent_sum / TREND_WINDOW
+                older_avg = (
+                    (self._score_sum - recent_sum) / (total - TREND_WINDOW)
+                    if total > TREND_WINDOW
+                    else recent_avg
+                )
+
+                if recent_avg > older_avg + 1:
+                    trend = "amélioration"
+                elif recent_avg < older_avg - 1:
+                    trend = "baisse"
+                else:
+                    trend = "stable"
             else:
                 trend = "stable"
-        else:
-            trend = "stable"
-
-        return {
-            "total_exercises": len(self.history),
-            "average_score": round(sum(self.scores) / len(self.scores), 1),
-            "trend": trend,
-            "best_score": max(self.scores) if self.scores else 0,
-            "recent_improvement": trend == "amélioration",
-        }
+
+            return {
+                "total_exercises": total,
+                "average_score": round(self._score_sum / total, 1),
+                "trend": trend,
+                "best_score": self._best_score,
+                "recent_improvement": trend == "amélioration",
+            }
@@ -0,0 +1,376 @@
+"""
+Télémétrie des appels Gemini: une mesure par appel (opération, modèle, durée,
+tokens, nouvelles tentatives, résultat du parsing et de la vérification), exportée en JSONL avec
+rotation et au format texte Prometheus, avec percentiles par opération
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Mesure de l'appel en cours dans ce contexte (thread ou tâche asyncio)
+_current_event: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "gemini_telemetry_event", default=None
+)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def annotate(**fields):
+    """Complète la mesure de l'appel en cours (sans effet hors d'un appel suivi)"""
+    event = _current_event.get()
+    if event is not None:
+        event.update(fields)
+
+
+def run_annotated(annotations: Dict[str, Any], fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Exécute fn(*args) en collectant ses annotations dans annotations plutôt que
+    dans la mesure en cours (tentatives concurrentes d'un même appel)
+    """
+    token = _current_event.set(annotations)
+    try:
+        return fn(*args)
+    finally:
+        _current_event.reset(token)
+
+
+async def run_annotated_async(annotations: Dict[str, Any], awaitable: Awaitable[Any]) -> Any:
+    """Équivalent asynchrone de run_annotated() (à lancer dans sa propre tâche)"""
+    token = _current_event.set(annotations)
+    try:
+        return await awaitable
+    finally:
+        _current_event.reset(token)
+
+
+def merge_annotations(annotations: Dict[str, Any]):
+    """Reporte sur la mesure en cours les annotations d'une tentative retenue"""
+    annotate(**annotations)
+
+
+def note_parse(outcome: str):
+    """Enregistre le résultat du parsing de la réponse (json, repaired, regex, failed)"""
+    annotate(parse=outcome)
+
+
+def note_verification(outcome: str):
+    """Enregistre le résultat de la vérification locale de l'exercice (pass, repaired, rejected)"""
+    annotate(verification=outcome)
+
+
+class Telemetry:
+    """Collecte des mesures par appel, export JSONL et Prometheus"""
+
+    def __init__(
+        self,
+        jsonl_path: Optional[str] = None,
+        max_bytes: int = 5 * 1024 * 1024,
+        backup_count: int = 3,
+        window: int = 1000,
+    ):
+        """
+        Initialise la télémétrie
+
+        Args:
+            jsonl_path: Fichier JSONL des mesures (None: mesures en mémoire uniquement)
+            max_bytes: Taille d'un fichier JSONL avant rotation
+            backup_count: Nombre de fichiers JSONL conservés après rotation
+            window: Nombre de durées récentes conservées par opération (percentiles)
+        """
+        self.jsonl_path = jsonl_path
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._durations: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=self.window)
+        )
+        # Compteurs cumulés, par étiquettes
+        self._calls: Dict[tuple, int] = defaultdict(int)
+        self._tokens: Dict[tuple, int] = defaultdict(int)
+        self._parses: Dict[tuple, int] = defaultdict(int)
+        self._verifications: Dict[tuple, int] = defaultdict(int)
+        self._retries: Dict[str, int] = defaultdict(int)
+        self._duration_sum: Dict[str, float] = defaultdict(float)
+        self._duration_count: Dict[str, int] = defaultdict(int)
+
+        self._file_logger: Optional[logging.Logger] = None
+        if jsonl_path:
+            directory = os.path.dirname(jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                jsonl_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file_logger = logging.getLogger(f"{__name__}.jsonl.{id(self)}")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(handler)
+
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @classmethod
+    def from_env(cls) -> "Telemetry":
+        """
+        Télémétrie configurée par l'environnement: GEMINI_TELEMETRY_PATH (fichier
+        JSONL) et GEMINI_METRICS_PORT (endpoint Prometheus /metrics)
+        """
+        telemetry = cls(jsonl_path=os.getenv("GEMINI_TELEMETRY_PATH") or None)
+        port = os.getenv("GEMINI_METRICS_PORT")
+        if port:
+            try:
+                telemetry.start_http_server(int(port))
+            except OSError as e:
+                # Port déjà pris (ex: un autre processus de l'app)
+                logger.warning("Endpoint de métriques indisponible sur %s: %s", port, e)
+        return telemetry
+
+    @contextmanager
+    def track(self, operation: str) -> Iterator[Dict[str, Any]]:
+        """
+        Suit un appel (génération + parsing): la mesure est complétée par annotate()
+        et note_parse() pendant l'appel, puis enregistrée à la sortie du bloc
+        """
+        event: Dict[str, Any] = {
+            "operation": operation,
+            "model": None,
+            "cache_hit": False,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "image_tokens": 0,
+            "retries": 0,
+            "parse": None,
+            "verification": None,
+        }
+        token = _current_event.set(event)
+        start = time.perf_counter()
+        try:
+            yield event
+        except (GeneratorExit, asyncio.CancelledError):
+            # Streaming abandonné par son lecteur, ou tâche annulée: pas une erreur
+            event["cancelled"] = True
+            raise
+        except BaseException as e:
+            event.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_event.reset(token)
+            event["wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            event["timestamp"] = time.time()
+            event["ok"] = "error" not in event and not event.get("cancelled")
+            self.record(event)
+
+    def track_stream(self, operation: str, chunks: Iterator[Any]) -> Iterator[Any]:
+        """
+        Suit un appel en streaming: la mesure n'est la mesure en cours que pendant
+        le calcul de chaque fragment, jamais pendant que le lecteur le traite
+        (ses propres appels suivis ou annotés restent hors de cette mesure)
+        """
+        # Contexte propre au flux: track() et chaque next() y sont exécutés
+        context = contextvars.copy_context()
+        tracker = self.track(operation)
+        context.run(tracker.__enter__)
+        try:
+            while True:
+                try:
+                    chunk = context.run(next, chunks)
+                except StopIteration:
+                    break
+                yield chunk
+        except BaseException:
+            # Lecteur qui abandonne le flux (GeneratorExit) ou erreur du flux
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                context.run(close)
+            if not context.run(tracker.__exit__, *sys.exc_info()):
+                raise
+        else:
+            context.run(tracker.__exit__, None, None, None)
+
+    def record(self, event: Dict[str, Any]):
+        """Enregistre une mesure terminée"""
+        operation = event["operation"]
+        model = event.get("model") or ("cache" if event.get("cache_hit") else "none")
+        if event.get("cancelled"):
+            status = "cancelled"
+        else:
+            status = "ok" if event.get("ok", True) else "error"
+
+        with self._lock:
+            self._durations[operation].append(event["wall_ms"] / 1000)
+            self._duration_sum[operation] += event["wall_ms"] / 1000
+            self._duration_count[operation] += 1
+            self._calls[(operation, model, status)] += 1
+            for kind in ("prompt", "output", "image"):
+                self._tokens[(operation, kind)] += event.get(f"{kind}_tokens", 0) or 0
+            self._retries[operation] += event.get("retries", 0) or 0
+            if event.get("parse"):
+                self._parses[(operation, event["parse"])] += 1
+            if event.get("verification"):
+                self._verifications[(operation, event["verification"])] += 1
+
+        if self._file_logger is not None:
+            self._file_logger.info(json.dumps(event, ensure_ascii=False, default=str))
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Appels, erreurs, parsing, vérification et latences p50/p95/p99 (ms) par opération"""
+        with self._lock:
+            durations = {op: sorted(values) for op, values in self._durations.items()}
+            calls = dict(self._calls)
+            parses = dict(self._parses)
+            verifications = dict(self._verifications)
+
+        summary: Dict[str, Dict[str, Any]] = {}
+        for operation, ordered in durations.items():
+            entry: Dict[str, Any] = {
+                "calls": sum(n for (op, _, _), n in calls.items() if op == operation),
+                "errors": sum(
+                    n for (op, _, status), n in calls.items()
+                    if op == operation and status == "error"
+                ),
+                "cancelled": sum(
+                    n for (op, _, status), n in calls.items()
+                    if op == operation and status == "cancelled"
+                ),
+                "parse": {
+                    outcome: n for (op, outcome), n in parses.items() if op == operation
+                },
+            }
+            verification = {
+                outcome: n for (op, outcome), n in verifications.items() if op == operation
+            }
+            if verification:
+                entry["verification"] = verification
+            for quantile in QUANTILES:
+                entry[f"p{int(quantile * 100)}_ms"] = round(
+                    _percentile(ordered, quantile) * 1000, 1
+                )
+            summary[operation] = entry
+        return summary
+
+    def render_prometheus(self) -> str:
+        """Exposition texte Prometheus des compteurs et des résumés de latence"""
+        with self._lock:
+            durations = {op: sorted(values) for op, values in self._durations.items()}
+            calls = dict(self._calls)
+            tokens = dict(self._tokens)
+            parses = dict(self._parses)
+            verifications = dict(self._verifications)
+            retries = dict(self._retries)
+            duration_sum = dict(self._duration_sum)
+            duration_count = dict(self._duration_count)
+
+        lines: List[str] = [
+            "# HELP gemini_calls_total Appels Gemini par opération, modèle et statut "
+            "(ok, error, cancelled)",
+            "# TYPE gemini_calls_total counter",
+        ]
+        for (operation, model, status), value in sorted(calls.items()):
+            lines.append(
+                f'gemini_calls_total{{operation="{operation}",model="{model}",'
+                f'status="{status}"}} {value}'
+            )
+
+        lines += [
+            "# HELP gemini_tokens_total Tokens par opération et type (prompt, output, image)",
+            "# TYPE gemini_tokens_total counter",
+        ]
+        for (operation, kind), value in sorted(tokens.items()):
+            lines.append(f'gemini_tokens_total{{operation="{operation}",kind="{kind}"}} {value}')
+
+        lines += [
+            "# HELP gemini_retries_total Nouvelles tentatives par opération",
+            "# TYPE gemini_retries_total counter",
+        ]
+        for operation, value in sorted(retries.items()):
+            lines.append(f'gemini_retries_total{{operation="{operation}"}} {value}')
+
+        lines += [
+            "# HELP gemini_parse_total Résultats du parsing des réponses",
+            "# TYPE gemini_parse_total counter",
+        ]
+        for (operation, outcome), value in sorted(parses.items()):
+            lines.append(
+                f'gemini_parse_total{{operation="{operation}",outcome="{outcome}"}} {value}'
+            )
+
+        lines += [
+            "# HELP gemini_verification_total Vérifications locales des exercices générés",
+            "# TYPE gemini_verification_total counter",
+        ]
+        for (operation, outcome), value in sorted(verifications.items()):
+            lines.append(
+                f'gemini_verification_total{{operation="{operation}",outcome="{outcome}"}} {value}'
+            )
+
+        lines += [
+            "# HELP gemini_call_duration_seconds Durée des appels (génération + parsing)",
+            "# TYPE gemini_call_duration_seconds summary",
+        ]
+        for operation, ordered in sorted(durations.items()):
+            for quantile in QUANTILES:
+                lines.append(
+                    f'gemini_call_duration_seconds{{operation="{operation}",'
+                    f'quantile="{quantile}"}} {_percentile(ordered, quantile):.6f}'
+                )
+            lines.append(
+                f'gemini_call_duration_seconds_sum{{operation="{operation}"}} '
+                f"{duration_sum[operation]:.6f}"
+            )
+            lines.append(
+                f'gemini_call_duration_seconds_count{{operation="{operation}"}} '
+                f"{duration_count[operation]}"
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port: int, host: str = "0.0.0.0"):
+        """Sert render_prometheus() sur http://host:port/metrics (thread en arrière-plan)"""
+        if self._server is not None:
+            return
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(
+            target=self._server.serve_forever, name="gemini-metrics", daemon=True
+        ).start()
+
+    def shutdown(self):
+        """Arrête l'endpoint de métriques"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+def _percentile(ordered: List[float], quantile: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
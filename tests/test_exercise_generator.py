@@ -0,0 +1,70 @@
+"""
+Disjoncteurs: un appel interrompu par le budget de temps de generate() ne
+compte pas comme une panne, et la réserve a son propre disjoncteur
+"""
+
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+from exercise_generator import POOL_OPERATION, ExerciseGenerator
+from gemini_client import GeminiClient
+
+
+class SlowGemini:
+    """Client factice plus lent que le budget: l'appel échoue à l'échéance"""
+
+    def __init__(self, latency: float, flag_deadline: bool = True):
+        self.latency = latency
+        self.flag_deadline = flag_deadline
+        self.calls = 0
+
+    def generate_exercise(self, exercise_type, difficulty, timeout=None):
+        self.calls += 1
+        if timeout is None or timeout >= self.latency:
+            time.sleep(self.latency)
+            return {"type": exercise_type, "question": "?", "exercise_data": {}}
+        time.sleep(timeout)
+        if self.flag_deadline:
+            return GeminiClient._generation_error(
+                api_exceptions.DeadlineExceeded("Deadline Exceeded")
+            )
+        return {"error": "Erreur lors de la génération: délai", "question": "", "exercise_data": {}}
+
+
+def make_generator(gemini: SlowGemini) -> ExerciseGenerator:
+    return ExerciseGenerator(
+        gemini, use_pool=False, breaker_failure_threshold=1, min_stage_budget=0.01
+    )
+
+
+def test_deadline_exceeded_does_not_open_breaker():
+    gemini = SlowGemini(latency=0.2)
+    generator = make_generator(gemini)
+    for _ in range(3):
+        exercise = generator.generate("moyenne", deadline=0.1)
+        assert "error" not in exercise  # Exercice du moteur local
+
+    stats = generator.get_breaker_stats()["generate_exercise"]
+    assert gemini.calls == 3
+    assert stats["state"] == "closed"
+    assert stats["released"] == 3
+    assert stats["short_circuited"] == 0
+
+
+def test_unflagged_error_after_deadline_does_not_open_breaker():
+    gemini = SlowGemini(latency=0.2, flag_deadline=False)
+    generator = make_generator(gemini)
+    generator.generate("moyenne", deadline=0.1)
+    generator.generate("moyenne", deadline=0.1)
+
+    assert gemini.calls == 2
+    assert generator.get_breaker_stats()["generate_exercise"]["state"] == "closed"
+
+
+def test_pool_has_its_own_breaker():
+    generator = make_generator(SlowGemini(latency=0.0))
+    generator.breakers["generate_exercise"].record_failure()
+
+    assert generator.get_breaker_stats()["generate_exercise"]["state"] == "open"
+    assert generator.get_breaker_stats()[POOL_OPERATION]["state"] == "closed"
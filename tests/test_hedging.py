@@ -0,0 +1,98 @@
+"""
+Requêtes couvertes: bascule sur tous les candidats après des échecs rapides
+(comme sans couverture), et compteur des perdants abandonnés
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from hedging import Hedger
+from model_registry import ModelRegistry
+
+NAMES = ("a", "b", "c")
+
+
+def make_registry() -> ModelRegistry:
+    registry = ModelRegistry({name: object() for name in NAMES})
+    for name in NAMES:
+        for operation in ("generate_exercise", "tutor:first_chunk"):
+            registry.record(name, operation, 0.02, ok=True)
+    return registry
+
+
+@pytest.fixture
+def hedger():
+    hedger = Hedger(min_samples=1)
+    yield hedger
+    hedger.shutdown()
+
+
+def test_fast_failures_go_through_every_candidate(hedger):
+    tried = []
+
+    def attempt(name, model):
+        tried.append(name)
+        if name != "c":
+            raise RuntimeError(f"{name} indisponible")
+        return name
+
+    assert hedger.run(make_registry(), "generate_exercise", attempt) == "c"
+    assert tried == ["a", "b", "c"]
+    assert hedger.get_stats()["hedged"] == 0
+
+
+def test_all_candidates_failing_raises_last_error(hedger):
+    def attempt(name, model):
+        raise RuntimeError(f"{name} indisponible")
+
+    with pytest.raises(RuntimeError, match="c indisponible"):
+        hedger.run(make_registry(), "generate_exercise", attempt)
+
+
+def test_async_fast_failures_go_through_every_candidate(hedger):
+    tried = []
+
+    async def attempt(name, model):
+        tried.append(name)
+        if name != "c":
+            raise RuntimeError(f"{name} indisponible")
+        return name
+
+    result = asyncio.run(hedger.run_async(make_registry(), "generate_exercise", attempt))
+    assert (result, tried) == ("c", ["a", "b", "c"])
+
+
+def test_stream_failing_before_first_chunk_goes_through_every_candidate(hedger):
+    def open_stream(name, model):
+        if name != "c":
+            raise RuntimeError(f"{name} indisponible")
+        yield "Bonjour"
+        yield " !"
+
+    chunks = hedger.first_chunk(make_registry(), "tutor", open_stream)
+    assert "".join(chunks) == "Bonjour !"
+
+
+def test_slow_primary_is_hedged_and_abandoned(hedger):
+    def attempt(name, model):
+        time.sleep(0.3 if name == "a" else 0.01)
+        return name
+
+    assert hedger.run(make_registry(), "generate_exercise", attempt) == "b"
+    stats = hedger.get_stats()
+    assert (stats["hedged"], stats["hedge_wins"], stats["abandoned"]) == (1, 1, 1)
+    assert "cancelled" not in stats
+
+
+def test_hedge_that_fails_falls_back_to_next_candidate(hedger):
+    def attempt(name, model):
+        if name == "a":
+            time.sleep(0.3)
+            raise RuntimeError("a indisponible")
+        if name == "b":
+            raise RuntimeError("b indisponible")
+        return name
+
+    assert hedger.run(make_registry(), "generate_exercise", attempt) == "c"
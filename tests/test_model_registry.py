@@ -0,0 +1,29 @@
+"""
+Routage: un modèle dont la sonde a échoué reste en dernier après le cooldown,
+jusqu'à ce qu'une sonde ou un appel réussisse
+"""
+
+from model_registry import ModelRegistry
+
+
+def test_probe_failed_model_stays_last_after_cooldown():
+    available = {"a": False, "b": True}
+    registry = ModelRegistry(
+        {"a": object(), "b": object()}, probe=lambda name: available[name], cooldown=0
+    )
+    registry.probe()
+    assert [name for name, _ in registry.candidates("generate_exercise")] == ["b", "a"]
+
+    # Nouvelle sonde réussie: l'ordre de préférence initial revient
+    available["a"] = True
+    registry.probe()
+    assert [name for name, _ in registry.candidates("generate_exercise")] == ["a", "b"]
+
+
+def test_successful_call_clears_probe_failure():
+    registry = ModelRegistry(
+        {"a": object(), "b": object()}, probe=lambda name: name != "a", cooldown=0
+    )
+    registry.probe()
+    registry.record("a", "generate_exercise", 0.01, ok=True)
+    assert [name for name, _ in registry.candidates("generate_exercise")] == ["a", "b"]
@@ -0,0 +1,116 @@
+"""
+Parseur tolérant des réponses JSON du modèle: blocs ```json, réponses tronquées,
+virgules finales, quotes simples et JSON entouré de texte
+"""
+
+import pytest
+
+from structured_output import (
+    PARSE_FAILED,
+    PARSE_JSON,
+    PARSE_REPAIRED,
+    parse_json_object,
+    parse_json_response,
+)
+
+
+@pytest.mark.parametrize(
+    "response, expected",
+    [
+        (
+            '```json\n{"score": "15/20", "errors": ["Total faux"]}\n```',
+            {"score": "15/20", "errors": ["Total faux"]},
+        ),
+        ('```\n{"score": "12/20"}\n```', {"score": "12/20"}),
+        ('```JSON\n{"valid": true, "examples": []}', {"valid": True, "examples": []}),
+    ],
+)
+def test_fenced(response, expected):
+    assert parse_json_response(response) == (expected, PARSE_JSON)
+
+
+@pytest.mark.parametrize(
+    "response, expected",
+    [
+        (
+            '{"feedback": "Bien", "errors": ["Total faux", "Moyenne',
+            {"feedback": "Bien", "errors": ["Total faux", "Moyenne"]},
+        ),
+        (
+            '{"steps": [{"step_number": 1, "status": "correct"}, {"step_number": 2',
+            {"steps": [{"step_number": 1, "status": "correct"}, {"step_number": 2}]},
+        ),
+        ('{"score": "12/20", "feed', {"score": "12/20"}),
+        ('{"score": "12/20", "feedback":', {"score": "12/20", "feedback": None}),
+        ('{"feedback": "Il a dit \\"bien', {"feedback": 'Il a dit "bien'}),
+    ],
+)
+def test_truncated(response, expected):
+    assert parse_json_response(response) == (expected, PARSE_REPAIRED)
+
+
+@pytest.mark.parametrize(
+    "response, expected",
+    [
+        ('{"errors": ["a", "b",], "score": "10/20",}', {"errors": ["a", "b"], "score": "10/20"}),
+        ('```json\n{"data": [1, 2,]}\n```', {"data": [1, 2]}),
+        ('{"steps": [\n  {"step_number": 1},\n]\n}', {"steps": [{"step_number": 1}]}),
+    ],
+)
+def test_trailing_comma(response, expected):
+    assert parse_json_response(response) == (expected, PARSE_REPAIRED)
+
+
+@pytest.mark.parametrize(
+    "response, expected",
+    [
+        (
+            "{'score': '14/20', 'errors': [], 'valid': True}",
+            {"score": "14/20", "errors": [], "valid": True},
+        ),
+        (
+            "{'feedback': \"L'effectif total\", 'score': '8/20'}",
+            {"feedback": "L'effectif total", "score": "8/20"},
+        ),
+    ],
+)
+def test_single_quoted(response, expected):
+    assert parse_json_response(response) == (expected, PARSE_REPAIRED)
+
+
+@pytest.mark.parametrize(
+    "response, expected",
+    [
+        (
+            'Voici mon analyse : {"score": "9/20", "feedback": "Revois {la médiane}"} '
+            "J'espère que cela aide.",
+            {"score": "9/20", "feedback": "Revois {la médiane}"},
+        ),
+        (
+            'Voici la correction :\n```\n{"score": "12/20"}\n```\nBon courage !',
+            {"score": "12/20"},
+        ),
+        ('{"a": 1} puis {"b": 2}', {"a": 1}),
+    ],
+)
+def test_prose_wrapped(response, expected):
+    assert parse_json_response(response) == (expected, PARSE_JSON)
+
+
+def test_prose_wrapped_and_repaired():
+    response = 'Résultat :\n{"errors": ["Total faux",], "score": "11/20"}\nFin.'
+    assert parse_json_response(response) == (
+        {"errors": ["Total faux"], "score": "11/20"},
+        PARSE_REPAIRED,
+    )
+
+
+@pytest.mark.parametrize("response", ["", "pas de json ici", "Score : 12/20"])
+def test_failed(response):
+    assert parse_json_response(response) == (None, PARSE_FAILED)
+
+
+def test_parse_json_object_rejects_arrays():
+    assert parse_json_response("[1, 2, 3]") == ([1, 2, 3], PARSE_JSON)
+    assert parse_json_object("[1, 2, 3]") == (None, PARSE_FAILED)
+    assert parse_json_object('Réponse : {"a": 1}') == ({"a": 1}, PARSE_JSON)
@@ -0,0 +1,83 @@
+"""
+Comptage des erreurs et points forts regroupés: un groupe compte au plus une
+fois par résultat, en mémoire comme après relecture depuis la base
+"""
+
+import threading
+
+from profile_store import ProfileStore
+from student_profile import StudentProfile
+
+RESULTS = [
+    {
+        "score": "8/20",
+        "errors": [
+            "Tu n'as pas divisé par l'effectif total.",
+            "Attention : tu n'as pas divisé par l'effectif total.",
+            "Tu n'as pas divisé par l'effectif total.",
+        ],
+        "good_points": ["Tableau bien construit", "Le tableau est bien construit"],
+    },
+    {
+        "score": "12/20",
+        "errors": ["Erreur de calcul de la médiane"],
+        "good_points": ["Tableau bien construit"],
+    },
+    {
+        "score": "10/20",
+        "errors": ["Erreur de calcul de la médiane", "Erreur de calcul de la médiane"],
+        "good_points": [],
+    },
+]
+
+
+def add_results(profile: StudentProfile):
+    for feedback in RESULTS:
+        profile.add_result("moyenne", "moyen", feedback, {})
+
+
+def test_cluster_counted_once_per_result():
+    profile = StudentProfile()
+    add_results(profile)
+
+    # Trois formulations dans le premier résultat, deux fois la même dans le dernier
+    assert profile._errors.most_common() == [(1, 2), (0, 1)]
+    assert profile.get_profile()["error_clusters"] == [
+        {"label": "Erreur de calcul de la médiane", "count": 2}
+    ]
+    assert profile._strengths.most_common() == [(0, 2)]
+    assert profile.get_profile()["strengths"] == ["Tableau bien construit"]
+
+
+def test_reloaded_profile_counts_match(tmp_path):
+    expected = StudentProfile()
+    add_results(expected)
+
+    store = ProfileStore(str(tmp_path / "students.db"), flush_interval=0)
+    add_results(store.get_profile("eleve"))
+    store.close()
+
+    store = ProfileStore(str(tmp_path / "students.db"), flush_interval=0)
+    reloaded = store.get_profile("eleve")
+    assert reloaded.get_profile() == expected.get_profile()
+    assert reloaded._errors.most_common() == expected._errors.most_common()
+    assert reloaded._strengths.most_common() == expected._strengths.most_common()
+    store.close()
+
+
+def test_shared_profile_concurrent_results(tmp_path):
+    store = ProfileStore(str(tmp_path / "students.db"), flush_interval=0)
+    # Deux sessions ouvertes avec le même ?eleve= reçoivent le même objet
+    profile = store.get_profile("eleve")
+    assert store.get_profile("eleve") is profile
+
+    threads = [threading.Thread(target=add_results, args=(profile,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert profile.get_profile()["total_exercises"] == 8 * len(RESULTS)
+    assert len(profile.history) == 8 * len(RESULTS)
+    assert profile._errors.most_common() == [(1, 16), (0, 8)]
+    store.close()
@@ -0,0 +1,166 @@
+"""
+Télémétrie: streaming abandonné compté comme annulé, mesure d'un flux isolée
+du code du lecteur, annotations des tentatives couvertes (hedging) limitées à
+la tentative retenue
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from gemini_client import GeminiClient
+from hedging import Hedger
+from model_registry import ModelRegistry
+from telemetry import Telemetry, annotate
+
+
+def test_abandoned_stream_is_cancelled_not_error():
+    telemetry = Telemetry()
+
+    def stream():
+        with telemetry.track("tutor"):
+            yield "Bonjour"
+            yield "!"
+
+    chunks = stream()
+    assert next(chunks) == "Bonjour"
+    chunks.close()
+
+    summary = telemetry.summary()["tutor"]
+    assert summary["calls"] == 1
+    assert summary["errors"] == 0
+    assert summary["cancelled"] == 1
+    assert 'status="cancelled"' in telemetry.render_prometheus()
+
+
+def test_stream_event_unaffected_between_chunks():
+    telemetry = Telemetry()
+    events = []
+    telemetry.record = events.append
+
+    def chunks():
+        annotate(model="flash", output_tokens=1)
+        yield "Bonjour"
+        annotate(output_tokens=2)
+        yield "!"
+
+    stream = telemetry.track_stream("tutor", chunks())
+    assert next(stream) == "Bonjour"
+    # Code du lecteur entre deux fragments: annotation et autre appel suivi
+    annotate(model="lecteur", retries=5)
+    with telemetry.track("tutor_summary"):
+        annotate(model="pro")
+    assert list(stream) == ["!"]
+
+    summary_event, stream_event = events
+    assert summary_event["operation"] == "tutor_summary"
+    assert summary_event["model"] == "pro"
+    assert stream_event["operation"] == "tutor"
+    assert (stream_event["model"], stream_event["output_tokens"]) == ("flash", 2)
+    assert stream_event["retries"] == 0
+    assert stream_event["ok"]
+
+
+class StreamingModel:
+    """Modèle factice qui renvoie sa réponse en deux fragments"""
+
+    model_name = "flash"
+
+    def generate_content(self, contents, **kwargs):
+        for text in ("Bonjour", "!"):
+            yield SimpleNamespace(text=text)
+
+
+def test_client_stream_event_unaffected_between_chunks():
+    client = GeminiClient(api_key="test", enable_cache=False, probe_models=False)
+    client.model = StreamingModel()
+    client.hedger = None
+    events = []
+    client.telemetry.record = events.append
+
+    stream = client.generate_text_stream("Explique la médiane")
+    assert next(stream) == "Bonjour"
+    annotate(model="lecteur", retries=5)
+    assert list(stream) == ["!"]
+
+    (event,) = events
+    assert (event["operation"], event["model"], event["retries"]) == ("tutor", "flash", 0)
+
+
+def test_abandoned_track_stream_is_cancelled_and_closes_source():
+    telemetry = Telemetry()
+    closed = []
+
+    def chunks():
+        try:
+            yield "Bonjour"
+            yield "!"
+        finally:
+            closed.append(True)
+
+    stream = telemetry.track_stream("tutor", chunks())
+    assert next(stream) == "Bonjour"
+    stream.close()
+
+    assert closed == [True]
+    assert telemetry.summary()["tutor"]["cancelled"] == 1
+
+
+def test_error_is_still_an_error():
+    telemetry = Telemetry()
+    try:
+        with telemetry.track("generate_exercise"):
+            raise RuntimeError("panne")
+    except RuntimeError:
+        pass
+    summary = telemetry.summary()["generate_exercise"]
+    assert (summary["errors"], summary["cancelled"]) == (1, 0)
+
+
+def make_registry() -> ModelRegistry:
+    registry = ModelRegistry({"lent": object(), "rapide": object()})
+    for name in ("lent", "rapide"):
+        registry.record(name, "generate_exercise", 0.01, ok=True)
+    return registry
+
+
+def attempt(name, model):
+    # Le perdant ("lent") termine après le gagnant et annote quand même
+    annotate(model=name, retries=3 if name == "lent" else 1)
+    time.sleep(0.3 if name == "lent" else 0.05)
+    annotate(model=name, output_tokens=99 if name == "lent" else 7)
+    return name
+
+
+def test_hedged_call_keeps_only_the_winner_annotations():
+    telemetry = Telemetry()
+    hedger = Hedger(min_samples=1)
+    with telemetry.track("generate_exercise") as event:
+        assert hedger.run(make_registry(), "generate_exercise", attempt) == "rapide"
+    time.sleep(0.4)
+
+    assert (event["model"], event["retries"], event["output_tokens"]) == ("rapide", 1, 7)
+    hedger.shutdown()
+
+
+def test_hedged_async_call_keeps_only_the_winner_annotations():
+    telemetry = Telemetry()
+    hedger = Hedger(min_samples=1)
+
+    async def attempt_async(name, model):
+        annotate(model=name, retries=3 if name == "lent" else 1)
+        if name == "lent":
+            # Annulé par la victoire de "rapide": ses tokens ne doivent pas fuir
+            annotate(output_tokens=99)
+        await asyncio.sleep(0.3 if name == "lent" else 0.05)
+        return name
+
+    async def main():
+        with telemetry.track("generate_exercise") as event:
+            result = await hedger.run_async(make_registry(), "generate_exercise", attempt_async)
+        return result, event
+
+    result, event = asyncio.run(main())
+    assert result == "rapide"
+    assert (event["model"], event["retries"], event["output_tokens"]) == ("rapide", 1, 0)
+    hedger.shutdown()
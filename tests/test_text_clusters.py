@@ -0,0 +1,87 @@
+"""
+Regroupement des erreurs et points forts: les formulations proches d'une même
+remarque sont regroupées, les remarques différentes ou de sens opposé jamais
+"""
+
+import pytest
+
+from text_clusters import TextClusterIndex, measures, normalize_text, polarity
+
+# Remarques différentes (autre notion) ou opposées (polarité inverse)
+DISTINCT_PAIRS = [
+    ("Erreur de calcul de la moyenne", "Erreur de calcul de la médiane"),
+    ("Moyenne correcte", "Moyenne incorrecte"),
+    ("Le tableau est bien construit", "Le tableau est mal construit"),
+    ("Bonne utilisation des fréquences", "Mauvaise utilisation des fréquences"),
+    ("La médiane est juste", "La médiane est fausse"),
+    ("Tableau complet", "Tableau incomplet"),
+    ("Fréquences bien calculées", "Fréquences mal calculées"),
+    ("Calcul de l'étendue correct", "Calcul de la moyenne correct"),
+    ("Tu as bien rangé les valeurs", "Tu n'as pas rangé les valeurs"),
+]
+
+SAME_PAIRS = [
+    ("Tu n'as pas divisé par l'effectif total.", "Attention : tu n'as pas divisé par l'effectif total."),
+    ("Tu n'as pas divisé par l'effectif total de 25.", "Tu n'as pas divisé par l'effectif total de 30."),
+    ("Le total des effectifs est faux : 18 au lieu de 20.", "Erreur dans le total des effectifs (18 au lieu de 20)."),
+    (
+        "Pour la médiane, il faut d'abord ranger les valeurs dans l'ordre croissant.",
+        "Tu as oublié de ranger les valeurs dans l'ordre croissant pour trouver la médiane.",
+    ),
+]
+
+
+@pytest.mark.parametrize("first, second", DISTINCT_PAIRS)
+def test_distinct_remarks_stay_apart(first, second):
+    index = TextClusterIndex()
+    assert index.add(first) != index.add(second)
+    # Quel que soit l'ordre d'arrivée
+    index = TextClusterIndex()
+    assert index.add(second) != index.add(first)
+
+
+@pytest.mark.parametrize("first, second", DISTINCT_PAIRS)
+def test_distinct_remarks_stay_apart_in_a_busy_index(first, second):
+    index = TextClusterIndex()
+    for a, b in DISTINCT_PAIRS + SAME_PAIRS:
+        index.add(a)
+        index.add(b)
+    assert index.add(first) != index.add(second)
+
+
+@pytest.mark.parametrize("first, second", SAME_PAIRS)
+def test_rewordings_are_grouped(first, second):
+    index = TextClusterIndex()
+    assert index.add(first) == index.add(second)
+
+
+def test_top_counts_occurrences_and_labels_with_most_frequent_phrasing():
+    index = TextClusterIndex()
+    index.add("Tu n'as pas divisé par l'effectif total de 25.")
+    index.add("Tu n'as pas divisé par l'effectif total.", count=2)
+    index.add("Moyenne correcte")
+
+    top = index.top(2)
+    assert top[0] == {
+        "label": "Tu n'as pas divisé par l'effectif total.",
+        "count": 3,
+        "variants": 2,
+    }
+    assert top[1]["label"] == "Moyenne correcte"
+    assert len(index) == 2
+
+
+def test_empty_text_is_ignored():
+    index = TextClusterIndex()
+    assert index.add("") is None
+    assert index.add(" ... ") is None
+    assert len(index) == 0
+
+
+def test_features():
+    assert normalize_text("La Médiane vaut 12,5 !") == "mediane vaut #"
+    assert polarity("Moyenne incorrecte") == -1
+    assert polarity("Tu n'as pas rangé les valeurs") == -1
+    assert polarity("Bonne utilisation des fréquences") == 1
+    assert polarity("Le résultat doit être arrondi au centième") == 0
+    assert measures("Moyenne et médiane justes") == {"moyenne", "mediane"}
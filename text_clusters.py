@@ -0,0 +1,268 @@
+"""
+Regroupement incrémental des erreurs et points forts formulés différemment
+Texte normalisé (minuscules, sans accents, nombres remplacés), découpé en
+shingles de mots (racines et paires de racines), signature MinHash et index LSH
+par bandes: un nouveau texte n'est comparé qu'aux groupes qui partagent une
+bande avec lui. La polarité (bien/mal, correct/incorrect...) et la notion
+statistique citée (moyenne, médiane...) doivent en plus concorder
+"""
+
+import re
+import unicodedata
+import zlib
+from heapq import nlargest
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Racine d'un mot: ses premières lettres (divise, divisant, diviser -> divis)
+STEM_LENGTH = 5
+# 40 bandes de 2 lignes (80 permutations MinHash): deux textes de similarité
+# 0,25 partagent une bande avec une probabilité ~0,92, à 0,5 quasi certainement
+NUM_BANDS = 40
+BAND_ROWS = 2
+NUM_PERM = NUM_BANDS * BAND_ROWS
+# Similarité de Jaccard (exacte, sur les shingles) au-delà de laquelle deux
+# textes sont regroupés; le MinHash ne sert qu'à trouver les candidats
+SIMILARITY_THRESHOLD = 0.25
+# Formulations indexées par groupe (comparaison et index) et formulations comptées
+MAX_MEMBERS = 8
+MAX_VARIANTS = 20
+
+STOPWORDS = frozenset(
+    "a au aux avec ce ces d de des du en est et il elle l la le les ma mon "
+    "ne ou par pour qu que qui sa se son sur ta te ton tu un une y".split()
+)
+
+# Marqueurs de polarité (sans accents): un texte négatif n'est jamais regroupé
+# avec un texte positif
+NEGATIVE_WORDS = frozenset(
+    "pas non n ne mal mauvais mauvaise mauvaises incorrect incorrecte incorrects "
+    "incorrectes inexact inexacte inexacts inexactes faux fausse fausses errone "
+    "erronee erronees erreur erreurs oubli oublie oubliee oublier manque manquant "
+    "manquante absent absente aucun aucune jamais sans insuffisant insuffisante "
+    "incomplet incomplete imprecis imprecise".split()
+)
+POSITIVE_WORDS = frozenset(
+    "bien bon bons bonne bonnes correct correcte corrects correctes juste justes "
+    "exact exacte exacts exactes reussi reussie complet complete parfait parfaite "
+    "excellent excellente maitrise maitrisee precis precise".split()
+)
+# Notions statistiques: deux textes qui en citent de différentes restent séparés
+MEASURES = {
+    "moyenne": "moyenne",
+    "moyennes": "moyenne",
+    "mediane": "mediane",
+    "medianes": "mediane",
+    "etendue": "etendue",
+    "etendues": "etendue",
+    "frequence": "frequence",
+    "frequences": "frequence",
+    "pourcentage": "pourcentage",
+    "pourcentages": "pourcentage",
+    "quartile": "quartile",
+    "quartiles": "quartile",
+}
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+_WORD_RE = re.compile(r"[a-z#]+")
+
+
+def _words(text: Any) -> List[str]:
+    """Mots en minuscules sans accents, nombres remplacés par #"""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _WORD_RE.findall(_NUMBER_RE.sub("#", text))
+
+
+def normalize_text(text: Any) -> str:
+    """Texte comparable: minuscules sans accents, nombres remplacés par #, sans mots outils"""
+    return " ".join(word for word in _words(text) if word not in STOPWORDS)
+
+
+def polarity(text: Any) -> int:
+    """-1 si le texte contient une négation ou un mot négatif, 1 s'il est positif, 0 sinon"""
+    words = set(_words(text))
+    if words & NEGATIVE_WORDS:
+        return -1
+    return 1 if words & POSITIVE_WORDS else 0
+
+
+def measures(text: Any) -> FrozenSet[str]:
+    """Notions statistiques citées par le texte"""
+    return frozenset(MEASURES[word] for word in _words(text) if word in MEASURES)
+
+
+def word_shingles(normalized: str) -> Set[str]:
+    """Racines des mots et paires de racines consécutives d'un texte normalisé"""
+    stems = [word[:STEM_LENGTH] for word in normalized.split()]
+    return set(stems) | {f"{a} {b}" for a, b in zip(stems, stems[1:])}
+
+
+def compatible(features_a: Tuple[int, FrozenSet[str]], features_b: Tuple[int, FrozenSet[str]]) -> bool:
+    """Polarités non opposées et mêmes notions statistiques (quand les deux en citent)"""
+    (polarity_a, measures_a), (polarity_b, measures_b) = features_a, features_b
+    if polarity_a * polarity_b < 0:
+        return False
+    return not (measures_a and measures_b and measures_a != measures_b)
+
+
+def minhash_signature(normalized: str, shingles: Optional[Set[str]] = None) -> np.ndarray:
+    """Signature MinHash (NUM_PERM valeurs) des shingles de mots d'un texte normalisé"""
+    shingles = shingles if shingles is not None else word_shingles(normalized)
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) % _PRIME for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    return ((np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+def jaccard(shingles_a: Set[str], shingles_b: Set[str]) -> float:
+    """Similarité de Jaccard exacte entre deux ensembles de shingles"""
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+
+class _Cluster:
+    __slots__ = ("count", "variants", "label", "members")
+
+    def __init__(self):
+        self.count = 0
+        # Formulation -> [occurrences, ordre d'apparition]
+        self.variants: Dict[str, List[int]] = {}
+        self.label = ""
+        # Shingles et caractéristiques (polarité, notions) des formulations indexées
+        self.members: List[Tuple[Set[str], Tuple[int, FrozenSet[str]]]] = []
+
+    def add(self, text: str, count: int):
+        self.count += count
+        variant = self.variants.get(text)
+        if variant is None:
+            if len(self.variants) >= MAX_VARIANTS:
+                return
+            variant = self.variants[text] = [0, len(self.variants)]
+        variant[0] += count
+        # Libellé: formulation la plus fréquente (la première vue en cas d'égalité)
+        current = self.variants.get(self.label)
+        if current is None or (-variant[0], variant[1]) < (-current[0], current[1]):
+            self.label = text
+
+
+class TextClusterIndex:
+    """Groupes de textes proches, tenus à jour à chaque ajout"""
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._clusters: List[_Cluster] = []
+        # Texte (brut ou normalisé) déjà vu -> groupe, sans recalcul de signature
+        self._by_raw: Dict[str, int] = {}
+        self._by_text: Dict[str, int] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(NUM_BANDS)]
+
+    def add(self, text: Any, count: int = 1) -> Optional[int]:
+        """
+        Ajoute un texte (count occurrences) à son groupe, créé au besoin
+
+        Returns:
+            Identifiant du groupe (None pour un texte vide)
+        """
+        text = str(text)
+        cluster_id = self._by_raw.get(text)
+        if cluster_id is None:
+            key = normalize_text(text)
+            if not key:
+                return None
+            cluster_id = self._by_text.get(key)
+            if cluster_id is None:
+                shingles = word_shingles(key)
+                signature = minhash_signature(key, shingles)
+                features = (polarity(text), measures(text))
+                cluster_id = self._match(signature, shingles, features)
+                if cluster_id is None:
+                    cluster_id = len(self._clusters)
+                    self._clusters.append(_Cluster())
+                self._index(cluster_id, signature, shingles, features)
+                self._by_text[key] = cluster_id
+            self._by_raw[text] = cluster_id
+        self._clusters[cluster_id].add(text, count)
+        return cluster_id
+
+    def get(self, text: Any) -> Optional[int]:
+        """Groupe d'un texte déjà ajouté (None sinon)"""
+        text = str(text)
+        cluster_id = self._by_raw.get(text)
+        return cluster_id if cluster_id is not None else self._by_text.get(normalize_text(text))
+
+    def label(self, cluster_id: int) -> str:
+        """Formulation la plus fréquente du groupe"""
+        return self._clusters[cluster_id].label
+
+    def labels(self) -> List[str]:
+        """Libellés de tous les groupes, dans l'ordre de création"""
+        return [cluster.label for cluster in self._clusters]
+
+    def top(self, k: int = 5) -> List[Dict[str, Any]]:
+        """Les k groupes les plus fréquents: libellé, occurrences et formulations distinctes"""
+        best = nlargest(
+            k, range(len(self._clusters)), key=lambda i: (self._clusters[i].count, -i)
+        )
+        return [
+            {
+                "label": self._clusters[i].label,
+                "count": self._clusters[i].count,
+                "variants": len(self._clusters[i].variants),
+            }
+            for i in best
+        ]
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def _match(
+        self,
+        signature: np.ndarray,
+        shingles: Set[str],
+        features: Tuple[int, FrozenSet[str]],
+    ) -> Optional[int]:
+        """Groupe compatible le plus proche parmi ceux qui partagent une bande LSH"""
+        candidates = set()
+        for band, bucket in zip(self._band_keys(signature), self._buckets):
+            candidates.update(bucket.get(band, ()))
+        best_id, best_score = None, -1.0
+        # Égalité: le groupe le plus ancien
+        for cluster_id in sorted(candidates):
+            members = self._clusters[cluster_id].members
+            # Une seule formulation incompatible suffit à écarter le groupe
+            if not all(compatible(features, other) for _, other in members):
+                continue
+            score = max(jaccard(shingles, member) for member, _ in members)
+            if score > best_score:
+                best_id, best_score = cluster_id, score
+        return best_id if best_score >= self.threshold else None
+
+    def _index(
+        self,
+        cluster_id: int,
+        signature: np.ndarray,
+        shingles: Set[str],
+        features: Tuple[int, FrozenSet[str]],
+    ):
+        cluster = self._clusters[cluster_id]
+        if len(cluster.members) >= MAX_MEMBERS:
+            return
+        cluster.members.append((shingles, features))
+        for band, bucket in zip(self._band_keys(signature), self._buckets):
+            members = bucket.setdefault(band, [])
+            if cluster_id not in members:
+                members.append(cluster_id)
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[i * BAND_ROWS : (i + 1) * BAND_ROWS].tobytes() for i in range(NUM_BANDS)
+        ]
@@ -0,0 +1,178 @@
+"""
+Budget de tokens par opération Gemini
+Compte les tokens des prompts (estimation locale, éventuellement recalée par
+count_tokens), réduit les sections d'historique qui dépassent le budget
+d'entrée et fixe le nombre maximal de tokens générés
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from rate_limiter import estimate_tokens
+
+# Tokens d'entrée (texte du prompt, images non comprises) des opérations dont
+# le prompt contient des sections de longueur variable (historique, démarche, exemples)
+INPUT_TOKEN_BUDGETS: Dict[str, int] = {
+    "step_analysis": 600,
+    "detailed_analysis": 900,
+    "single_pass": 800,
+    "exercise_from_examples": 700,
+}
+
+# Tokens générés au maximum par opération (les modèles à raisonnement y
+# comptent aussi leurs tokens de réflexion: valeurs volontairement larges)
+MAX_OUTPUT_TOKENS: Dict[str, int] = {
+    "step_analysis": 2048,
+    "detailed_analysis": 2048,
+    "single_pass": 3072,
+    "exercise": 2048,
+    "examples_analysis": 4096,
+    "tutor": 1024,
+    "tutor_summary": 512,
+    "answer_feedback": 256,
+}
+
+# Niveaux de réduction successifs: (éléments gardés par liste, caractères par élément)
+# Le premier niveau ne change rien, le dernier retire les sections réductibles
+SHRINK_LEVELS = ((None, None), (5, 200), (3, 120), (2, 80), (0, 0))
+
+
+def shrink_list(
+    items: List[Any], max_items: Optional[int], max_chars: Optional[int]
+) -> List[str]:
+    """
+    Garde les max_items premiers éléments, tronqués à max_chars caractères,
+    et résume les autres par « (+N autres) »
+    """
+    if max_items is None:
+        return [str(item) for item in items]
+    kept = [
+        item if max_chars is None or len(item) <= max_chars else item[: max_chars - 1] + "…"
+        for item in map(str, items[:max_items])
+    ]
+    if len(items) > max_items:
+        kept.append(f"(+{len(items) - max_items} autres)")
+    return kept
+
+
+class TokenBudget:
+    """Comptage des tokens, budgets d'entrée et limites de sortie par opération"""
+
+    def __init__(
+        self,
+        input_budgets: Optional[Dict[str, int]] = None,
+        max_output_tokens: Optional[Dict[str, int]] = None,
+        count_fn: Optional[Callable[[Any], int]] = None,
+        validate_every: int = 0,
+    ):
+        """
+        Initialise le budget
+
+        Args:
+            input_budgets: Budget d'entrée par opération (défaut: INPUT_TOKEN_BUDGETS)
+            max_output_tokens: Limite de sortie par opération (défaut: MAX_OUTPUT_TOKENS)
+            count_fn: Comptage exact (ex: model.count_tokens), utilisé pour recaler
+                l'estimation locale
+            validate_every: Recaler l'estimation sur un comptage sur N (0: jamais,
+                count_tokens est un appel réseau)
+        """
+        self.input_budgets = dict(INPUT_TOKEN_BUDGETS if input_budgets is None else input_budgets)
+        self.max_output_tokens = dict(
+            MAX_OUTPUT_TOKENS if max_output_tokens is None else max_output_tokens
+        )
+        self.count_fn = count_fn
+        self.validate_every = validate_every
+
+        self._lock = threading.Lock()
+        # Rapport tokens réels / estimés, moyenné sur les validations
+        self._ratio = 1.0
+        self._counts = 0
+        self._validations = 0
+        self._levels: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._over_budget: Dict[str, int] = defaultdict(int)
+
+    def count(self, contents: Any) -> int:
+        """Tokens d'un contenu: estimation locale corrigée par les validations"""
+        estimate = estimate_tokens(contents)
+        with self._lock:
+            self._counts += 1
+            validate = (
+                self.count_fn is not None
+                and self.validate_every > 0
+                and self._counts % self.validate_every == 1 % self.validate_every
+            )
+            ratio = self._ratio
+        if validate:
+            try:
+                actual = self.count_fn(contents)
+            except Exception:
+                # Validation au mieux: l'estimation locale reste utilisable
+                actual = None
+            if actual:
+                with self._lock:
+                    self._validations += 1
+                    # Moyenne glissante pour absorber les écarts d'un prompt à l'autre
+                    self._ratio += (actual / estimate - self._ratio) / min(self._validations, 10)
+                    ratio = self._ratio
+        return int(estimate * ratio)
+
+    def output_limit(self, operation: str) -> Optional[int]:
+        """Nombre maximal de tokens générés pour une opération (None: pas de limite)"""
+        return self.max_output_tokens.get(operation)
+
+    def fit(
+        self,
+        operation: str,
+        render: Callable[[Optional[int], Optional[int]], str],
+    ) -> str:
+        """
+        Rend le prompt au plus faible niveau de réduction qui tient dans le budget
+
+        Args:
+            operation: Opération (clé de input_budgets)
+            render: Construit le prompt à partir de (éléments gardés par liste,
+                caractères par élément), None signifiant sans réduction
+
+        Returns:
+            Le prompt, réduit si nécessaire (tel quel si l'opération n'a pas de budget)
+        """
+        budget = self.input_budgets.get(operation)
+        if budget is None:
+            return render(None, None)
+
+        for level, (max_items, max_chars) in enumerate(SHRINK_LEVELS):
+            prompt = render(max_items, max_chars)
+            if self.count(prompt) <= budget:
+                self._record_level(operation, level)
+                return prompt
+
+        # Même sans les sections réductibles le prompt dépasse: on l'envoie quand même
+        with self._lock:
+            self._over_budget[operation] += 1
+        self._record_level(operation, len(SHRINK_LEVELS) - 1)
+        return prompt
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Comptages, recalage de l'estimation et réductions appliquées par opération"""
+        with self._lock:
+            return {
+                "counts": self._counts,
+                "validations": self._validations,
+                "estimate_ratio": round(self._ratio, 3),
+                "operations": {
+                    operation: {
+                        "prompts": sum(levels.values()),
+                        "truncated": sum(n for level, n in levels.items() if level > 0),
+                        "sections_dropped": levels.get(len(SHRINK_LEVELS) - 1, 0),
+                        "over_budget": self._over_budget.get(operation, 0),
+                        "budget": self.input_budgets.get(operation),
+                        "max_output_tokens": self.max_output_tokens.get(operation),
+                    }
+                    for operation, levels in self._levels.items()
+                },
+            }
+
+    def _record_level(self, operation: str, level: int):
+        with self._lock:
+            self._levels[operation][level] += 1
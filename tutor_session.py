@@ -0,0 +1,201 @@
+"""
+Conversation avec le tuteur IA
+Session de chat qui garde les tours structurés (rôle, texte) et replie les
+anciens tours dans un résumé glissant dès que l'historique dépasse un seuil
+de tokens: l'entrée de chaque tour reste bornée sans perdre le contexte ancien
+"""
+
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+from gemini_client import GeminiClient
+from prompt_templates import (
+    TUTOR_SUMMARY_PROMPT,
+    TUTOR_SUMMARY_SECTION,
+    TUTOR_SYSTEM_INSTRUCTION,
+)
+from rate_limiter import estimate_tokens
+
+ROLE_USER = "user"
+ROLE_MODEL = "model"
+
+
+class TutorSession:
+    """Session de chat du tuteur: tours récents + résumé glissant des tours anciens"""
+
+    def __init__(
+        self,
+        client: GeminiClient,
+        history: Optional[List[Dict[str, str]]] = None,
+        system_instruction: str = TUTOR_SYSTEM_INSTRUCTION,
+        summary_threshold: int = 800,
+        keep_recent: int = 4,
+        background: bool = True,
+    ):
+        """
+        Initialise la session
+
+        Args:
+            client: Client Gemini (streaming, failover, quotas et télémétrie partagés)
+            history: Messages déjà échangés, {"role": "user"|"model", "text": ...}
+            system_instruction: Consignes du tuteur, en tête de chaque requête
+            summary_threshold: Tokens d'historique (hors résumé) au-delà desquels
+                les anciens tours sont résumés
+            keep_recent: Nombre de messages récents toujours envoyés tels quels
+                (pair: les messages gardés commencent par une question de l'élève)
+            background: Résumer dans un thread, sans retarder la réponse suivante
+        """
+        self.client = client
+        self.system_instruction = system_instruction
+        self.summary_threshold = summary_threshold
+        self.keep_recent = keep_recent
+        self.background = background
+
+        self.summary = ""
+        # Messages pas encore repliés dans le résumé, du plus ancien au plus récent
+        self._turns: List[Dict[str, str]] = [
+            {"role": message["role"], "text": message["text"]} for message in history or []
+        ]
+        self._lock = threading.Lock()
+        self._summarizer: Optional[threading.Thread] = None
+        # Tokens d'entrée estimés de chaque tour envoyé
+        self.input_tokens: List[int] = []
+        self._stats = {
+            "turns": 0,
+            "summaries": 0,
+            "summary_failures": 0,
+            "dropped_messages": 0,
+        }
+
+    def send_stream(self, text: str) -> Iterator[str]:
+        """
+        Envoie un message de l'élève et relaie la réponse en streaming
+
+        Le tour est ajouté à l'historique une fois la réponse reçue (même partielle);
+        une réponse vide n'est pas conservée.
+
+        Yields:
+            Les fragments de la réponse du tuteur
+        """
+        contents = self.build_contents(text)
+        with self._lock:
+            self.input_tokens.append(estimate_tokens(contents))
+
+        reply = ""
+        try:
+            for chunk in self.client.generate_text_stream(contents, operation="tutor"):
+                reply += chunk
+                yield chunk
+        finally:
+            if reply:
+                self._append(text, reply)
+
+    def send(self, text: str) -> str:
+        """Envoie un message et retourne la réponse complète"""
+        return "".join(self.send_stream(text))
+
+    def build_contents(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Requête multi-tours: consignes et résumé en tête (préfixe stable entre deux
+        résumés), puis les messages récents et le nouveau message de l'élève
+        """
+        with self._lock:
+            turns = list(self._turns)
+            summary = self.summary
+
+        preamble = self.system_instruction
+        if summary:
+            preamble += TUTOR_SUMMARY_SECTION.render(summary=summary)
+
+        contents = [{"role": turn["role"], "parts": [turn["text"]]} for turn in turns]
+        contents.append({"role": ROLE_USER, "parts": [text]})
+        if contents[0]["role"] == ROLE_USER:
+            contents[0]["parts"].insert(0, preamble)
+        else:
+            # La conversation commence par le message d'accueil du tuteur
+            contents.insert(0, {"role": ROLE_USER, "parts": [preamble]})
+        return contents
+
+    def wait_for_summary(self, timeout: Optional[float] = None):
+        """Attend la fin du résumé en cours, s'il y en a un"""
+        summarizer = self._summarizer
+        if summarizer is not None:
+            summarizer.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Tours, résumés et tokens d'entrée par tour (moyenne, maximum, dernier)"""
+        with self._lock:
+            stats = dict(self._stats)
+            inputs = list(self.input_tokens)
+            stats["pending_messages"] = len(self._turns)
+            stats["summary_tokens"] = estimate_tokens(self.summary) if self.summary else 0
+        stats["mean_input_tokens"] = round(sum(inputs) / len(inputs), 1) if inputs else 0.0
+        stats["max_input_tokens"] = max(inputs) if inputs else 0
+        stats["last_input_tokens"] = inputs[-1] if inputs else 0
+        return stats
+
+    def _append(self, text: str, reply: str):
+        with self._lock:
+            self._turns.append({"role": ROLE_USER, "text": text})
+            self._turns.append({"role": ROLE_MODEL, "text": reply})
+            self._stats["turns"] += 1
+        self._maybe_summarize()
+
+    def _history_tokens(self) -> int:
+        """Tokens des messages non résumés (appelé sous verrou)"""
+        return sum(estimate_tokens(turn["text"]) for turn in self._turns)
+
+    def _maybe_summarize(self):
+        """Lance le résumé des anciens messages si l'historique dépasse le seuil"""
+        with self._lock:
+            if self._summarizer is not None and self._summarizer.is_alive():
+                return
+            if (
+                len(self._turns) <= self.keep_recent
+                or self._history_tokens() <= self.summary_threshold
+            ):
+                return
+            old = self._turns[: len(self._turns) - self.keep_recent]
+            previous = self.summary
+
+        if not self.background:
+            self._summarize(old, previous)
+            return
+        self._summarizer = threading.Thread(
+            target=self._summarize, args=(old, previous), name="tutor-summary", daemon=True
+        )
+        self._summarizer.start()
+
+    def _summarize(self, old: List[Dict[str, str]], previous: str):
+        """Replie les messages old dans le résumé (les messages récents sont gardés)"""
+        transcript = "\n".join(
+            f"{'Élève' if turn['role'] == ROLE_USER else 'Professeur'}: {turn['text']}"
+            for turn in old
+        )
+        prompt = TUTOR_SUMMARY_PROMPT.render(
+            summary=previous or "(aucun)", transcript=transcript
+        )
+        try:
+            with self.client.telemetry.track("tutor_summary"):
+                summary = self.client._generate_text(
+                    "tutor_summary",
+                    prompt,
+                    use_cache=False,
+                    generation_config=self.client._generation_config("tutor_summary"),
+                ).strip()
+        except Exception:
+            summary = ""
+
+        with self._lock:
+            # Les nouveaux messages sont ajoutés en fin de liste: old en est toujours le début
+            if summary:
+                self.summary = summary
+                del self._turns[: len(old)]
+                self._stats["summaries"] += 1
+                return
+
+            self._stats["summary_failures"] += 1
+            # Sans résumé, l'entrée reste bornée: on oublie les plus anciens messages
+            if self._history_tokens() > 2 * self.summary_threshold:
+                del self._turns[: len(old)]
+                self._stats["dropped_messages"] += len(old)